@@ -2,48 +2,188 @@ import sys
 import os
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from fastapi.responses import StreamingResponse, ORJSONResponse
 import json
+import asyncio
+from concurrent.futures import TimeoutError as FutureTimeout
 from loguru import logger
 
 # Ensure we can import modules from current directory
 sys.path.append(os.getcwd())
 
-# Global engine variables
-engine = None
-rag = None
+from src.boot import StagedBoot
+from src.scheduler import SchedulerFull, RequestExpired
+from src.web_search import get_web_search
+from src.pipeline import (
+    ConversationPipeline,
+    Source,
+    Turn,
+    KNOWLEDGE_HEADER,
+    RAG_DEADLINE_SECONDS,
+    turn_sources,
+    web_memory_source,
+    web_source,
+)
 
+# Attesa massima di un componente ancora in caricamento (secondi)
+BOOT_WAIT_TIMEOUT = 300
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global engine, rag
-    logger.info("Booting Neural Core...")
+# Ogni quanto controllare se il client in coda si è disconnesso (secondi)
+DISCONNECT_POLL_SECONDS = 1.0
+
+# Scadenza di una richiesta /chat, coda e generazione comprese (secondi)
+REQUEST_DEADLINE_SECONDS = 300
+
+# Attesa massima dell'embedding della query per il router (secondi):
+# oltre, il turno si instrada con il classifier a keyword
+ROUTE_EMBED_TIMEOUT = 1.0
+
+# Componenti caricati in background (vedi lifespan)
+boot = None
+# Event loop del server (le fasi della pipeline girano in thread)
+main_loop = None
+
+_DONE = object()
+
+
+def _load_rag():
+    from rag_engine import AsyncRagEngine, RagEngine
+
+    # RAG (+ interfaccia async con embedder micro-batch)
+    return AsyncRagEngine(RagEngine())
+
+
+def _load_engine():
+    from engine_cpp import CoddyEngine2
+
+    # Solo profilo hardware + contesto progetto: i GGUF si caricano a parte
+    return CoddyEngine2()
+
+
+def _attach_router(engine, arag):
+    # Il router semantico (se abilitato nel profilo) riusa il MiniLM del RAG
+    if not arag.rag.model:
+        raise RuntimeError("embedder non disponibile")
+    return engine.use_embedder(arag.rag.model)
+
+
+def _attach_web_memory(arag):
+    # Risultati web recenti in una collezione a parte del vector store del RAG;
+    # query di recall e risultati da memorizzare passano dall'embedder
+    # micro-batch (come la ricerca)
+    web = get_web_search()
+    attached = web.attach(
+        arag.rag,
+        embed=lambda query: _on_loop(arag.embed(query)),
+        encode=arag.encode_texts,
+    )
+    if not attached:
+        raise RuntimeError("embedder o vector store non disponibili")
+    return True
+
+
+def _on_loop(coroutine, timeout=None):
+    """
+    Esegue una coroutine sull'event loop del server da un thread della pipeline.
+    Oltre `timeout` secondi la annulla e solleva TimeoutError.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, main_loop)
     try:
-        from engine_cpp import CoddyEngine2
-        from rag_engine import RagEngine
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise
+
+
+def _rag_search(query):
+    # Durante il boot la knowledge base può non essere ancora pronta:
+    # si risponde senza contesto. La ricerca passa dall'interfaccia async
+    # (query concorrenti embeddate insieme).
+    arag = boot.get("rag")
+    if not arag:
+        logger.info("RAG ancora in caricamento: risposta senza knowledge base.")
+        return []
+    return _on_loop(arag.search(query))
+
+
+def _embed(query):
+    # Finché il router non è pronto la pipeline usa il classifier a keyword
+    # (anche se l'embedding non arriva entro ROUTE_EMBED_TIMEOUT)
+    arag = boot.get("rag")
+    if not (arag and boot.ready("router")):
+        return None
+    return _on_loop(arag.embed(query), timeout=ROUTE_EMBED_TIMEOUT)
+
+
+def _load_pipeline(engine):
+    web = get_web_search()
+
+    return ConversationPipeline(
+        engine,
+        sources=[
+            Source(
+                "rag",
+                KNOWLEDGE_HEADER,
+                _rag_search,
+                text=lambda r: r["text"],
+                deadline=RAG_DEADLINE_SECONDS,
+            ),
+            web_source(web.search_text),
+            web_memory_source(web.recall_text),
+        ],
+        embed=_embed,
+    )
 
-        # Init RAG
-        rag = RagEngine()
 
-        # Init Engine
-        engine = CoddyEngine2()
-        engine.start()
-        logger.success("Systems Online.")
-    except Exception as e:
-        logger.error(f"Error starting engines: {e}")
+def _load_model(kind):
+    def load(engine):
+        if engine.residency.policy == "resident":
+            getattr(engine, f"load_{kind}")()
+        else:
+            # On-demand: solo verifica del GGUF, residency.use lo carica al primo uso
+            engine._check_model(
+                engine.path_coder if kind == "coder" else engine.path_light
+            )
+        return engine
+
+    return load
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global boot, main_loop
+    main_loop = asyncio.get_running_loop()
+    logger.info("Booting Neural Core (staged)...")
+    # RAG, LIGHT e CODER si caricano in parallelo (i GGUF solo con la
+    # policy "resident", altrimenti al primo uso): il server accetta
+    # traffico subito e ogni richiesta aspetta solo ciò che le serve.
+    boot = StagedBoot()
+    boot.add("rag", _load_rag)
+    boot.add("engine", _load_engine)
+    boot.add("light", _load_model("light"), after=["engine"])
+    boot.add("coder", _load_model("coder"), after=["engine"])
+    boot.add("router", _attach_router, after=["engine", "rag"])
+    boot.add("pipeline", _load_pipeline, after=["engine"])
+    boot.add("web_memory", _attach_web_memory, after=["rag"])
+    boot.start()
 
     yield
 
     # Shutdown logic
-    if engine:
-        engine.close()
-    if rag:
+    ready = boot.values()
+    if "pipeline" in ready:
+        ready["pipeline"].close()
+    if "engine" in ready:
+        ready["engine"].close()
+    if "rag" in ready:
+        arag = ready["rag"]
+        arag.close()
         try:
-            rag.close()
+            arag.rag.close()
         except:
             pass
     print("Systems Shutdown.")
@@ -75,63 +215,174 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message]
     use_web: bool = False
+    session_id: Optional[str] = None
+    speculative: bool = False
 
 
-def stream_generator(messages, use_web):
-    """
-    Generator function for streaming response
-    """
-    # Convert Pydantic models to dicts
-    history = [msg.dict() for msg in messages]
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = 3
 
-    user_query = history[-1]["content"]
 
-    # 1. RAG Search
-    rag_results = rag.search(user_query)
-    context_parts = []
+async def _require(name):
+    """Attende un componente del boot; 503 se fallito o troppo lento."""
+    if boot is None:
+        raise HTTPException(status_code=503, detail="Server not started")
+    try:
+        return await boot.wait(name, timeout=BOOT_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail=f"{name} still loading")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"{name} unavailable: {e}")
 
-    if rag_results:
-        context_parts.append("=== KNOWLEDGE BASE ===")
-        for r in rag_results:
-            context_parts.append(f"{r['text']}")
 
-    # 2. Web Search (Optional - strictly if requested)
-    if use_web:
-        try:
-            from coddy import web_search
+def _session_of(request: ChatRequest, http_request: Request):
+    """Sessione per l'equità dello scheduler: campo esplicito, header o IP."""
+    if request.session_id:
+        return request.session_id
+    header = http_request.headers.get("x-session-id")
+    if header:
+        return header
+    return http_request.client.host if http_request.client else "anonymous"
 
-            web_results = web_search(user_query)
-            if web_results:
-                context_parts.append("=== WEB RESULTS ===")
-                context_parts.extend(web_results)
-        except Exception as e:
-            logger.warning(f"Web search error: {e}")
 
-    # Build full input
-    full_input = user_query
-    if context_parts:
-        full_input += "\n\n" + "\n".join(context_parts)
+async def _await_ticket(ticket, http_request: Request):
+    """
+    Attende in modo asincrono che lo scheduler assegni una replica.
+    Se il client si disconnette mentre è in coda la richiesta esce dalla coda.
+    """
+    waiter = asyncio.wrap_future(ticket.future)
+    try:
+        while True:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(waiter), timeout=DISCONNECT_POLL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if ticket.expired:
+                    raise RequestExpired("Scadenza superata in coda")
+                if await http_request.is_disconnected():
+                    # 499 (convenzione nginx): nessuno leggerà la risposta
+                    raise HTTPException(status_code=499, detail="Client disconnected")
+    except RequestExpired as e:
+        ticket.cancel()
+        ticket.release()
+        raise HTTPException(status_code=504, detail=str(e))
+    except BaseException:
+        ticket.cancel()
+        ticket.release()
+        raise
+
+
+async def _stream_with_ticket(gen, ticket):
+    """
+    Adatta il generatore sincrono del motore a StreamingResponse: ogni
+    token si calcola in un thread. Se il client si disconnette Starlette
+    annulla lo stream: il ticket viene annullato (la generazione si ferma
+    al token successivo) e la replica torna allo scheduler.
+    """
+    loop = asyncio.get_running_loop()
+    pending = None
+    finished = False
 
-    generation_history = history[:-1] + [{"role": "user", "content": full_input}]
+    def close(_=None):
+        gen.close()
+        ticket.release()
 
-    # Stream
-    for chunk in engine.stream_chat(generation_history, model_type="auto"):
-        yield chunk
+    try:
+        while True:
+            pending = loop.run_in_executor(None, next, gen, _DONE)
+            # shield: l'annullamento non deve staccarci dal thread ancora attivo
+            try:
+                chunk = await asyncio.shield(pending)
+            except RequestExpired as e:
+                # Risposta troncata: lo si dice al client in coda al testo
+                finished = True
+                yield f"\n\n[{e}]"
+                break
+            if chunk is _DONE:
+                finished = True
+                break
+            yield chunk
+    finally:
+        if not finished:
+            ticket.cancel()
+        if pending is not None and not pending.done():
+            # Il generatore è in esecuzione: si chiude appena torna
+            pending.add_done_callback(close)
+        else:
+            close()
+
+
+def _turn_of(request: ChatRequest, http_request: Request):
+    """Turno della pipeline dai messaggi del client (system opzionale in testa)."""
+    history = [msg.dict() for msg in request.messages]
+    system = None
+    if history and history[0]["role"] == "system":
+        system = history.pop(0)["content"]
+    return Turn(
+        history[-1]["content"],
+        history=history[:-1],
+        system=system,
+        sources=turn_sources(request.use_web),
+        session_id=_session_of(request, http_request),
+        speculative=request.speculative,
+    )
 
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    if not engine:
-        raise HTTPException(status_code=503, detail="Engine not ready")
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    pipeline = await _require("pipeline")
+    turn = _turn_of(request, http_request)
+
+    # Routing, retrieval (RAG e web in parallelo) e prompt entro n_ctx:
+    # la stessa pipeline di coddy.py e app.py, in un thread
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, pipeline.prepare, turn)
+    except Exception:
+        # Il prompt si misura col tokenizer del modello scelto: se il GGUF
+        # manca o non si apre è il modello a non essere disponibile (503)
+        if turn.target:
+            await _require(turn.target)
+        raise
+
+    # Serve solo il modello scelto dal router: una chiacchierata parte
+    # appena il LIGHT è pronto, anche se il CODER sta ancora caricando.
+    await _require(turn.target)
+
+    # Coda del modello: equa tra sessioni, limitata (429 se piena)
+    try:
+        ticket = pipeline.engine.scheduler.submit(
+            turn.session_id, turn.target, REQUEST_DEADLINE_SECONDS
+        )
+    except SchedulerFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    await _await_ticket(ticket, http_request)
 
     return StreamingResponse(
-        stream_generator(request.messages, request.use_web), media_type="text/plain"
+        _stream_with_ticket(pipeline.stream(turn, ticket), ticket),
+        media_type="text/plain",
     )
 
 
+@app.post("/search")
+async def search_endpoint(request: SearchRequest):
+    """Solo retrieval: disponibile appena il RAG è pronto, senza modelli GGUF."""
+    arag = await _require("rag")
+    return {"results": await arag.search(request.query, top_k=request.top_k)}
+
+
 @app.get("/health")
 def health_check():
-    return {"status": "online", "engine": "CoddyEngine2"}
+    engine = boot.get("engine") if boot else None
+    return {
+        "status": "online",
+        "engine": "CoddyEngine2",
+        "ready": bool(boot and boot.all_ready),
+        "components": boot.status() if boot else {},
+        "scheduler": engine.scheduler.stats() if engine else {},
+    }
 
 
 if __name__ == "__main__":
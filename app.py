@@ -2,6 +2,9 @@ import sys
 import os
 import streamlit as st
 
+from src.pipeline import Turn, turn_sources
+from src.scheduler import RequestExpired
+
 # Patch per Windows Error 6 su shutdown (Streamlit/Colorama issue)
 if sys.platform == "win32":
     import colorama
@@ -106,10 +109,17 @@ def load_engine():
         # Init Engine
         engine = CoddyEngine2()
         engine.start()
+        if rag.model:
+            engine.use_embedder(rag.model)  # Router semantico, se abilitato nel profilo
+
+        # Stessa pipeline (route -> RAG + web in parallelo -> prompt) della CLI
+        from coddy import make_pipeline
+
+        pipeline = make_pipeline(engine, rag)
     finally:
         sys.stdout = original_stdout
 
-    return engine, rag
+    return engine, rag, pipeline
 
 
 # Layout Sidebar - Monitoraggio
@@ -152,7 +162,7 @@ st.title("Coddy Assistant")
 st.caption("Advanced Local Intelligence")
 
 # Caricamento Motori
-engine, rag = load_engine()
+engine, rag, pipeline = load_engine()
 
 # Inizializza Chat History
 if "messages" not in st.session_state:
@@ -173,16 +183,17 @@ if prompt := st.chat_input("Digita una richiesta..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # 2. Logica RAG + Web
-    context_parts = []
+    # 2. Routing + RAG e Web in parallelo + prompt entro n_ctx
+    # (la history in sessione ha solo le domande, senza contesto)
+    turn = Turn(
+        prompt,
+        history=st.session_state.messages[:-1],
+        sources=turn_sources(enable_online),
+    )
+    pipeline.prepare(turn)
 
-    # RAG Search
-    rag_results = rag.search(prompt)
+    rag_results = turn.results.get("rag", [])
     if rag_results:
-        context_parts.append("=== KNOWLEDGE BASE ===")
-        for r in rag_results:
-            context_parts.append(f"{r['text']}")
-
         with st.status(
             f"Analisi Memoria ({len(rag_results)} found)", expanded=False
         ) as status:
@@ -190,31 +201,17 @@ if prompt := st.chat_input("Digita una richiesta..."):
                 st.caption(f"📄 {r['source']}")
                 st.code(r["text"][:200])
 
-    # Web Search
-    if enable_online:
-        from coddy import web_search
-
+    web_results = turn.results.get("web", [])
+    if web_results:
         with st.status("Analisi Web...", expanded=False):
-            web_results = web_search(prompt)
-            if web_results:
-                context_parts.append("=== WEB RESULTS ===")
-                context_parts.extend(web_results)
-                st.write(web_results)
-
-    # Costruzione Prompt
-    full_input = prompt
-    if context_parts:
-        full_input += "\n\n" + "\n".join(context_parts)
+            st.write(web_results)
 
     # 3. Generazione (Streaming)
     with st.chat_message("assistant"):
         full_response = ""
 
-        # Routing Dinamico
-        model_type = engine.route_query(full_input)
-
         # Indicatore Modello (Minimale)
-        if model_type == "coder":
+        if turn.target == "coder":
             st.caption("_Thinking with Coder Core_")
         else:
             st.caption("_Quick Reply via Light Core_")
@@ -225,11 +222,7 @@ if prompt := st.chat_input("Digita una richiesta..."):
         full_response = ""
 
         try:
-            stream = engine.stream_chat(
-                st.session_state.messages[:-1]
-                + [{"role": "user", "content": full_input}],
-                model_type=model_type,
-            )
+            stream = pipeline.stream(turn)
 
             for chunk in stream:
                 full_response += chunk
@@ -237,6 +230,10 @@ if prompt := st.chat_input("Digita una richiesta..."):
 
             placeholder.markdown(full_response)
 
+        except RequestExpired as e:
+            placeholder.markdown(full_response)
+            st.warning(str(e))
+
         except Exception:
             # Caso interruzione utente o errore
             pass
@@ -0,0 +1,123 @@
+"""
+Benchmark chunker: split su riga vuota (storico) vs chunker Markdown.
+
+Per ciascun chunker indicizza `knowledge/` in un Qdrant in memoria e
+riporta dimensione dell'indice, costo di embedding, latenza di ricerca
+e token di contesto che finiscono nel prompt per query (top-k).
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_chunker.py --top-k 3
+"""
+
+import os
+import sys
+import glob
+import time
+import uuid
+import argparse
+import statistics
+
+sys.path.append(os.getcwd())
+
+from src.chunker import MarkdownChunker, ParagraphChunker, count_tokens
+from src.ingestion import embedding_text
+
+QUERIES = [
+    "come faccio un rebase con git",
+    "git stash pop",
+    "differenza tra thread e processi in python",
+    "come creare un container docker",
+    "@Transactional in spring boot",
+    "react useEffect cleanup",
+    "join sql tra due tabelle",
+    "comandi linux per vedere i processi",
+    "cos'è il pattern singleton",
+    "come proteggersi da sql injection",
+]
+
+
+def build_index(client, models, model, name, chunker, knowledge_dir):
+    chunks = []
+    for path in sorted(
+        glob.glob(os.path.join(knowledge_dir, "**/*.md"), recursive=True)
+    ):
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend(chunker.chunk(f.read()))
+
+    t0 = time.perf_counter()
+    vectors = model.encode(
+        [embedding_text(c) for c in chunks], batch_size=64, convert_to_numpy=True
+    )
+    encode_time = time.perf_counter() - t0
+
+    client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(
+            size=vectors.shape[1], distance=models.Distance.COSINE
+        ),
+    )
+    client.upsert(
+        collection_name=name,
+        points=[
+            models.PointStruct(
+                id=str(uuid.uuid4()), vector=v.tolist(), payload={"text": c["text"]}
+            )
+            for c, v in zip(chunks, vectors)
+        ],
+    )
+    return chunks, vectors, encode_time
+
+
+def run_queries(client, model, name, top_k, repeats=5):
+    latencies, prompt_tokens = [], []
+    for _ in range(repeats):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            hits = client.query_points(
+                collection_name=name, query=model.encode(q).tolist(), limit=top_k
+            ).points
+            latencies.append((time.perf_counter() - t0) * 1000)
+            prompt_tokens.append(sum(count_tokens(h.payload["text"]) for h in hits))
+    return latencies, prompt_tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--knowledge-dir", default="knowledge")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+
+    model = SentenceTransformer(args.model)
+    client = QdrantClient(":memory:")
+    model.encode("warm-up")
+
+    print(f"📊 Chunker benchmark su '{args.knowledge_dir}' (top-k={args.top_k})")
+    for label, chunker in (
+        ("paragraph", ParagraphChunker()),
+        ("markdown", MarkdownChunker()),
+    ):
+        chunks, vectors, encode_time = build_index(
+            client, models, model, f"bench_{label}", chunker, args.knowledge_dir
+        )
+        latencies, prompt_tokens = run_queries(
+            client, model, f"bench_{label}", args.top_k
+        )
+        sizes = [count_tokens(c["text"]) for c in chunks]
+        print(f"\n  [{label}]")
+        print(f"    vettori         : {len(chunks)} ({vectors.nbytes / 1024:.1f} KiB)")
+        print(
+            f"    token/frammento : media {statistics.mean(sizes):.0f}, max {max(sizes)}"
+        )
+        print(f"    embedding       : {encode_time:.2f}s")
+        print(
+            f"    latenza ricerca : p50 {statistics.median(latencies):.2f} ms, "
+            f"max {max(latencies):.2f} ms"
+        )
+        print(
+            f"    token nel prompt: media {statistics.mean(prompt_tokens):.0f} per query"
+        )
@@ -0,0 +1,105 @@
+"""
+Benchmark lettura + chunking: seriale vs pool di processi.
+
+Genera un corpus sintetico di migliaia di file Markdown in una cartella
+temporanea ed esegue lo stadio `prepare_changed` della pipeline di
+ingestion con 1 worker e con i worker suggeriti da HardwareProfiler.
+Lo speedup è significativo solo con almeno tanti core quanti worker:
+su una macchina con meno core la misura è solo l'overhead del pool.
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_chunking.py --files 5000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from src.chunker import MarkdownChunker
+from src.ingestion import discover_files, prepare_changed
+
+WORDS = (
+    "python docker kubernetes rebase commit branch query index cache thread "
+    "process vector embedding latency throughput spring rails react hook "
+    "component pipeline deploy container volume network socket"
+).split()
+
+
+def make_corpus(root, n_files, paragraphs, seed=42):
+    rng = random.Random(seed)
+    for i in range(n_files):
+        parts = [f"# Documento {i}"]
+        for p in range(paragraphs):
+            if p % 5 == 4:
+                parts.append("```python\n" + "x = 1\n" * rng.randint(3, 20) + "```")
+            else:
+                parts.append(
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))
+                )
+        subdir = os.path.join(root, f"d{i % 50}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"doc_{i}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(parts))
+
+
+def run(root, workers, threshold=0):
+    seen, touched = set(), set()
+    t0 = time.perf_counter()
+    n_docs = n_chunks = 0
+    for doc in prepare_changed(
+        discover_files(root),
+        root,
+        {},
+        seen,
+        touched,
+        MarkdownChunker(),
+        workers=workers,
+        parallel_threshold=threshold,
+    ):
+        n_docs += 1
+        n_chunks += len(doc["chunks"])
+    return time.perf_counter() - t0, n_docs, n_chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--paragraphs", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threshold", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.workers is None:
+        from src.profiler import HardwareProfiler
+
+        args.workers = HardwareProfiler().get_config()["ingest_workers"]
+
+    with tempfile.TemporaryDirectory() as root:
+        print(f"📝 Generazione corpus sintetico ({args.files} file)...")
+        make_corpus(root, args.files, args.paragraphs)
+
+        # Primo passaggio a vuoto: page cache calda per entrambe le misure
+        run(root, 1)
+
+        serial, n_docs, n_chunks = run(root, 1)
+        # Soglia 0 (default): pool anche per pochi file, misura il solo parallelo
+        parallel, _, _ = run(root, args.workers, args.threshold)
+
+    print(f"📊 Lettura + chunking: {n_docs} file, {n_chunks} frammenti")
+    print(f"  1 worker    : {n_docs / serial:8.1f} file/s ({serial:.2f}s)")
+    print(
+        f"  {args.workers} worker(s) : {n_docs / parallel:8.1f} file/s ({parallel:.2f}s)"
+    )
+    print(f"  speedup     : {serial / parallel:.2f}x")
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    cores = cores or os.cpu_count()
+    if args.workers > cores:
+        print(
+            f"⚠️ {cores} core disponibili per {args.workers} worker: "
+            "lo speedup multi-core non è misurato, solo l'overhead del pool"
+        )
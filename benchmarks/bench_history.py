@@ -0,0 +1,146 @@
+"""
+Benchmark history: contesto recuperato salvato nella history vs effimero.
+
+Simula una sessione di N turni (default 20). A ogni turno arrivano 3
+frammenti della knowledge base (con sovrapposizioni tra turni vicini,
+come succede con domande sullo stesso argomento):
+- "persistente": la domanda + KNOWLEDGE BASE finisce nella history
+  (comportamento precedente di coddy.py), quindi ogni turno rimanda i
+  documenti di tutti i turni prima;
+- "effimero": in history solo la domanda, il contesto (deduplicato)
+  accompagna solo il turno corrente.
+
+Per ogni turno si misurano i token del prompt (senza tagli e dopo il
+PromptBuilder sul n_ctx del profilo) e il time-to-first-token del modello
+LIGHT, con la cache KV per prefisso attiva come nel motore.
+
+Uso (dalla root del progetto, con i GGUF in models/):
+    python benchmarks/bench_history.py --turns 20
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.append(os.getcwd())
+
+from llama_cpp import Llama
+
+from src.profiler import HardwareProfiler
+from src.kv_cache import PrefixStateCache
+from src.prompt_builder import PromptBuilder, TokenCounter
+
+LIGHT = "Qwen2.5-0.5B-Instruct-Q4_K_M.gguf"
+SYSTEM = "Sei Coddy, un assistente AI esperto di programmazione."
+HEADER = "=== KNOWLEDGE BASE ==="
+
+
+def load_fragments(knowledge_dir, min_chars=200):
+    """Paragrafi della knowledge base, usati come risultati RAG simulati."""
+    fragments = []
+    for path in sorted(glob.glob(os.path.join(knowledge_dir, "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            fragments += [p.strip() for p in f.read().split("\n\n")]
+    return [p for p in fragments if len(p) >= min_chars]
+
+
+def session(fragments, turns):
+    """(domanda, 3 frammenti) per turno: due turni vicini ne condividono uno."""
+    for turn in range(turns):
+        picks = [fragments[(turn * 2 + i) % len(fragments)] for i in range(3)]
+        yield f"Domanda {turn + 1}: approfondisci questo argomento", picks
+
+
+def raw_tokens(counter, messages):
+    return sum(counter.message(m) for m in messages)
+
+
+def run(llm, builder, strategy, fragments, turns, max_tokens):
+    counter = builder.counter
+    history, rows = [], []
+    for question, picks in session(fragments, turns):
+        if strategy == "persistente":
+            full_input = question + "\n\n" + "\n".join([HEADER, *picks])
+            untrimmed = [{"role": "system", "content": SYSTEM}, *history]
+            untrimmed.append({"role": "user", "content": full_input})
+            messages, stats = builder.build(SYSTEM, history, full_input)
+            stored = full_input
+        else:
+            messages, stats = builder.build(
+                SYSTEM, history, question, [(HEADER, picks)]
+            )
+            untrimmed = [{"role": "system", "content": SYSTEM}, *history]
+            untrimmed.append(messages[-1])
+            stored = question
+
+        t0 = time.perf_counter()
+        ttft, answer = None, []
+        for chunk in llm.create_chat_completion(
+            messages=messages, max_tokens=max_tokens, temperature=0.0, stream=True
+        ):
+            delta = chunk["choices"][0]["delta"]
+            if "content" in delta:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                answer.append(delta["content"])
+        history += [
+            {"role": "user", "content": stored},
+            {"role": "assistant", "content": "".join(answer)},
+        ]
+        if ttft is None:
+            ttft = time.perf_counter() - t0
+        rows.append((raw_tokens(counter, untrimmed), stats["prompt_tokens"], ttft))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--knowledge-dir", default="knowledge")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    config = HardwareProfiler().get_config()
+    n_ctx = config["n_ctx"]
+    llm = Llama(
+        model_path=os.path.join(args.model_dir, LIGHT),
+        n_ctx=n_ctx,
+        n_threads=config["cpu_threads"],
+        n_batch=config["n_batch"],
+        use_mmap=True,
+        verbose=False,
+    )
+    counter = TokenCounter(
+        lambda text: llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+    )
+    fragments = load_fragments(args.knowledge_dir)
+
+    results = {}
+    for strategy in ("persistente", "effimero"):
+        # Cache KV nuova per strategia: nessun vantaggio dalla sessione precedente
+        llm.set_cache(PrefixStateCache(config["kv_cache_mb"] * 1024**2))
+        builder = PromptBuilder(counter, n_ctx, reserve_output=args.max_tokens * 2)
+        results[strategy] = run(
+            llm, builder, strategy, fragments, args.turns, args.max_tokens
+        )
+
+    print(f"📊 {args.turns} turni, n_ctx {n_ctx}, 3 frammenti per turno")
+    print(
+        "📊 turno | token grezzi pers./eff. | token inviati pers./eff. | TTFT pers./eff."
+    )
+    for turn, (p, e) in enumerate(zip(results["persistente"], results["effimero"])):
+        print(
+            f"   {turn + 1:>5} | {p[0]:>7} / {e[0]:<7} | {p[1]:>7} / {e[1]:<7} | "
+            f"{p[2] * 1000:>6.0f} / {e[2] * 1000:.0f} ms"
+        )
+    for strategy, rows in results.items():
+        raw = sum(r[0] for r in rows)
+        sent = sum(r[1] for r in rows)
+        ttft = sum(r[2] for r in rows) / len(rows)
+        print(
+            f"📊 {strategy:<12} token grezzi totali {raw}, inviati {sent}, "
+            f"TTFT medio {ttft * 1000:.0f} ms"
+        )
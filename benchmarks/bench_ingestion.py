@@ -0,0 +1,142 @@
+"""
+Benchmark ingestion RAG: IngestionPipeline con lotti da un frammento
+(un encode e un upsert per frammento, come il vecchio percorso) vs
+lotti vettorizzati, sul vector store vero (src/vector_store.py).
+
+Di default l'encoder è uno stub con un modello di costo semplice: ogni
+passata (`batch_size` frammenti) costa `--call-ms`, ogni frammento
+`--item-ms`. Con `--model` si usa un SentenceTransformer vero.
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_ingestion.py --chunks 2000 --batch-size 64
+    python benchmarks/bench_ingestion.py --model all-MiniLM-L6-v2
+"""
+
+import os
+import sys
+import glob
+import math
+import time
+import uuid
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from src.ingestion import IngestionPipeline
+from src.vector_store import open_store
+
+COLLECTION = "bench_ingestion"
+
+
+class StubEncoder:
+    """Encoder finto: vettori casuali normalizzati, latenza per passata e per frammento."""
+
+    def __init__(self, dim=384, call_ms=4.0, item_ms=0.5):
+        self.dim = dim
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self.rng = np.random.default_rng(0)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        passes = math.ceil(len(texts) / batch_size)
+        time.sleep((passes * self.call_ms + len(texts) * self.item_ms) / 1000)
+        vectors = self.rng.standard_normal((len(texts), self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_chunks(knowledge_dir, target):
+    """
+    Frammenti reali dalla knowledge base, replicati fino a `target`, nel
+    formato di chunk_documents: (id, testo da embeddare, payload).
+    """
+    texts = []
+    for path in sorted(
+        glob.glob(os.path.join(knowledge_dir, "**/*.md"), recursive=True)
+    ):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(c.strip() for c in f.read().split("\n\n") if c.strip())
+    if not texts:
+        raise SystemExit(f"Nessun documento in '{knowledge_dir}'.")
+    chunks = []
+    for i in range(target):
+        # Suffisso per rendere unici gli id (come file diversi)
+        text = f"{texts[i % len(texts)]}\n<!-- {i} -->"
+        doc_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, text))
+        chunks.append((doc_id, text, {"text": text, "source": "bench"}))
+    return chunks
+
+
+def run(model, backend, chunks, encode_batch_size, upsert_batch_size):
+    """Tempo di IngestionPipeline.run su una collezione nuova."""
+    with tempfile.TemporaryDirectory() as path:
+        store = open_store(backend, path)
+        store.ensure_collection(COLLECTION, model.get_sentence_embedding_dimension())
+
+        def upsert(batch, vectors):
+            # Come RagEngine._upsert_batch (senza indice BM25)
+            store.upsert(
+                COLLECTION,
+                [doc_id for doc_id, _, _ in batch],
+                vectors,
+                [payload for _, _, payload in batch],
+            )
+
+        pipeline = IngestionPipeline(
+            model,
+            upsert,
+            encode_batch_size=encode_batch_size,
+            upsert_batch_size=upsert_batch_size,
+        )
+        t0 = time.perf_counter()
+        indexed = pipeline.run(chunks)
+        store.flush(COLLECTION)
+        elapsed = time.perf_counter() - t0
+        store.close()
+    assert indexed == len(chunks)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--knowledge-dir", default="knowledge")
+    parser.add_argument("--model", default=None, help="SentenceTransformer vero")
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--upsert-size", type=int, default=256)
+    parser.add_argument("--call-ms", type=float, default=4.0)
+    parser.add_argument("--item-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(args.model)
+        name = args.model
+    else:
+        model = StubEncoder(call_ms=args.call_ms, item_ms=args.item_ms)
+        name = f"stub ({args.call_ms} ms/passata, {args.item_ms} ms/frammento)"
+    chunks = load_chunks(args.knowledge_dir, args.chunks)
+
+    # Warm-up (caricamento pesi / allocazioni)
+    model.encode([text for _, text, _ in chunks[:8]])
+
+    print(
+        f"📊 Ingestion benchmark: {len(chunks)} frammenti, encoder {name}, "
+        f"store {args.backend}"
+    )
+    per_chunk = run(model, args.backend, chunks, 1, 1)
+    batched = run(model, args.backend, chunks, args.batch_size, args.upsert_size)
+
+    print(f"  per-chunk : {len(chunks) / per_chunk:8.1f} chunks/s ({per_chunk:.2f}s)")
+    print(
+        f"  batched   : {len(chunks) / batched:8.1f} chunks/s ({batched:.2f}s)"
+        f"  [batch={args.batch_size}, upsert={args.upsert_size}]"
+    )
+    print(f"  speedup   : {per_chunk / batched:.2f}x")
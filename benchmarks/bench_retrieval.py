@@ -0,0 +1,120 @@
+"""
+Benchmark retrieval: RAG poi web in sequenza (senza timeout) vs sorgenti in
+parallelo con scadenza (src/pipeline.py).
+
+Usa sorgenti stub locali, niente rete né modelli: il RAG risponde in pochi
+millisecondi, il "web" ha latenze variabili con una coda lunga (ogni tanto
+una richiesta resta appesa per secondi, come DuckDuckGo sotto rate limit).
+Si misura il tempo prima che la generazione possa partire e quante volte si
+è partiti con risultati parziali.
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_retrieval.py --turns 40 --web-deadline 1.0
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.getcwd())
+
+from src.pipeline import ConversationPipeline, Turn, rag_source, web_source
+
+
+class StubRag:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def search(self, query, top_k=3):
+        time.sleep(self.latency)
+        return [{"text": f"frammento {i} per {query}"} for i in range(top_k)]
+
+
+class StubWeb:
+    """Provider web finto: latenza lognormale, a volte una richiesta appesa."""
+
+    def __init__(self, median, hang_rate, hang_seconds, seed=0):
+        self.median = median
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+
+    def __call__(self, query):
+        if self.random.random() < self.hang_rate:
+            time.sleep(self.hang_seconds)
+        else:
+            time.sleep(self.median * self.random.lognormvariate(0, 0.5))
+        return [f"[Fonte Web] risultato per {query}"]
+
+
+class StubEngine:
+    """Solo quanto serve alle fasi route/prompt della pipeline."""
+
+    router = None
+
+    def route_query(self, query, vector=None, semantic=True):
+        return "light"
+
+    def build_prompt(self, model_type, history, query, sections=(), system=None):
+        return [{"role": "user", "content": query}], {}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--rag-latency", type=float, default=0.05)
+    parser.add_argument("--web-median", type=float, default=0.4)
+    parser.add_argument("--hang-rate", type=float, default=0.1)
+    parser.add_argument("--hang-seconds", type=float, default=5.0)
+    parser.add_argument("--web-deadline", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rag = StubRag(args.rag_latency)
+    web_args = (args.web_median, args.hang_rate, args.hang_seconds)
+
+    # 1. Come prima: RAG, poi web, nessun limite
+    web = StubWeb(*web_args)
+    sequential = []
+    for i in range(args.turns):
+        t0 = time.perf_counter()
+        rag.search(f"domanda {i}")
+        web(f"domanda {i}")
+        sequential.append(time.perf_counter() - t0)
+
+    # 2. Pipeline: in parallelo, web con scadenza
+    web = StubWeb(*web_args)
+    pipeline = ConversationPipeline(
+        StubEngine(),
+        sources=[
+            rag_source(rag),
+            web_source(web, deadline=args.web_deadline),
+        ],
+        max_workers=32,  # Le richieste appese continuano in background
+    )
+    parallel, partial = [], 0
+    for i in range(args.turns):
+        turn = pipeline.prepare(Turn(f"domanda {i}", sources=("rag", "web")))
+        parallel.append(turn.timings["retrieve"])
+        partial += any(s["status"] != "ok" for s in turn.retrieval.values())
+    pipeline.close()
+
+    for name, values in (
+        ("Sequenziale, senza scadenza", sequential),
+        ("Parallelo, con scadenza", parallel),
+    ):
+        print(
+            f"📊 {name:<28} p50 {percentile(values, 0.5) * 1000:6.0f} ms | "
+            f"p95 {percentile(values, 0.95) * 1000:6.0f} ms | "
+            f"max {max(values) * 1000:6.0f} ms"
+        )
+    print(
+        f"📊 Turni partiti con risultati parziali: {partial}/{args.turns} "
+        f"(scadenza web {args.web_deadline}s)"
+    )
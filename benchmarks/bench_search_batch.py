@@ -0,0 +1,79 @@
+"""
+Benchmark ricerca: ciclo di RagEngine.search vs RagEngine.search_batch.
+
+Le cache vengono aggirate usando query sempre nuove e disattivando la
+cache semantica, così si misura solo encode + Qdrant. Indice e cache
+vivono in una cartella temporanea (la rag_cache del progetto non viene
+toccata).
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_search_batch.py --queries 256
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from rag_engine import RagEngine
+
+TOPICS = [
+    "git rebase",
+    "docker compose volumi",
+    "thread e processi python",
+    "spring boot transactional",
+    "react hooks",
+    "sql join",
+    "comandi linux",
+    "design pattern observer",
+    "sicurezza xss",
+    "kubernetes deploy",
+]
+
+
+def make_queries(n, run):
+    return [f"{TOPICS[i % len(TOPICS)]} esempio {run}-{i}" for i in range(n)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--knowledge-dir", default="knowledge")
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    knowledge_dir = os.path.abspath(args.knowledge_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        rag = RagEngine(
+            knowledge_dir=knowledge_dir,
+            db_path=os.path.join(tmp, "qdrant_data"),
+            ingest_workers=1,
+            semantic_threshold=1.01,  # Cache semantica disattivata
+        )
+        rag.search("warm-up")
+
+        queries = make_queries(args.queries, "loop")
+        t0 = time.perf_counter()
+        for q in queries:
+            rag.search(q, top_k=args.top_k)
+        loop_time = time.perf_counter() - t0
+
+        queries = make_queries(args.queries, "batch")
+        t0 = time.perf_counter()
+        rag.search_batch(queries, top_k=args.top_k)
+        batch_time = time.perf_counter() - t0
+
+        rag.close()
+
+    print(f"📊 Ricerca: {args.queries} query uniche, top-k={args.top_k}")
+    print(
+        f"  loop search()  : {args.queries / loop_time:8.1f} query/s ({loop_time:.2f}s)"
+    )
+    print(
+        f"  search_batch() : {args.queries / batch_time:8.1f} query/s ({batch_time:.2f}s)"
+    )
+    print(f"  speedup        : {loop_time / batch_time:.2f}x")
@@ -0,0 +1,109 @@
+"""
+Benchmark decodifica: CODER normale vs decodifica speculativa con il
+LIGHT come modello bozza (src/speculative.py).
+
+Stessi prompt, stessa configurazione (threads, contesto) del profilo
+hardware, decodifica greedy (temperature 0): le due modalità devono
+produrre lo stesso testo, cambia solo la velocità. Si misurano i
+token/s di generazione e la percentuale di token proposti accettati.
+
+Uso (dalla root del progetto, con i GGUF in models/):
+    python benchmarks/bench_speculative.py --max-tokens 256 --draft-tokens 4
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.getcwd())
+
+from llama_cpp import Llama
+
+from src.profiler import HardwareProfiler
+from src.speculative import LightDraftModel
+
+CODER = "Qwen2.5-Coder-1.5B-Instruct-Q4_K_M.gguf"
+LIGHT = "Qwen2.5-0.5B-Instruct-Q4_K_M.gguf"
+
+PROMPTS = [
+    "Scrivi una funzione Python che calcola i numeri primi fino a n con il crivello di Eratostene.",
+    "Fai il refactor di questa classe Java in modo che usi il pattern builder: "
+    "class User { String name; int age; String email; }",
+    "Spiega con un esempio SQL la differenza tra LEFT JOIN e INNER JOIN.",
+    "Scrivi uno script bash che comprime in tar.gz tutti i file .log più vecchi di 7 giorni.",
+]
+
+
+def run(llm, max_tokens):
+    """Genera per ogni prompt; ritorna (testi, token generati, secondi)."""
+    texts, tokens, elapsed = [], 0, 0.0
+    for prompt in PROMPTS:
+        llm.reset()
+        t0 = time.perf_counter()
+        out = []
+        for chunk in llm.create_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=0.0,
+            stream=True,
+        ):
+            delta = chunk["choices"][0]["delta"]
+            if "content" in delta:
+                out.append(delta["content"])
+                tokens += 1  # Un chunk per token generato
+        elapsed += time.perf_counter() - t0
+        texts.append("".join(out))
+    return texts, tokens, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--draft-tokens", type=int, default=4)
+    args = parser.parse_args()
+
+    config = HardwareProfiler().get_config()
+    params = dict(
+        n_ctx=config["n_ctx"],
+        n_threads=config["cpu_threads"],
+        n_batch=config["n_batch"],
+        use_mmap=True,
+        verbose=False,
+    )
+    coder_path = os.path.join(args.model_dir, CODER)
+    light_path = os.path.join(args.model_dir, LIGHT)
+
+    # 1. CODER normale (un token per passo)
+    coder = Llama(model_path=coder_path, **params)
+    plain_texts, plain_tokens, plain_s = run(coder, args.max_tokens)
+    coder.close()
+    del coder
+
+    # 2. CODER con il LIGHT come bozza
+    draft = LightDraftModel(args.draft_tokens)
+    coder = Llama(model_path=coder_path, draft_model=draft, **params)
+    light = Llama(model_path=light_path, **params)
+    with draft.drafting(light):
+        spec_texts, spec_tokens, spec_s = run(coder, args.max_tokens)
+    coder.close()
+    light.close()
+
+    plain_tps = plain_tokens / plain_s
+    spec_tps = spec_tokens / spec_s
+    same = sum(a == b for a, b in zip(plain_texts, spec_texts))
+    stats = draft.stats()
+
+    print(
+        f"📊 Prompt: {len(PROMPTS)}, max {args.max_tokens} token, threads {params['n_threads']}"
+    )
+    print(
+        f"📊 CODER normale:      {plain_tokens} token in {plain_s:.1f}s -> {plain_tps:.1f} tok/s"
+    )
+    print(
+        f"📊 CODER speculativo:  {spec_tokens} token in {spec_s:.1f}s -> {spec_tps:.1f} tok/s "
+        f"(bozza {args.draft_tokens} token, accettati {stats['acceptance']:.0%})"
+    )
+    print(f"📊 Speedup: {spec_tps / plain_tps:.2f}x")
+    print(f"📊 Output identici: {same}/{len(PROMPTS)}")
@@ -0,0 +1,158 @@
+"""
+Benchmark vector store: Qdrant locale vs NumPy brute-force (float32/float16,
+quantizzazione int8 e PQ con rescoring float).
+
+Per ogni backend la collezione viene costruita una volta con vettori
+casuali, poi riaperta in un processo figlio "freddo" che misura:
+- cold start (import + apertura store + prima query)
+- latenza delle query (p50 / p95) e recall@k rispetto alla ricerca esatta
+- RSS del processo dopo le query (e quota condivisa: pagine mmap del
+  page cache, riusabili da altri processi sullo stesso store)
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_vector_store.py --points 5000 --dim 384
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+COLLECTION = "bench"
+# Il primo è il riferimento esatto per la recall
+BACKENDS = [
+    ("numpy", "float32", None),
+    ("qdrant", "float32", None),
+    ("numpy", "float16", None),
+    ("numpy", "float32", "int8"),
+    ("numpy", "float32", "pq"),
+]
+
+
+def clustered(rng, n, centers):
+    """Vettori raggruppati attorno a pochi centri (come embedding reali)."""
+    picks = centers[rng.integers(0, len(centers), n)]
+    return (picks + 0.7 * rng.standard_normal(picks.shape)).astype(np.float32)
+
+
+def build(backend, dtype, quantization, path, points, dim):
+    from src.vector_store import open_store
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((50, dim))
+    store = open_store(backend, path, dtype=dtype)
+    store.ensure_collection(COLLECTION, dim, quantization=quantization)
+    for start in range(0, points, 256):
+        n = min(256, points - start)
+        store.upsert(
+            COLLECTION,
+            [f"00000000-0000-0000-0000-{i:012d}" for i in range(start, start + n)],
+            clustered(rng, n, centers),
+            [{"text": f"frammento {i}", "source": "bench.md"} for i in range(n)],
+        )
+    store.flush(COLLECTION)
+    store.close()
+
+
+def child(backend, dtype, path, queries, dim, top_k):
+    """Processo freddo: misura apertura, query e RSS."""
+    t0 = time.perf_counter()
+    from src.vector_store import open_store
+
+    centers = np.random.default_rng(0).standard_normal((50, dim))
+    vectors = clustered(np.random.default_rng(1), queries, centers)
+    store = open_store(backend, path, dtype=dtype)
+    store.query(COLLECTION, vectors[0], top_k)
+    cold = time.perf_counter() - t0
+
+    latencies, found = [], []
+    for vector in vectors:
+        t = time.perf_counter()
+        hits = store.query(COLLECTION, vector, top_k)
+        latencies.append(time.perf_counter() - t)
+        found.append([hit.id for hit in hits])
+
+    import psutil
+
+    memory = psutil.Process().memory_info()
+    store.close()
+    print(
+        json.dumps(
+            {
+                "cold": cold,
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "rss": memory.rss / 1024**2,
+                "shared": getattr(memory, "shared", 0) / 1024**2,
+                "found": found,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "DTYPE", "PATH"))
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.queries, args.dim, args.top_k)
+        sys.exit(0)
+
+    print(f"📊 Vector store: {args.points} punti, dim={args.dim}, top-k={args.top_k}")
+    exact = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend, dtype, quantization in BACKENDS:
+            label = f"{backend:6s} {dtype:7s} {quantization or '-':4s}"
+            path = os.path.join(tmp, f"{backend}_{dtype}_{quantization}")
+            try:
+                build(backend, dtype, quantization, path, args.points, args.dim)
+            except ImportError as e:
+                print(f"  {label}: non disponibile ({e})")
+                continue
+            out = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--child",
+                    backend,
+                    dtype,
+                    path,
+                    "--queries",
+                    str(args.queries),
+                    "--dim",
+                    str(args.dim),
+                    "--top-k",
+                    str(args.top_k),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            if backend == "numpy" and dtype == "float32" and quantization is None:
+                exact = r["found"]
+            recall = (
+                np.mean(
+                    [len(set(a) & set(b)) / len(b) for a, b in zip(r["found"], exact)]
+                )
+                if exact
+                else float("nan")
+            )
+            print(
+                f"  {label}: cold start {r['cold'] * 1000:8.1f} ms | "
+                f"p50 {r['p50'] * 1000:7.3f} ms | p95 {r['p95'] * 1000:7.3f} ms | "
+                f"RSS {r['rss']:7.1f} MB (condivisi {r['shared']:6.1f} MB) | "
+                f"recall@{args.top_k} {recall:.3f}"
+            )
@@ -0,0 +1,110 @@
+"""
+Benchmark ricerca web: sessione nuova e nessuna cache vs WebSearch
+(src/web_search.py) con cache su disco per query normalizzata.
+
+Usa un provider stub locale (niente rete): ogni chiamata al provider
+costa `--latency` secondi, come un round trip verso DuckDuckGo. Le domande
+della sessione si ripetono spesso scritte in modo diverso ("Git rebase?",
+"git rebase", ...), come succede in una conversazione reale.
+
+Uso (dalla root del progetto):
+    python benchmarks/bench_web_cache.py --queries 60 --latency 0.3
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from src.web_search import SearchProvider, WebSearch
+
+TOPICS = [
+    "git rebase",
+    "python list comprehension",
+    "rust borrow checker",
+    "docker compose volumi",
+    "fastapi streaming response",
+    "numpy broadcasting",
+]
+
+
+class StubProvider(SearchProvider):
+    """Provider finto: latenza fissa, conta le chiamate."""
+
+    name = "stub"
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query, max_results):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [
+            {"title": query, "href": f"https://example.invalid/{i}", "body": query}
+            for i in range(max_results)
+        ]
+
+
+def variants(topic):
+    return [topic, topic.capitalize() + "?", f"  {topic.upper()} ", topic + "!!"]
+
+
+def session(n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(variants(rng.choice(TOPICS))) for _ in range(n)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    queries = session(args.queries)
+
+    # 1. Come prima: ogni domanda va al provider
+    provider = StubProvider(args.latency)
+    uncached = []
+    for query in queries:
+        t0 = time.perf_counter()
+        provider.search(query, 3)
+        uncached.append(time.perf_counter() - t0)
+    uncached_calls = provider.calls
+
+    # 2. WebSearch con cache su disco (directory temporanea)
+    cache_dir = tempfile.mkdtemp(prefix="web_cache_")
+    provider = StubProvider(args.latency)
+    web = WebSearch(provider, cache_dir=cache_dir)
+    cached = []
+    for query in queries:
+        t0 = time.perf_counter()
+        web.search(query)
+        cached.append(time.perf_counter() - t0)
+    stats = web.stats()
+    web.close()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    for name, values, calls in (
+        ("Senza cache", uncached, uncached_calls),
+        ("Cache normalizzata", cached, provider.calls),
+    ):
+        print(
+            f"📊 {name:<20} p50 {percentile(values, 0.5) * 1000:6.1f} ms | "
+            f"p95 {percentile(values, 0.95) * 1000:6.1f} ms | "
+            f"totale {sum(values):5.1f} s | chiamate al provider {calls}"
+        )
+    print(
+        f"📊 Hit rate cache: {stats['hit_rate']:.0%} "
+        f"({stats['hits']} hit, {stats['misses']} miss su {len(queries)} domande)"
+    )
@@ -0,0 +1,137 @@
+"""
+Valutazione offline del routing CODER / LIGHT.
+
+Confronta il classifier a keyword (CoddyEngine2._keyword_route) con il
+router semantico (src/query_router.py) su query etichettate a mano, diverse
+dai prototipi del router. Il keyword router viene misurato anche sull'input
+con il contesto RAG accodato (com'era in coddy.py / app.py), dove una
+parola tecnica nei frammenti basta a mandare tutto al CODER.
+
+Riporta accuratezza, errori per direzione e latenza del routing. La
+latenza end-to-end è stimata con i token di risposta attesi e le velocità
+di TOKENS_PER_SECOND (o --coder-tps / --light-tps misurate sulla propria
+macchina): una chiacchierata mandata al CODER costa tempo, una richiesta
+di codice mandata al LIGHT costa qualità (contata a parte).
+
+Uso (dalla root del progetto):
+    python benchmarks/eval_router.py --coder-tps 18 --light-tps 45
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.getcwd())
+
+from engine_cpp import CoddyEngine2
+from src.query_router import QueryRouter, TOKENS_PER_SECOND
+
+# (query, modello corretto, token di risposta attesi)
+EVAL_SET = [
+    ("come faccio a leggere un json in python?", "coder", 200),
+    ("mi dai un esempio di decorator in python", "coder", 250),
+    ("il mio script node crasha con ECONNREFUSED", "coder", 200),
+    ("scrivi una stored procedure per aggiornare i prezzi", "coder", 250),
+    ("come uso git rebase interattivo per unire due commit", "coder", 200),
+    ("trasforma questa funzione in asincrona con async await", "coder", 250),
+    ("come evito le sql injection in php", "coder", 250),
+    ("implementa il pattern singleton in c#", "coder", 200),
+    ("perché il mio useEffect viene chiamato due volte", "coder", 200),
+    ("crea un endpoint spring boot che ritorna una lista di utenti", "coder", 350),
+    ("ordina una lista di dizionari per chiave", "coder", 120),
+    ("il test fallisce con AssertionError, ecco l'output", "coder", 250),
+    ("write a go function that reverses a string", "coder", 150),
+    ("how do I set up a github actions workflow for python", "coder", 300),
+    ("kubectl mi dà CrashLoopBackOff, come indago", "coder", 250),
+    ("scrivi un makefile per compilare un progetto c", "coder", 200),
+    ("ruby: differenza tra proc e lambda con esempio", "coder", 200),
+    ("```def f(x): return x*2``` come lo rendo ricorsivo?", "coder", 150),
+    ("buonasera!", "light", 15),
+    ("come ti chiami?", "light", 20),
+    ("mi consigli un film per stasera?", "light", 80),
+    ("qual è la classifica aggiornata del campionato", "light", 80),
+    ("quanto fa 15 per 12", "light", 15),
+    ("scrivimi una poesia sull'autunno", "light", 120),
+    ("cosa vuol dire la parola prefissare", "light", 50),
+    ("dove si trova il monte bianco", "light", 40),
+    ("ho un esame domani, sono agitato", "light", 80),
+    ("perfetto, grazie", "light", 10),
+    ("riassumi la trama dei promessi sposi", "light", 150),
+    ("what's the weather usually like in rome in april", "light", 60),
+    ("traduci in spagnolo: ci vediamo domani", "light", 15),
+    ("quali sono i benefici della corsa", "light", 120),
+    ("fissa un promemoria mentale: comprare il latte", "light", 20),
+    ("suggeriscimi un nome per il mio gatto", "light", 30),
+    ("chi ha vinto i mondiali del 2006", "light", 20),
+    ("classifica i pianeti per dimensione", "light", 60),
+]
+
+# Un frammento tipico della knowledge base accodato alla domanda
+RAG_CONTEXT = (
+    "\n\n=== KNOWLEDGE BASE ===\n"
+    "Per gestire gli errori in python si usa try/except; la funzione "
+    "open() legge un file, json.load lo converte in dizionario."
+)
+
+
+def evaluate(route, queries):
+    """Ritorna (scelte, ms medi per query)."""
+    t0 = time.perf_counter()
+    routes = [route(q) for q in queries]
+    return routes, (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+def report(name, routes, ms, tps):
+    correct = sum(r == label for r, (_, label, _) in zip(routes, EVAL_SET))
+    to_light = sum(
+        r == "light" and label == "coder" for r, (_, label, _) in zip(routes, EVAL_SET)
+    )
+    to_coder = sum(
+        r == "coder" and label == "light" for r, (_, label, _) in zip(routes, EVAL_SET)
+    )
+    seconds = sum(tokens / tps[r] for r, (_, _, tokens) in zip(routes, EVAL_SET))
+    print(
+        f"📊 {name:<28} accuratezza {correct}/{len(EVAL_SET)} "
+        f"({correct / len(EVAL_SET):.0%}) | codice->LIGHT {to_light} | "
+        f"chat->CODER {to_coder} | routing {ms:.2f} ms/query | "
+        f"generazione stimata {seconds:.0f}s"
+    )
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--coder-tps", type=float, default=TOKENS_PER_SECOND["coder"])
+    parser.add_argument("--light-tps", type=float, default=TOKENS_PER_SECOND["light"])
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    tps = {"coder": args.coder_tps, "light": args.light_tps}
+    queries = [q for q, _, _ in EVAL_SET]
+
+    t0 = time.perf_counter()
+    router = QueryRouter(SentenceTransformer(args.model), tokens_per_second=tps)
+    print(f"📊 Router pronto in {time.perf_counter() - t0:.1f}s (prototipi embeddati)")
+
+    ideal = sum(tokens / tps[label] for _, label, tokens in EVAL_SET)
+    keyword_ctx = report(
+        "Keyword (con contesto RAG)",
+        *evaluate(lambda q: CoddyEngine2._keyword_route(q + RAG_CONTEXT), queries),
+        tps,
+    )
+    keyword = report(
+        "Keyword (solo domanda)",
+        *evaluate(CoddyEngine2._keyword_route, queries),
+        tps,
+    )
+    semantic = report("Semantico (MiniLM)", *evaluate(router.route, queries), tps)
+
+    print(f"📊 Generazione con routing perfetto: {ideal:.0f}s")
+    print(
+        f"📊 Latenza risparmiata dal router semantico: "
+        f"{keyword_ctx - semantic:+.0f}s vs keyword con contesto, "
+        f"{keyword - semantic:+.0f}s vs keyword sulla domanda"
+    )
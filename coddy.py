@@ -14,27 +14,39 @@ os.environ["HF_HUB_OFFLINE"] = "0"
 # Importa Engine C++ e RAG
 from engine_cpp import CoddyEngine2
 from rag_engine import RagEngine
+from src.pipeline import (
+    ConversationPipeline,
+    Turn,
+    rag_source,
+    turn_sources,
+    web_memory_source,
+    web_source,
+)
+from src.web_search import get_web_search
 
 # Inizializzazione della console Rich
 console = Console()
 
 
-def web_search(query, max_results=3):
+def web_search(query):
     """
-    Esegue una ricerca web anonima usando DuckDuckGo (ddgs).
+    Esegue una ricerca web anonima usando DuckDuckGo (ddgs), con cache su disco.
     """
-    try:
-        from ddgs import DDGS
-
-        results = []
-        with DDGS() as ddgs_inst:
-            ddgs_gen = ddgs_inst.text(query, max_results=max_results)
-            for r in ddgs_gen:
-                results.append(f"[Fonte Web: {r['title']}]({r['href']})\n{r['body']}")
-        return results
-    except Exception as e:
-        console.print(f"[bold red]Errore Ricerca Web: {e}[/bold red]")
-        return []
+    return get_web_search().search_text(query)
+
+
+def make_pipeline(engine, rag):
+    """Pipeline di conversazione (RAG + web) condivisa da CLI e Streamlit."""
+    web = get_web_search()
+    sources = [web_source(web.search_text)]
+    if rag:
+        sources.insert(0, rag_source(rag))
+        # Risultati web dei turni precedenti, ritrovati anche offline
+        if web.attach(rag):
+            sources.append(web_memory_source(web.recall_text))
+    return ConversationPipeline(
+        engine, sources=sources, embed=rag.embed if rag else None
+    )
 
 
 def init_system():
@@ -72,6 +84,10 @@ def init_system():
         try:
             engine = CoddyEngine2()
             engine.start()  # Carica i GGUF
+            if rag and rag.model:
+                engine.use_embedder(
+                    rag.model
+                )  # Router semantico, se abilitato nel profilo
             progress.advance(task2)
         except Exception as e:
             console.print(f"[bold red]Errore Engine AI: {e}[/bold red]")
@@ -102,6 +118,7 @@ def chat_loop(engine, rag, enable_online=False):
     )
 
     history = [{"role": "system", "content": base_system_prompt}]
+    pipeline = make_pipeline(engine, rag)
 
     # Setup Live display styling
     from rich.live import Live
@@ -144,49 +161,52 @@ def chat_loop(engine, rag, enable_online=False):
             # Separatore visuale
             console.print(Rule(style="dim"))
 
-            # 1. Retrieval RAG
-            rag_results = []
+            # Routing, RAG e web (in parallelo) e prompt entro n_ctx
+            turn = Turn(
+                user_input,
+                history=history[1:],
+                system=history[0]["content"],
+                sources=turn_sources(enable_online),
+            )
             with console.status(
-                "[bold magenta]🧠 Analisi Memoria (RAG)...[/bold magenta]",
+                "[bold magenta]🧠 Analisi Memoria (RAG)"
+                + (" + 🌐 Web" if enable_online else "")
+                + "...[/bold magenta]",
                 spinner="dots",
             ):
-                rag_results = rag.search(user_input)
-
-            # 2. Web Search (opzionale)
-            web_results = []
-            if enable_online:
-                with console.status(
-                    "[bold cyan]🌐 Scansione Web...[/bold cyan]", spinner="earth"
-                ):
-                    web_results = web_search(user_input)
-
-            # Costruzione prompt
-            context_parts = []
+                pipeline.prepare(turn)
+
+            rag_results = turn.results.get("rag", [])
+            web_results = turn.results.get("web", [])
+            for name, info in turn.retrieval.items():
+                if info["status"] == "late":
+                    console.print(
+                        f"   [dim]⏱️ {name} oltre {info['seconds']}s: si prosegue senza[/dim]"
+                    )
             if rag_results:
-                context_parts.append("=== KNOWLEDGE BASE ===")
-                for r in rag_results:
-                    context_parts.append(f"{r['text']}")
                 console.print(
                     f"   [dim]📚 Trovati {len(rag_results)} frammenti locali[/dim]"
                 )
-
             if web_results:
-                context_parts.append("=== WEB RESULTS ===")
-                context_parts.extend(web_results)
                 console.print(
                     f"   [dim]🌐 Trovati {len(web_results)} risultati web[/dim]"
                 )
 
-            full_input = user_input
-            if context_parts:
-                full_input += "\n\n" + "\n".join(context_parts)
+            model_label = "CODER (1.5B)" if turn.target == "coder" else "LIGHT (0.5B)"
+            console.print(f"[dim]⚡ Engine: {model_label}[/dim]")
 
-            history.append({"role": "user", "content": full_input})
+            stats = turn.prompt_stats
+            if stats["dropped_turns"]:
+                console.print(
+                    f"   [dim]✂️ {stats['dropped_turns']} messaggi fuori contesto "
+                    f"riassunti ({stats['prompt_tokens']}/{stats['budget']} token)[/dim]"
+                )
+
+            # In history solo la domanda: il contesto recuperato vale per
+            # questo turno (non si rimanda a ogni turno successivo) e il
+            # prefisso del prompt resta stabile per la cache KV
+            history.append({"role": "user", "content": user_input})
 
-            # Generazione Streaming
-            current_model = engine.route_query(full_input)
-            model_label = "CODER (1.5B)" if current_model == "coder" else "LIGHT (0.5B)"
-            console.print(f"[dim]⚡ Engine: {model_label}[/dim]")
             console.print("[bold blue]🤖 Coddy[/bold blue]:")
 
             full_response = ""
@@ -195,7 +215,7 @@ def chat_loop(engine, rag, enable_online=False):
             # Refresh rate ridotto per evitare flickering su Windows CMD
             with Live(Markdown(""), refresh_per_second=8, console=console) as live:
                 try:
-                    stream_gen = engine.stream_chat(history, model_type=current_model)
+                    stream_gen = pipeline.stream(turn)
                     for chunk in stream_gen:
                         if chunk:
                             full_response += chunk
@@ -215,6 +235,7 @@ def chat_loop(engine, rag, enable_online=False):
         console.print("[dim]Spegnimento motori...[/dim]")
 
         # Pulizia robusta anti-errori shutdown
+        pipeline.close()
         if rag:
             try:
                 rag.close()
@@ -251,33 +272,21 @@ if __name__ == "__main__":
     cli_query = " ".join(args.query) if args.query else None
 
     if cli_query:
-        # One-shot execution
-        # (Semplificato per v2 - logica simile alla chat ma singola)
-        base_system_prompt = "Sei Coddy. Rispondi in modo tecnico e conciso."
-        history = [{"role": "system", "content": base_system_prompt}]
-
-        # RAG One-shot
-        rag_results = rag.search(cli_query)
-        context = ""
-        if rag_results:
-            context += "\n=== CONTEXT ===\n" + "\n".join(
-                [r["text"] for r in rag_results]
-            )
-
-        if args.online:
-            web = web_search(cli_query)
-            if web:
-                context += "\n=== WEB ===\n" + "\n".join(web)
-
-        history.append({"role": "user", "content": cli_query + context})
+        # One-shot execution: stessa pipeline della chat, senza history
+        pipeline = make_pipeline(engine, rag)
+        turn = Turn(
+            cli_query,
+            system="Sei Coddy. Rispondi in modo tecnico e conciso.",
+            sources=turn_sources(args.online),
+        )
 
         print("\n", end="")
-        full_response = ""
-        for chunk in engine.stream_chat(history, model_type="auto"):
+        for chunk in pipeline.run(turn):
             if chunk:
                 print(chunk, end="", flush=True)
         print("\n")
 
+        pipeline.close()
         rag.close()
         sys.exit(0)
 
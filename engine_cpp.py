@@ -1,4 +1,8 @@
 import os
+import threading
+from contextlib import contextmanager, nullcontext
+
+from src.scheduler import RequestExpired
 
 try:
     from llama_cpp import Llama
@@ -11,11 +15,16 @@ class CoddyEngine2:
     def __init__(self, model_dir="models"):
         """
         Motore v2.0 basato su llama.cpp.
-        Gestisce DUE modelli in RAM simultaneamente (Godmode).
+        Gestisce DUE modelli: residenti insieme (Godmode) o caricati su
+        richiesta e scaricati se inattivi, secondo la RAM disponibile.
         Auto-Tuning powered by HardwareProfiler.
         """
         from src.profiler import HardwareProfiler
         from src.context_awareness import ContextAwareness
+        from src.model_residency import ModelResidency
+        from src.kv_cache import PrefixStateCache, estimate_state_bytes
+        from src.scheduler import Scheduler
+        from src.speculative import LightDraftModel
 
         # Load Hardware Profile
         self.profiler = HardwareProfiler()
@@ -30,6 +39,11 @@ class CoddyEngine2:
         self.n_ctx = self.config["n_ctx"]
         self.n_threads = self.config["cpu_threads"]
         self.n_batch = self.config["n_batch"]
+        # Decodifica speculativa (LIGHT bozza, CODER verifica): 0 = disattivata
+        self.draft_tokens = self.config["speculative_draft_tokens"]
+        self._draft_class = LightDraftModel
+        # Router semantico: solo se abilitato nel profilo (default keyword)
+        self.semantic_router = self.config["semantic_router"]
 
         # Paths
         self.path_coder = os.path.join(
@@ -37,50 +51,252 @@ class CoddyEngine2:
         )
         self.path_light = os.path.join(model_dir, "Qwen2.5-0.5B-Instruct-Q4_K_M.gguf")
 
-        self.llm_light = None
+        # Residenza dei modelli (politica scelta dal profiler in base alla RAM)
+        self.residency = ModelResidency(
+            policy=self.config["model_policy"],
+            idle_seconds=self.config["model_idle_seconds"],
+            min_free_gb=self.config["min_free_ram_gb"],
+            max_resident=self.config["model_max_resident"],
+        )
+        # N repliche per tipo di modello (istanze Llama indipendenti, una
+        # generazione alla volta ciascuna) davanti a uno scheduler con coda
+        self.replicas = self.config["model_replicas"]
+        for kind, count in self.replicas.items():
+            for replica in range(count):
+                self.residency.register(
+                    self._replica_name(kind, replica), self._model_loader(kind)
+                )
+        self.scheduler = Scheduler(self.replicas)
+
+        # Tokenizer (solo vocabolario) e prompt builder per tipo di modello
+        self._tokenizers = {}
+        self._prompt_builders = {}
+        # Inizializzazione pigra di tokenizer e prompt builder: le richieste
+        # API arrivano da thread diversi (RLock: prompt_builder usa tokenizer)
+        self._init_lock = threading.RLock()
+
+        # Router semantico (si attiva con use_embedder, quando il RAG è pronto
+        # e se abilitato nel profilo)
+        self.router = None
+
+        # Stati KV per prefisso di prompt, uno per modello: sopravvivono allo
+        # scaricamento del modello, così un turno nuovo valuta solo i token nuovi
+        kv_bytes = self.config["kv_cache_mb"] * 1024**2
+        self.kv_caches = {
+            "coder": PrefixStateCache(kv_bytes),
+            "light": PrefixStateCache(kv_bytes),
+        }
+        self._state_bytes = estimate_state_bytes
+
+    @property
+    def llm_coder(self):
+        return self.residency.peek("coder")
+
+    @property
+    def llm_light(self):
+        return self.residency.peek("light")
 
     def close(self):
         """Libera la memoria dei modelli."""
-        if self.llm_coder:
-            del self.llm_coder
-            self.llm_coder = None
-        if self.llm_light:
-            del self.llm_light
-            self.llm_light = None
-        # Force garbage collection
-        import gc
-
-        gc.collect()
+        # Scarica i modelli e forza la garbage collection
+        self.residency.close()
 
         # Carica i modelli (Lazy load nel metodo start per gestire errori gracefully)
 
     def start(self):
-        """Carica fisicamente i modelli in RAM."""
-        if not os.path.exists(self.path_coder) or not os.path.exists(self.path_light):
+        """Carica fisicamente i modelli in RAM (o solo li verifica, se on-demand)."""
+        self._check_model(self.path_coder)
+        self._check_model(self.path_light)
+        if self.residency.policy == "resident":
+            self.load_coder()
+            self.load_light()
+            print("✅ [Godmode] Doppio Cervello Attivo (RAM OK).")
+        else:
+            print(
+                f"✅ [Engine v2] Modelli on-demand (scaricati dopo "
+                f"{self.residency.idle_seconds}s di inattività)."
+            )
+
+    @staticmethod
+    def _check_model(path):
+        if not os.path.exists(path):
             raise FileNotFoundError(
                 "Modelli GGUF non trovati in 'models/'. Esegui download_models_gguf.py"
             )
 
-        print("[Engine v2] Caricamento CODER (1.5B)...")
-        self.llm_coder = Llama(
-            model_path=self.path_coder,
-            n_ctx=self.n_ctx,
-            n_threads=self.n_threads,
-            n_batch=self.n_batch,
-            verbose=False,
-        )
+    def load_coder(self):
+        """Carica il modello CODER, tutte le repliche (usabile anche in un thread di boot)."""
+        return self._load_replicas("coder")
+
+    def load_light(self):
+        """Carica il modello LIGHT, tutte le repliche (usabile anche in un thread di boot)."""
+        return self._load_replicas("light")
+
+    def _load_replicas(self, kind):
+        models = [
+            self.residency.load(self._replica_name(kind, replica))
+            for replica in range(self.replicas[kind])
+        ]
+        return models[0]
+
+    @staticmethod
+    def _replica_name(kind, replica):
+        return kind if replica == 0 else f"{kind}:{replica}"
 
-        print("[Engine v2] Caricamento LIGHT (0.5B)...")
-        self.llm_light = Llama(
-            model_path=self.path_light,
-            n_ctx=self.n_ctx // 2,  # Contesto minore per il light
-            n_threads=self.n_threads,
+    def _model_loader(self, kind):
+        return lambda: self._new_model(kind)
+
+    def _new_model(self, kind):
+        extra = {}
+        if kind == "coder":
+            path, n_ctx = self.path_coder, self.n_ctx
+            print("[Engine v2] Caricamento CODER (1.5B)...")
+            if self.draft_tokens:
+                # Il draft si fissa alla creazione (llama.cpp abilita i logits
+                # di tutte le posizioni); il LIGHT si collega per richiesta
+                extra["draft_model"] = self._draft_class(self.draft_tokens)
+        else:
+            path, n_ctx = self.path_light, self.context_window("light")
+            print("[Engine v2] Caricamento LIGHT (0.5B)...")
+        self._check_model(path)
+        # mmap: i pesi restano pagine del file, un ricaricamento è economico
+        # (e le repliche dello stesso GGUF condividono le stesse pagine)
+        llm = Llama(
+            model_path=path,
+            n_ctx=n_ctx,
+            n_threads=max(1, self.n_threads // self.replicas[kind]),
             n_batch=self.n_batch,
+            use_mmap=True,
             verbose=False,
+            **extra,
         )
-        print("✅ [Godmode] Doppio Cervello Attivo (RAM OK).")
+        self._attach_kv_cache(llm, kind, n_ctx)
+        return llm
 
-    def route_query(self, query):
+    def _attach_kv_cache(self, llm, kind, n_ctx):
+        """
+        Collega la cache degli stati solo se il budget contiene almeno uno
+        stato a contesto pieno: altrimenti llama.cpp copierebbe lo stato a
+        ogni completion per vederlo poi scartato.
+        """
+        cache = self.kv_caches[kind]
+        state_bytes = self._state_bytes(llm.metadata, n_ctx, llm.n_vocab())
+        if state_bytes is not None and state_bytes > cache.capacity_bytes:
+            print(
+                f"⚠️ [Engine v2] Cache KV {kind} disattivata: uno stato "
+                f"({state_bytes / 1024**2:.0f} MB) supera il budget "
+                f"({cache.capacity_bytes / 1024**2:.0f} MB)."
+            )
+            return
+        llm.set_cache(cache)
+
+    def context_window(self, kind):
+        """n_ctx del modello: il light ha un contesto minore, salvo che debba
+        fare da bozza sull'intero contesto del CODER."""
+        if kind == "coder" or self.draft_tokens:
+            return self.n_ctx
+        return self.n_ctx // 2
+
+    def tokenizer(self, kind):
+        """
+        Tokenizer del modello senza caricarne i pesi (`vocab_only`): il
+        conteggio dei token funziona anche con i modelli scaricati.
+        """
+        with self._init_lock:
+            if kind not in self._tokenizers:
+                path = self.path_coder if kind == "coder" else self.path_light
+                self._check_model(path)
+                self._tokenizers[kind] = Llama(
+                    model_path=path, vocab_only=True, verbose=False
+                )
+            return self._tokenizers[kind]
+
+    def prompt_builder(self, kind):
+        from src.prompt_builder import PromptBuilder, TokenCounter
+
+        with self._init_lock:
+            if kind not in self._prompt_builders:
+                vocab = self.tokenizer(kind)
+                counter = TokenCounter(
+                    lambda text: vocab.tokenize(
+                        text.encode("utf-8"), add_bos=False, special=True
+                    )
+                )
+                n_ctx = self.context_window(kind)
+                self._prompt_builders[kind] = PromptBuilder(
+                    counter, n_ctx, reserve_output=n_ctx // 4
+                )
+            return self._prompt_builders[kind]
+
+    def build_prompt(self, model_type, history, query, sections=(), system=None):
+        """
+        Messaggi per stream_chat entro la finestra di contesto del modello
+        (vedi src/prompt_builder.py). history: turni precedenti senza system;
+        sections: [(header, [frammenti])] del contesto recuperato.
+        Ritorna (messaggi, statistiche).
+        """
+        kind = "coder" if model_type == "coder" else "light"
+        system = system or "You are Coddy."
+        if self.project_context and "[CONTEXT AWARENESS]" not in system:
+            system += self.project_context
+        return self.prompt_builder(kind).build(system, history, query, sections)
+
+    @contextmanager
+    def _drafting(self, llm, session_id):
+        """
+        Presta una replica LIGHT come bozza al CODER, se ce n'è una libera.
+        Non si aspetta mai: con i LIGHT occupati si decodifica normalmente.
+        Ritorna il draft model collegato, o None.
+        """
+        draft = getattr(llm, "draft_model", None)
+        if not isinstance(draft, self._draft_class):
+            print("⚠️ [Engine v2] Decodifica speculativa non attiva nel profilo.")
+            yield None
+            return
+        ticket = self.scheduler.try_acquire(session_id, "light")
+        if ticket is None:
+            yield None
+            return
+        ticket.start()
+        try:
+            with self.residency.use(
+                self._replica_name("light", ticket.replica)
+            ) as light:
+                with draft.drafting(light):
+                    yield draft
+        finally:
+            ticket.release()
+
+    def use_embedder(self, model):
+        """
+        Attiva il routing semantico riusando l'embedder MiniLM del RAG
+        (vedi src/query_router.py), se `semantic_router` è abilitato nel
+        profilo. Altrimenti resta il classifier a keyword e ritorna None.
+        """
+        from src.query_router import QueryRouter
+
+        if not self.semantic_router:
+            print("🧭 [Router] Classifier a keyword (semantic_router disattivato)")
+            return None
+        self.router = QueryRouter(model)
+        return self.router
+
+    def route_query(self, query, vector=None, semantic=True):
+        """
+        Sceglie il modello per la query (solo il testo dell'utente, senza
+        contesto RAG/web). `vector`: embedding della query se già calcolato.
+        `semantic=False`: solo classifier a keyword (es. embedding in ritardo).
+        Ritorna 'coder' o 'light'.
+        """
+        if semantic and self.router is not None:
+            try:
+                return self.router.route(query, vector)
+            except Exception as e:
+                print(f"⚠️ [Router] Fallback a keyword: {e}")
+        return self._keyword_route(query)
+
+    @staticmethod
+    def _keyword_route(query):
         """
         Classifier Euristico per scegliere il modello.
         Ritorna 'coder' o 'light'.
@@ -111,10 +327,27 @@ class CoddyEngine2:
         # Default -> Light (molto più veloce per chiacchiere)
         return "light"
 
-    def stream_chat(self, history, model_type="auto"):
+    def stream_chat(
+        self,
+        history,
+        model_type="auto",
+        session_id="default",
+        ticket=None,
+        deadline_seconds=None,
+        speculative=False,
+    ):
         """
         Genera risposta in streaming.
         model_type: 'auto', 'coder', 'light'
+        La generazione passa dallo scheduler: attende una replica libera
+        (a turno tra le sessioni) e si interrompe se il ticket viene
+        annullato. `deadline_seconds` limita l'intera richiesta (senza, solo
+        l'attesa in coda): oltre, solleva RequestExpired dopo il testo già
+        prodotto, così il chiamante sa che la risposta è troncata.
+        Un `ticket` già ottenuto dallo scheduler (es. attesa asincrona in
+        api.py) fissa modello e replica.
+        speculative: per il CODER, usa un LIGHT libero come modello bozza
+        (richiede `speculative_draft_tokens` nel profilo).
         """
         # Inject Context into System Prompt
         working_history = [msg.copy() for msg in history]
@@ -137,23 +370,46 @@ class CoddyEngine2:
         # Parse ultima query
         last_msg = working_history[-1]["content"]
 
-        if model_type == "auto":
+        if ticket is not None:
+            target = ticket.model
+        elif model_type == "auto":
             target = self.route_query(last_msg)
         else:
             target = model_type
 
-        llm = self.llm_coder if target == "coder" else self.llm_light
+        target = "coder" if target == "coder" else "light"
         # print(f"[DEBUG] Usando modello: {target.upper()}")
 
-        # Llama.cpp chat format
-        stream = llm.create_chat_completion(
-            messages=working_history,
-            max_tokens=2048,
-            temperature=0.4 if target == "coder" else 0.7,
-            stream=True,
-            stop=["<|im_end|>", "<|endoftext|>"],
-        )
+        if ticket is None:
+            ticket = self.scheduler.submit(session_id, target, deadline_seconds)
+        try:
+            replica = ticket.wait()
+            ticket.start()
+            # Il modello resta "in uso" (non scaricabile) fino a fine stream
+            with self.residency.use(self._replica_name(target, replica)) as llm:
+                if speculative and target == "coder":
+                    drafting = self._drafting(llm, session_id)
+                else:
+                    drafting = nullcontext()
+                with drafting:
+                    # Llama.cpp chat format
+                    stream = llm.create_chat_completion(
+                        messages=working_history,
+                        max_tokens=2048,
+                        temperature=0.4 if target == "coder" else 0.7,
+                        stream=True,
+                        stop=["<|im_end|>", "<|endoftext|>"],
+                    )
 
-        for chunk in stream:
-            if "content" in chunk["choices"][0]["delta"]:
-                yield chunk["choices"][0]["delta"]["content"]
+                    for chunk in stream:
+                        if ticket.cancelled:
+                            # Client disconnesso: libera subito la replica
+                            break
+                        if ticket.expired:
+                            raise RequestExpired(
+                                "Risposta interrotta: scadenza della richiesta superata"
+                            )
+                        if "content" in chunk["choices"][0]["delta"]:
+                            yield chunk["choices"][0]["delta"]["content"]
+        finally:
+            ticket.release()
@@ -1,51 +1,135 @@
 import os
-import glob
-import uuid
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 import diskcache as dc
+import numpy as np
+
+from src.chunker import MarkdownChunker
+from src.embedding_worker import EmbeddingWorker
+from src.query_cache import LRUCache, SemanticCache
+from src.lexical_index import LexicalIndex, tokenize
+from src.vector_store import open_store
+from src.ingestion import (
+    IngestionPipeline,
+    chunk_documents,
+    discover_files,
+    prepare_changed,
+)
+
+MANIFEST_VERSION = 1
+# Contatore di generazione dell'indice (condiviso via diskcache tra processi)
+GENERATION_KEY = "rag_generation"
+# Fusione RRF: 1 / (RRF_K + rank)
+RRF_K = 60
+# Soglia di similarità coseno per i risultati solo-vettoriali
+VECTOR_MIN_SCORE = 0.45
 
 
 class RagEngine:
     def __init__(
         self,
         knowledge_dir="knowledge",
-        db_path="qdrant_data",
+        db_path=None,
         model_name="all-MiniLM-L6-v2",
+        manifest_path=None,
+        encode_batch_size=64,
+        upsert_batch_size=256,
+        max_in_flight=2,
+        ingest_workers=None,
+        chunker=None,
+        semantic_cache_size=256,
+        semantic_threshold=0.92,
+        l1_cache_size=512,
+        lexical_path=None,
+        lexical_confidence=1.5,
+        vector_backend="qdrant",
+        vector_dtype="float32",
+        quantization=None,
     ):
         """
-        Inizializza il motore RAG con Qdrant (Persistent Storage).
+        Inizializza il motore RAG con un vector store persistente:
+        Qdrant locale (default) o matrice NumPy brute-force (`vector_backend="numpy"`).
         Usa Lazy Loading per le dipendenze pesanti.
         """
         self.knowledge_dir = knowledge_dir
         self.collection_name = "coddy_knowledge"
-        self.db_path = db_path
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
+        # Quantizzazione della collezione: None, "int8" o "pq" (rescoring float)
+        self.quantization = quantization
+        self.db_path = db_path or (
+            "vector_store" if vector_backend == "numpy" else "qdrant_data"
+        )
+        db_path = self.db_path
         self.model_name = model_name
-        self.client = None
+        # Manifest dei file indicizzati (mtime/size/hash + id dei frammenti)
+        self.manifest_path = manifest_path or os.path.join(
+            db_path, "knowledge_manifest.json"
+        )
+        self.manifest = self._load_manifest()
+        # Batching: frammenti per chiamata a encode / punti per upsert
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        # Lotti embeddati in attesa di upsert (backpressure)
+        self.max_in_flight = max_in_flight
+        # Processi per lettura/chunking (default: HardwareProfiler)
+        self.ingest_workers = ingest_workers
+        # Chunker strutturale (titoli, codice, budget di token con overlap)
+        self.chunker = chunker or MarkdownChunker()
+        self.store = None
         self.model = None
-        # Persistent Cache for RAG queries (TTL 1 hour)
-        self.cache = dc.Cache("rag_cache")
-        logger.info(f"RAG Cache initialized at {self.cache.directory}")
+        # L1: LRU in-process per vettori delle query e liste di risultati
+        self.vector_cache = LRUCache(l1_cache_size)
+        self.result_cache = LRUCache(l1_cache_size)
+        # L2: Persistent Cache for RAG queries, namespace per generazione indice.
+        # Nessun TTL: una voce resta valida finché la collezione non cambia.
+        self.cache = dc.Cache("rag_cache", tag_index=True)
+        if GENERATION_KEY not in self.cache:
+            # Cache senza contatore (vecchio formato o contatore rimosso):
+            # nessuna voce è attribuibile a una generazione certa.
+            self.cache.clear()
+            self.cache.set(GENERATION_KEY, 0)
+        self.generation = self.cache.get(GENERATION_KEY, 0)
+        logger.info(
+            f"RAG Cache initialized at {self.cache.directory} (gen {self.generation})"
+        )
+        # Secondo livello: cache semantica (query simili -> stessi risultati)
+        self.semantic_cache = None
+        self.semantic_cache_size = semantic_cache_size
+        self.semantic_threshold = semantic_threshold
+        # Indice lessicale BM25 (accanto al vector store) per ricerca ibrida
+        self.lexical = LexicalIndex(
+            lexical_path
+            or os.path.join(os.path.dirname(os.path.abspath(db_path)), "lexical_index")
+        )
+        # Scarto minimo top1/top2 (BM25) per saltare l'embedder
+        self.lexical_confidence = lexical_confidence
 
         # Lazy Loading delle dipendenze
         try:
             # print(f"RAG: Importazione moduli pesanti (Lazy Loading)...")
             from sentence_transformers import SentenceTransformer
-            from qdrant_client import QdrantClient
-            from qdrant_client.http import models
 
-            self.models = models
-
-            # Inizializza Qdrant Locale
+            # Inizializza il vector store locale (Qdrant o NumPy)
             # logger.debug(f"RAG: Apertura DB in {self.db_path}...")
-            # Tentiamo di forzare la locazione in memoria se path è "memory" (opzionale)
-            self.client = QdrantClient(path=self.db_path)
+            self.store = open_store(
+                self.vector_backend, self.db_path, dtype=self.vector_dtype
+            )
 
             # Carica Modello Embedding
             # print(f"RAG: Caricamento modello {self.model_name}...")
             self.model = SentenceTransformer(self.model_name)
             self.embedding_size = self.model.get_sentence_embedding_dimension()
+            self.semantic_cache = SemanticCache(
+                self.embedding_size,
+                max_entries=self.semantic_cache_size,
+                threshold=self.semantic_threshold,
+            )
 
             self._ensure_collection()
+            self._ensure_lexical()
             self.load_knowledge()
             # print("RAG: Sistema pronto.")
 
@@ -55,131 +139,552 @@ class RagEngine:
             )
         except Exception as e:
             logger.critical(f"RAG Error: Inizializzazione fallita ({e})")
-            # Fallback sicuro: client None
+            # Fallback sicuro: store None
 
     def _ensure_collection(self):
         """Assicura che la collezione esista."""
-        if not self.client:
+        if not self.store:
             return
 
         try:
-            collections = self.client.get_collections()
-            exists = any(
-                c.name == self.collection_name for c in collections.collections
-            )
-
-            if not exists:
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=self.models.VectorParams(
-                        size=self.embedding_size, distance=self.models.Distance.COSINE
-                    ),
-                )
+            if self.store.ensure_collection(
+                self.collection_name,
+                self.embedding_size,
+                quantization=self.quantization,
+            ):
+                # Collezione nuova: manifest e indice lessicale non sono più validi
+                self.manifest = {"version": MANIFEST_VERSION, "files": {}}
+                self.lexical.clear()
+                self.lexical.commit()
         except Exception as e:
             logger.error(f"RAG Init Collection Error: {e}")
 
-    def load_knowledge(self):
-        """Indicizza i file."""
-        if not self.client:
+    def _ensure_lexical(self):
+        """Ricostruisce l'indice lessicale dalla collezione se manca (es. upgrade)."""
+        if len(self.lexical):
             return
+        try:
+            if not self.store.count(self.collection_name):
+                return
+            logger.info("RAG: Ricostruzione indice lessicale dal vector store...")
+            for doc_id, payload in self.store.scroll(self.collection_name):
+                self.lexical.add(doc_id, payload)
+            self.lexical.commit()
+        except Exception as e:
+            logger.error(f"RAG Lexical Index Error: {e}")
 
-        files = glob.glob(
-            os.path.join(self.knowledge_dir, "**/*.md"), recursive=True
-        ) + glob.glob(os.path.join(self.knowledge_dir, "**/*.txt"), recursive=True)
+    def _load_manifest(self):
+        """Carica il manifest dell'indice (o ne crea uno vuoto)."""
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    return manifest
+                logger.warning("RAG: Manifest di versione diversa, re-indicizzazione.")
+            except Exception as e:
+                logger.warning(f"RAG: Manifest illeggibile ({e}), re-indicizzazione.")
+        return {"version": MANIFEST_VERSION, "files": {}}
 
-        if not files:
+    def _save_manifest(self):
+        """Salva il manifest in modo atomico (tmp + replace)."""
+        tmp_path = self.manifest_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception as e:
+            logger.error(f"RAG Manifest Error: {e}")
+
+    def _upsert_points(self, collection_name, ids, vectors, payloads):
+        """Ogni scrittura sulla collezione passa da qui e avanza la generazione."""
+        self.store.upsert(collection_name, ids, vectors, payloads)
+        self._bump_generation()
+
+    def _delete_points(self, collection_name, ids):
+        """Ogni cancellazione sulla collezione passa da qui e avanza la generazione."""
+        self.store.delete(collection_name, ids)
+        if collection_name == self.collection_name:
+            self.lexical.remove(ids)
+        self._bump_generation()
+
+    def _bump_generation(self):
+        """
+        Nuova generazione dell'indice: i risultati in cache delle generazioni
+        precedenti non vengono più letti e quelli su disco vengono rimossi.
+        """
+        # incr è atomico anche tra processi che condividono rag_cache
+        self.generation = self.cache.incr(GENERATION_KEY)
+        self.result_cache.clear()
+        if self.semantic_cache:
+            self.semantic_cache.clear()
+        self.cache.evict(f"gen{self.generation - 1}")
+
+    def _sync_generation(self):
+        """
+        Rilegge la generazione da rag_cache: un altro processo può averla
+        avanzata. In quel caso le cache in-process (L1, semantica) non sono
+        più valide e vector store e indice lessicale vanno riletti da disco,
+        altrimenti i risultati vecchi finirebbero in L2 sotto la generazione
+        nuova. Ritorna la generazione corrente.
+        """
+        generation = self.cache.get(GENERATION_KEY, 0)
+        if generation != self.generation:
+            logger.debug(f"RAG: Generazione {self.generation} -> {generation}")
+            if self.store:
+                self.store.reload(self.collection_name)
+            self.lexical.load()
+            self.generation = generation
+            self.result_cache.clear()
+            if self.semantic_cache:
+                self.semantic_cache.clear()
+        return generation
+
+    def _upsert_batch(self, batch, vectors):
+        """Stadio finale della pipeline: upsert di un lotto nel vector store (+ BM25)."""
+        for doc_id, _, payload in batch:
+            self.lexical.add(doc_id, payload)
+        self._upsert_points(
+            self.collection_name,
+            [doc_id for doc_id, _, _ in batch],
+            vectors,
+            [payload for _, _, payload in batch],
+        )
+
+    def load_knowledge(self):
+        """
+        Indicizza i file in modo incrementale e in streaming.
+        Solo i file nuovi o modificati vengono ri-embeddati; i frammenti
+        di file modificati o cancellati vengono rimossi dalla collezione.
+        """
+        if not self.store:
             return
 
+        logger.info("RAG: Scansione nuovi documenti...")
+        known = self.manifest["files"]
+        seen, touched, entries = set(), set(), {}
+
+        # Manifest mancante, illeggibile o di un altro chunker: non elenca
+        # con certezza i punti già nella collezione, che va riconciliata.
+        reconcile = self.manifest.get("chunker") != self.chunker.signature
+        if reconcile:
+            # Chunker cambiato: tutti i file vanno ri-frammentati. Gli id
+            # vecchi restano nel manifest per essere rimossi come obsoleti.
+            for entry in known.values():
+                entry["mtime"] = entry["sha256"] = None
+            self.manifest["chunker"] = self.chunker.signature
+
+        if self.ingest_workers is None:
+            from src.profiler import HardwareProfiler
+
+            self.ingest_workers = HardwareProfiler().get_config()["ingest_workers"]
+
+        # scoperta → lettura → chunking: generatori, nessun corpus in memoria
+        docs = prepare_changed(
+            discover_files(self.knowledge_dir),
+            self.knowledge_dir,
+            known,
+            seen,
+            touched,
+            self.chunker,
+            workers=self.ingest_workers,
+        )
+        chunks = chunk_documents(docs, entries)
+
+        pipeline = IngestionPipeline(
+            self.model,
+            self._upsert_batch,
+            encode_batch_size=self.encode_batch_size,
+            upsert_batch_size=self.upsert_batch_size,
+            max_in_flight=self.max_in_flight,
+        )
+
         try:
-            count_before = self.client.count(self.collection_name).count
-        except:
-            count_before = 0
+            # embedding → upsert (con finestra limitata di lotti in volo)
+            indexed = pipeline.run(chunks)
 
-        batch_points = []
+            removed = [rel_path for rel_path in known if rel_path not in seen]
+            if not entries and not removed and not reconcile:
+                if touched:
+                    self._save_manifest()
+                logger.debug(
+                    "RAG: Knowledge base invariata, nessuna re-indicizzazione."
+                )
+                return
 
-        logger.info("RAG: Scansione nuovi documenti...")
-        for file_path in files:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-
-                chunks = text.split("\n\n")
-                for chunk in chunks:
-                    chunk = chunk.strip()
-                    if not chunk:
-                        continue
-
-                    doc_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, chunk))
-                    vector = self.model.encode(chunk).tolist()
-
-                    point = self.models.PointStruct(
-                        id=doc_id,
-                        vector=vector,
-                        payload={"text": chunk, "source": os.path.basename(file_path)},
-                    )
-                    batch_points.append(point)
-            except Exception as e:
-                logger.warning(f"Errore lettura {file_path}: {e}")
+            # Id potenzialmente obsoleti: quelli dei file modificati o rimossi
+            stale_ids = set()
+            for rel_path in removed:
+                stale_ids.update(known.pop(rel_path)["ids"])
+            for rel_path, entry in entries.items():
+                if rel_path in known:
+                    stale_ids.update(known[rel_path]["ids"])
+                known[rel_path] = entry
 
-        if batch_points:
-            try:
-                self.client.upsert(
-                    collection_name=self.collection_name, points=batch_points
+            # Gli id sono uuid5 del testo: un frammento identico può
+            # appartenere a più file, quindi eliminiamo solo gli orfani.
+            referenced = set()
+            for entry in known.values():
+                referenced.update(entry["ids"])
+            if reconcile:
+                # Ogni punto non referenziato dal nuovo manifest è orfano
+                # (es. collezione di una versione senza manifest)
+                stale_ids.update(
+                    doc_id for doc_id, _ in self.store.scroll(self.collection_name)
                 )
-                count_after = self.client.count(self.collection_name).count
-                if count_after > count_before:
-                    logger.success(
-                        f"RAG: +{count_after - count_before} nuovi frammenti indicizzati."
-                    )
-            except Exception as e:
-                logger.error(f"RAG Upsert Error: {e}")
+                stale_ids.update(self.lexical.doc_ids)
+            orphan_ids = list(stale_ids - referenced)
+            if orphan_ids:
+                self._delete_points(self.collection_name, orphan_ids)
 
-    def search(self, query, top_k=3):
-        """Esegue la ricerca vettoriale con Caching."""
-        if not self.client:
-            return []
+            self.store.flush(self.collection_name)
+            self.lexical.commit()
+            # Generazione nuova solo ora che i file sono su disco: gli altri
+            # processi la vedono e rileggono lo stato completo
+            self._bump_generation()
+            self._save_manifest()
+            logger.success(
+                f"RAG: {len(entries)} file indicizzati ({indexed} frammenti), "
+                f"{len(removed)} rimossi, {len(orphan_ids)} frammenti obsoleti eliminati."
+            )
+        except Exception as e:
+            logger.error(f"RAG Upsert Error: {e}")
 
-        # Check cache
-        cache_key = f"search_{query}_{top_k}"
-        if cache_key in self.cache:
+    def _cached_results(self, query, top_k, l1_only=False):
+        """
+        Cerca i risultati nei livelli di cache esatti (L1, poi L2).
+        Ritorna (risultati o None, chiavi da usare per memorizzarli).
+        """
+        # L1: risultati in-process (nessun I/O, nessun unpickling)
+        generation = self.generation
+        keys = (generation, (generation, query, top_k))
+        results = self.result_cache.get(keys[1])
+        if results is not None or l1_only:
+            return results, keys
+
+        # L2: diskcache, chiave nel namespace della generazione corrente
+        # (riletta a ogni accesso: il contatore è condiviso tra processi)
+        if self._sync_generation() != generation:
+            generation = self.generation
+            keys = (generation, (generation, query, top_k))
+        results = self.cache.get(f"search_{generation}_{query}_{top_k}")
+        if results is not None:
             logger.debug(f"RAG: Cache hit for '{query}'")
-            return self.cache[cache_key]
+            self.result_cache.put(keys[1], results)
+        return results, keys
+
+    def _store_results(self, query, top_k, keys, results):
+        generation, l1_key = keys
+        self.result_cache.put(l1_key, results)
+        self.cache.set(
+            f"search_{generation}_{query}_{top_k}", results, tag=f"gen{generation}"
+        )
+
+    @staticmethod
+    def _to_result(payload, score):
+        return {
+            "text": payload["text"],
+            "source": payload["source"],
+            "headings": payload.get("headings", []),
+            "score": score,
+        }
+
+    def _lexical_search(self, query, top_k):
+        """
+        Ricerca BM25. Ritorna (candidati, risultati o None).
+        I risultati sono già pronti (embedder saltato) quando la confidenza
+        lessicale è alta: query di almeno due termini tutti presenti nel
+        primo documento, con scarto netto (`lexical_confidence`) sul secondo.
+        """
+        hits = [
+            hit
+            for hit in self.lexical.search(query, top_k=max(top_k * 3, 10))
+            if hit[3] >= 0.5  # Almeno metà del peso (idf) della query
+        ]
+        if not hits or len(set(tokenize(query))) < 2 or hits[0][3] < 0.999:
+            return hits, None
+        if len(hits) > 1 and hits[0][2] < self.lexical_confidence * hits[1][2]:
+            return hits, None
+        results = [
+            self._to_result(payload, score)
+            for _, payload, score, coverage in hits[:top_k]
+            if coverage >= 0.999
+        ]
+        return hits, results
+
+    def _fuse(self, points, lexical_hits, top_k):
+        """
+        Reciprocal-rank fusion tra risultati vettoriali e BM25.
+        I risultati solo-vettoriali sotto VECTOR_MIN_SCORE vengono scartati;
+        una corrispondenza lessicale li tiene in gara.
+        """
+        lexical_ids = {doc_id for doc_id, _, _, _ in lexical_hits}
+        fused = {}
+        for rank, hit in enumerate(points):
+            doc_id = str(hit.id)
+            if hit.score <= VECTOR_MIN_SCORE and doc_id not in lexical_ids:
+                continue
+            fused[doc_id] = [1.0 / (RRF_K + rank + 1), hit.payload]
+        for rank, (doc_id, payload, _, _) in enumerate(lexical_hits):
+            entry = fused.setdefault(doc_id, [0.0, payload])
+            entry[0] += 1.0 / (RRF_K + rank + 1)
 
+        ranked = sorted(fused.values(), key=lambda e: e[0], reverse=True)
+        return [self._to_result(payload, score) for score, payload in ranked[:top_k]]
+
+    def _prepare_search(self, query, top_k):
+        """
+        Passi che non richiedono l'embedder: cache esatte, poi BM25.
+        Ritorna (risultati o None, chiavi cache, candidati lessicali).
+        """
+        results, keys = self._cached_results(query, top_k)
+        if results is not None:
+            return results, keys, []
+        lexical_hits, results = self._lexical_search(query, top_k)
+        if results is not None:
+            logger.debug(f"RAG: Lexical shortcut for '{query}'")
+            self._store_results(query, top_k, keys, results)
+        return results, keys, lexical_hits
+
+    def _vector_limit(self, top_k):
+        # Più candidati del necessario: la fusione riordina
+        return max(top_k * 3, 10)
+
+    def _search_vector(self, query, query_vector, top_k, keys, lexical_hits=()):
+        """Ricerca a partire dal vettore della query (cache semantica, poi vector store + BM25)."""
         try:
-            query_vector = self.model.encode(query).tolist()
-
-            search_result = self.client.query_points(
-                collection_name=self.collection_name, query=query_vector, limit=top_k
-            ).points
-
-            results = []
-            for hit in search_result:
-                if hit.score > 0.45:
-                    results.append(
-                        {
-                            "text": hit.payload["text"],
-                            "source": hit.payload["source"],
-                            "score": hit.score,
-                        }
-                    )
+            # Cache semantica: query quasi identiche già viste
+            results = self.semantic_cache.get(query_vector, top_k)
+            if results is not None:
+                logger.debug(f"RAG: Semantic cache hit for '{query}'")
+                self._store_results(query, top_k, keys, results)
+                return results
+
+            search_result = self.store.query(
+                self.collection_name, query_vector, self._vector_limit(top_k)
+            )
+
+            results = self._fuse(search_result, lexical_hits, top_k)
             # Store in cache
-            self.cache.set(cache_key, results, expire=3600)  # 1 hour TTL
+            self.semantic_cache.put(query_vector, top_k, results)
+            self._store_results(query, top_k, keys, results)
             return results
         except Exception as e:
             logger.error(f"RAG Search Error (final try): {e}")
             return []
 
+    def search(self, query, top_k=3):
+        """Esegue la ricerca ibrida (vettoriale + BM25) con Caching."""
+        if not self.store:
+            return []
+
+        results, keys, lexical_hits = self._prepare_search(query, top_k)
+        if results is not None:
+            return results
+
+        try:
+            query_vector = self._encode_query(query)
+        except Exception as e:
+            logger.error(f"RAG Search Error (final try): {e}")
+            return []
+        return self._search_vector(query, query_vector, top_k, keys, lexical_hits)
+
+    def search_batch(self, queries, top_k=3):
+        """
+        Ricerca per più query insieme: un solo encode vettorizzato per le
+        query non risolte da cache o BM25 e una sola richiesta batch al vector store.
+        Usa gli stessi livelli di cache di search(); ritorna una lista di
+        risultati nello stesso ordine di `queries`.
+        """
+        if not self.store:
+            return [[] for _ in queries]
+
+        output = [None] * len(queries)
+        pending = {}  # query -> (indici, chiavi cache, candidati lessicali)
+        for i, query in enumerate(queries):
+            if query in pending:
+                pending[query][0].append(i)
+                continue
+            results, keys, lexical_hits = self._prepare_search(query, top_k)
+            if results is not None:
+                output[i] = results
+            else:
+                pending[query] = ([i], keys, lexical_hits)
+
+        try:
+            if pending:
+                texts = list(pending)
+                vectors = self._encode_queries(texts)
+
+                to_search = []
+                for query, vector in zip(texts, vectors):
+                    indexes, keys, _ = pending[query]
+                    results = self.semantic_cache.get(vector, top_k)
+                    if results is not None:
+                        self._store_results(query, top_k, keys, results)
+                        for i in indexes:
+                            output[i] = results
+                    else:
+                        to_search.append((query, vector))
+
+                if to_search:
+                    responses = self.store.query_batch(
+                        self.collection_name,
+                        [vector for _, vector in to_search],
+                        self._vector_limit(top_k),
+                    )
+                    for (query, vector), points in zip(to_search, responses):
+                        indexes, keys, lexical_hits = pending[query]
+                        results = self._fuse(points, lexical_hits, top_k)
+                        self.semantic_cache.put(vector, top_k, results)
+                        self._store_results(query, top_k, keys, results)
+                        for i in indexes:
+                            output[i] = results
+        except Exception as e:
+            logger.error(f"RAG Batch Search Error: {e}")
+
+        return [results if results is not None else [] for results in output]
+
+    def _encode_queries(self, queries):
+        """Embedding di più query con un solo encode (salvo quelle già in L1)."""
+        vectors = [self.vector_cache.get(q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            encoded = self.model.encode(
+                [queries[i] for i in missing],
+                batch_size=self.encode_batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                self.vector_cache.put(queries[i], vector)
+        return vectors
+
+    def embed(self, query):
+        """Embedding della query (memoizzato: la ricerca successiva lo riusa)."""
+        return self._encode_query(query) if self.model else None
+
+    def _encode_query(self, query):
+        """Embedding della query, memoizzato nella L1."""
+        vector = self.vector_cache.get(query)
+        if vector is None:
+            vector = self.model.encode(query)
+            self.vector_cache.put(query, vector)
+        return vector
+
+    def cache_stats(self):
+        """Contatori hit/miss dei livelli di cache."""
+        stats = {
+            "l1_results": self.result_cache.stats(),
+            "l1_vectors": self.vector_cache.stats(),
+        }
+        if self.semantic_cache:
+            stats["semantic"] = self.semantic_cache.stats()
+        return stats
+
     def close(self):
         """Chiude la connessione al DB in modo pulito."""
-        if self.client:
+        if self.store:
             try:
                 # Evita errori se Python sta chiudendo (sys.meta_path None)
                 import sys
 
                 if sys.meta_path is None:
                     return
-                self.client.close()
+                self.store.close()
             except:
                 pass
             finally:
-                self.client = None
+                self.store = None
+
+
+class AsyncRagEngine:
+    """
+    Interfaccia asincrona sopra RagEngine per il server FastAPI.
+
+    - L'encode delle query passa da un EmbeddingWorker dedicato: query
+      concorrenti che arrivano entro `window_ms` vengono embeddate con un
+      solo `encode` (micro-batching).
+    - Lookup su diskcache e ricerca vettoriale girano in un pool di thread,
+      quindi l'event loop non viene mai bloccato.
+    """
+
+    def __init__(self, rag, max_batch=32, window_ms=5.0, io_workers=4):
+        self.rag = rag
+        self.worker = (
+            EmbeddingWorker(rag.model, max_batch=max_batch, window_ms=window_ms)
+            if rag.model
+            else None
+        )
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=io_workers, thread_name_prefix="rag-io"
+        )
+
+    async def _embed(self, query):
+        vector = self.rag.vector_cache.get(query)
+        if vector is None:
+            vector = await asyncio.wrap_future(self.worker.submit(query))
+            self.rag.vector_cache.put(query, vector)
+        return vector
+
+    async def embed(self, query):
+        """Embedding della query (memoizzato: la ricerca successiva lo riusa)."""
+        if not self.worker:
+            return None
+        return await self._embed(query)
+
+    def encode_texts(self, texts):
+        """
+        Embedding di più testi dal thread chiamante (bloccante), accodati
+        insieme all'EmbeddingWorker: finiscono nello stesso micro-batch
+        delle query invece di contendersi il modello con un encode a parte.
+        """
+        futures = [self.worker.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    async def search(self, query, top_k=3):
+        """Come RagEngine.search, ma awaitable."""
+        if not self.rag.store or not self.worker:
+            return []
+
+        # L1 senza I/O direttamente sull'event loop
+        results, keys = self.rag._cached_results(query, top_k, l1_only=True)
+        if results is not None:
+            return results
+
+        loop = asyncio.get_running_loop()
+        results, keys, lexical_hits = await loop.run_in_executor(
+            self._io_pool, self.rag._prepare_search, query, top_k
+        )
+        if results is not None:
+            return results
+
+        try:
+            query_vector = await self._embed(query)
+        except Exception as e:
+            logger.error(f"RAG Search Error (final try): {e}")
+            return []
+        return await loop.run_in_executor(
+            self._io_pool,
+            self.rag._search_vector,
+            query,
+            query_vector,
+            top_k,
+            keys,
+            lexical_hits,
+        )
+
+    async def search_many(self, queries, top_k=3):
+        """Ricerca di più query: un encode e una richiesta batch al vector store."""
+        if not self.rag.store:
+            return [[] for _ in queries]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._io_pool, self.rag.search_batch, list(queries), top_k
+        )
+
+    def close(self):
+        if self.worker:
+            self.worker.stop()
+        self._io_pool.shutdown(wait=False)
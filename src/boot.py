@@ -0,0 +1,103 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from loguru import logger
+
+
+class _Component:
+    def __init__(self, name, loader, after):
+        self.name = name
+        self.loader = loader
+        self.after = tuple(after)
+        self.future = Future()
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+
+
+class StagedBoot:
+    """
+    Avvio a stadi dei componenti pesanti (modelli, indici).
+
+    Ogni componente ha un loader e le proprie dipendenze (`after`); tutti
+    partono subito in thread separati e ognuno attende solo ciò da cui
+    dipende. Il server accetta richieste da subito: ogni endpoint aspetta
+    (`await boot.wait(...)`) solo i componenti che gli servono.
+    """
+
+    def __init__(self):
+        self._components = {}
+
+    def add(self, name, loader, after=()):
+        """Registra un componente. `loader(*valori_dipendenze)` ne ritorna il valore."""
+        self._components[name] = _Component(name, loader, after)
+
+    def start(self):
+        for component in self._components.values():
+            threading.Thread(
+                target=self._load,
+                args=(component,),
+                name=f"boot-{component.name}",
+                daemon=True,
+            ).start()
+
+    def _load(self, component):
+        try:
+            deps = [self._components[dep].future.result() for dep in component.after]
+        except Exception as e:
+            component.state = "failed"
+            component.error = f"dipendenza fallita: {e}"
+            component.future.set_exception(e)
+            return
+
+        component.state = "loading"
+        t0 = time.perf_counter()
+        try:
+            value = component.loader(*deps)
+        except Exception as e:
+            component.state = "failed"
+            component.error = str(e)
+            logger.error(f"Boot: {component.name} fallito ({e})")
+            component.future.set_exception(e)
+            return
+        component.seconds = round(time.perf_counter() - t0, 2)
+        component.future.set_result(value)
+        component.state = "ready"
+        logger.success(f"Boot: {component.name} pronto in {component.seconds}s")
+
+    def ready(self, name):
+        return self._components[name].state == "ready"
+
+    def get(self, name):
+        """Valore del componente se pronto, altrimenti None (non blocca)."""
+        component = self._components[name]
+        return component.future.result() if component.state == "ready" else None
+
+    async def wait(self, name, timeout=None):
+        """Attende il componente senza bloccare l'event loop; solleva se fallisce."""
+        future = asyncio.wrap_future(self._components[name].future)
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def status(self):
+        return {
+            name: {
+                "state": c.state,
+                "seconds": c.seconds,
+                **({"error": c.error} if c.error else {}),
+            }
+            for name, c in self._components.items()
+        }
+
+    @property
+    def all_ready(self):
+        return all(c.state == "ready" for c in self._components.values())
+
+    def values(self):
+        """Valori dei componenti già pronti (per lo shutdown)."""
+        return {
+            name: c.future.result()
+            for name, c in self._components.items()
+            if c.state == "ready"
+        }
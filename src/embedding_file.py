@@ -0,0 +1,127 @@
+import os
+import json
+import mmap
+import struct
+
+import numpy as np
+
+# Formato binario degli embedding (little-endian, sezioni allineate a 64 byte):
+#   header   magic "CDEM", versione, codice dtype, dim, count, larghezza id
+#   ids      count * id_width byte ASCII (padding con \0)
+#   matrix   count * dim valori del dtype
+EMBEDDINGS_MAGIC = b"CDEM"
+# Blob dei payload: header, offsets uint64[count + 1], JSON UTF-8 concatenati
+PAYLOADS_MAGIC = b"CDPL"
+FORMAT_VERSION = 1
+ALIGN = 64
+
+_EMB_HEADER = struct.Struct("<4sHHIQI")
+_PAY_HEADER = struct.Struct("<4sHxxQ")
+DTYPE_CODES = {"float32": 1, "float16": 2}
+_CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _write_padding(f, offset):
+    f.write(b"\0" * (_aligned(offset) - offset))
+    return _aligned(offset)
+
+
+def write_collection(directory, ids, matrix, payloads):
+    """
+    Scrive embeddings.bin e payloads.bin in modo atomico (tmp + replace).
+    `matrix` è (count, dim) nel dtype di destinazione.
+    """
+    os.makedirs(directory, exist_ok=True)
+    count, dim = matrix.shape
+    encoded_ids = [doc_id.encode("ascii") for doc_id in ids]
+    id_width = max((len(doc_id) for doc_id in encoded_ids), default=1)
+
+    emb_tmp = os.path.join(directory, "embeddings.tmp.bin")
+    with open(emb_tmp, "wb") as f:
+        f.write(
+            _EMB_HEADER.pack(
+                EMBEDDINGS_MAGIC,
+                FORMAT_VERSION,
+                DTYPE_CODES[matrix.dtype.name],
+                dim,
+                count,
+                id_width,
+            )
+        )
+        offset = _write_padding(f, _EMB_HEADER.size)
+        f.write(np.array(encoded_ids, dtype=f"S{id_width}").tobytes())
+        offset = _write_padding(f, offset + count * id_width)
+        f.write(np.ascontiguousarray(matrix).tobytes())
+
+    pay_tmp = os.path.join(directory, "payloads.tmp.bin")
+    blobs = [
+        json.dumps(payload, ensure_ascii=False).encode("utf-8") for payload in payloads
+    ]
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(blob) for blob in blobs], dtype=np.uint64)
+    with open(pay_tmp, "wb") as f:
+        f.write(_PAY_HEADER.pack(PAYLOADS_MAGIC, FORMAT_VERSION, count))
+        f.write(offsets.tobytes())
+        for blob in blobs:
+            f.write(blob)
+
+    # I payload prima: un crash a metà lascia count diversi (rilevato in apertura)
+    os.replace(pay_tmp, os.path.join(directory, "payloads.bin"))
+    os.replace(emb_tmp, os.path.join(directory, "embeddings.bin"))
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedCollection:
+    """
+    Collezione aperta in sola lettura via mmap, senza copie:
+    `matrix` e `ids` sono viste NumPy sulle pagine del file, condivise
+    dal page cache tra tutti i processi che aprono lo stesso store.
+    I payload vengono decodificati solo quando servono (`payload(i)`).
+    """
+
+    def __init__(self, directory):
+        self._emb = _map(os.path.join(directory, "embeddings.bin"))
+        magic, version, dtype_code, dim, count, id_width = _EMB_HEADER.unpack_from(
+            self._emb
+        )
+        if magic != EMBEDDINGS_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"embeddings.bin non valido ({magic!r} v{version})")
+        self.dim = dim
+        self.count = count
+        self.dtype = np.dtype(_CODE_DTYPES[dtype_code])
+
+        offset = _aligned(_EMB_HEADER.size)
+        self.ids = np.frombuffer(
+            self._emb, dtype=f"S{id_width}", count=count, offset=offset
+        )
+        offset = _aligned(offset + count * id_width)
+        self.matrix = np.frombuffer(
+            self._emb, dtype=self.dtype, count=count * dim, offset=offset
+        ).reshape(count, dim)
+
+        self._pay = _map(os.path.join(directory, "payloads.bin"))
+        magic, version, pay_count = _PAY_HEADER.unpack_from(self._pay)
+        if magic != PAYLOADS_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"payloads.bin non valido ({magic!r} v{version})")
+        if pay_count != count:
+            raise ValueError(f"count incoerenti: {count} vettori, {pay_count} payload")
+        self.offsets = np.frombuffer(
+            self._pay, dtype=np.uint64, count=count + 1, offset=_PAY_HEADER.size
+        )
+        self._blob_start = _PAY_HEADER.size + (count + 1) * 8
+
+    def doc_id(self, i):
+        return self.ids[i].decode("ascii")
+
+    def payload(self, i):
+        start = self._blob_start + int(self.offsets[i])
+        end = self._blob_start + int(self.offsets[i + 1])
+        return json.loads(self._pay[start:end])
@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from loguru import logger
+
+
+class EmbeddingWorker:
+    """
+    Thread dedicato che possiede le chiamate a `model.encode`.
+
+    Le richieste arrivano in coda; il worker prende la prima e aspetta al
+    massimo `window_ms` per raccoglierne altre (fino a `max_batch`), poi
+    esegue UN solo encode vettorizzato per tutto il lotto (micro-batching).
+    Ogni richiesta riceve un Future con il proprio vettore.
+    """
+
+    def __init__(self, model, max_batch=32, window_ms=5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="rag-embedder", daemon=True
+        )
+        self.batches = 0
+        self.requests = 0
+        self._thread.start()
+
+    def submit(self, text):
+        """Accoda un testo; ritorna un concurrent.futures.Future col vettore."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop richiesto: serviamo il lotto corrente e poi usciamo
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.model.encode(
+                    texts,
+                    batch_size=len(texts),
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                logger.error(f"RAG Embedding Error: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stop(self):
+        """Ferma il worker dopo aver servito le richieste già in coda."""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,266 @@
+import os
+import glob
+import uuid
+import queue
+import hashlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+
+def discover_files(knowledge_dir, patterns=("**/*.md", "**/*.txt")):
+    """Scoperta file: generatore di path, nessuna lista in memoria."""
+    for pattern in patterns:
+        yield from glob.iglob(os.path.join(knowledge_dir, pattern), recursive=True)
+
+
+def prepare_file(file_path, chunker, known_sha256=None):
+    """
+    Lavoro per singolo file (eseguito anche nei processi worker):
+    lettura, hash, decodifica e chunking con `chunker`.
+    Se l'hash coincide con `known_sha256` il file non va re-indicizzato
+    e `chunks` è None.
+    """
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    if digest == known_sha256:
+        return {"sha256": digest, "chunks": None}
+
+    chunks = [
+        (str(uuid.uuid5(uuid.NAMESPACE_DNS, embedding_text(chunk))), chunk)
+        for chunk in chunker.chunk(raw.decode("utf-8"))
+    ]
+    return {"sha256": digest, "chunks": chunks}
+
+
+def embedding_text(chunk):
+    """Testo da embeddare: percorso dei titoli + corpo del frammento."""
+    if chunk["headings"]:
+        return " > ".join(chunk["headings"]) + "\n" + chunk["text"]
+    return chunk["text"]
+
+
+def _iter_candidates(files, knowledge_dir, known, seen):
+    """Filtra via stat i file invariati (mtime e size uguali al manifest)."""
+    for file_path in files:
+        rel_path = os.path.relpath(file_path, knowledge_dir)
+        seen.add(rel_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logger.warning(f"Errore lettura {file_path}: {e}")
+            continue
+        entry = known.get(rel_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+        yield file_path, rel_path, stat, entry
+
+
+def _finish(candidate, result, touched):
+    """Converte il risultato di prepare_file in documento (o None se invariato)."""
+    file_path, rel_path, stat, entry = candidate
+    if result["chunks"] is None:
+        # Solo "touch": aggiorniamo i metadati senza re-embedding
+        entry["mtime"] = stat.st_mtime
+        entry["size"] = stat.st_size
+        touched.add(rel_path)
+        return None
+    return {
+        "rel_path": rel_path,
+        "path": file_path,
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": result["sha256"],
+        "chunks": result["chunks"],
+    }
+
+
+def _known_sha(candidate):
+    entry = candidate[3]
+    return entry["sha256"] if entry else None
+
+
+def _collect(item, touched):
+    candidate, future = item
+    try:
+        return _finish(candidate, future.result(), touched)
+    except Exception as e:
+        logger.warning(f"Errore lettura {candidate[0]}: {e}")
+        return None
+
+
+def prepare_changed(
+    files,
+    knowledge_dir,
+    known,
+    seen,
+    touched,
+    chunker,
+    workers=1,
+    parallel_threshold=256,
+):
+    """
+    Lettura + chunking: produce solo i documenti nuovi o modificati
+    rispetto al manifest, già divisi in frammenti.
+
+    Con `workers > 1` e almeno `parallel_threshold` file da elaborare il
+    lavoro viene distribuito su un pool di processi; le richieste in volo
+    sono limitate a `4 * workers` per non accumulare risultati in memoria.
+    `seen` raccoglie i path relativi visti; `touched` quelli con solo mtime nuovo.
+    """
+    candidates = _iter_candidates(files, knowledge_dir, known, seen)
+    head = list(itertools.islice(candidates, parallel_threshold))
+
+    if workers <= 1 or len(head) < parallel_threshold:
+        # Pochi file: il costo di avvio del pool non si ripaga
+        for candidate in itertools.chain(head, candidates):
+            try:
+                result = prepare_file(candidate[0], chunker, _known_sha(candidate))
+            except Exception as e:
+                logger.warning(f"Errore lettura {candidate[0]}: {e}")
+                continue
+            doc = _finish(candidate, result, touched)
+            if doc:
+                yield doc
+        return
+
+    window = 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for candidate in itertools.chain(head, candidates):
+            pending.append(
+                (
+                    candidate,
+                    pool.submit(
+                        prepare_file, candidate[0], chunker, _known_sha(candidate)
+                    ),
+                )
+            )
+            if len(pending) >= window:
+                doc = _collect(pending.popleft(), touched)
+                if doc:
+                    yield doc
+        while pending:
+            doc = _collect(pending.popleft(), touched)
+            if doc:
+                yield doc
+
+
+def chunk_documents(docs, entries):
+    """
+    Produce (id, testo da embeddare, payload) per ogni frammento dei
+    documenti preparati. Alla fine di ogni documento registra la sua voce
+    di manifest in `entries`. I frammenti già prodotti (stesso uuid5)
+    non vengono riemessi.
+    """
+    emitted = set()
+    for doc in docs:
+        source = os.path.basename(doc["path"])
+        for doc_id, chunk in doc["chunks"]:
+            if doc_id not in emitted:
+                emitted.add(doc_id)
+                payload = {
+                    "text": chunk["text"],
+                    "source": source,
+                    "headings": chunk["headings"],
+                }
+                yield doc_id, embedding_text(chunk), payload
+
+        entries[doc["rel_path"]] = {
+            "mtime": doc["mtime"],
+            "size": doc["size"],
+            "sha256": doc["sha256"],
+            "ids": [doc_id for doc_id, _ in doc["chunks"]],
+        }
+
+
+def batched(items, size):
+    """Raggruppa un iterabile in liste di al massimo `size` elementi."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestionPipeline:
+    """
+    Pipeline di ingestion in streaming:
+    scoperta → lettura → chunking → embedding → upsert.
+
+    Ogni stadio è un generatore, quindi in memoria c'è solo il lavoro
+    corrente. Embedding e upsert girano in parallelo (thread dedicato
+    all'upsert) e sono collegati da una coda limitata a `max_in_flight`
+    lotti: se Qdrant è più lento dell'encoder, l'encoder si ferma.
+    """
+
+    def __init__(
+        self,
+        model,
+        upsert_fn,
+        encode_batch_size=64,
+        upsert_batch_size=256,
+        max_in_flight=2,
+    ):
+        self.model = model
+        self.upsert_fn = upsert_fn
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_in_flight = max(1, max_in_flight)
+
+    def _upsert_worker(self, in_flight, state):
+        while True:
+            item = in_flight.get()
+            if item is None:
+                return
+            if state["error"] is not None:
+                # Dopo un errore scartiamo il resto (il producer si fermerà)
+                continue
+            batch, vectors = item
+            try:
+                self.upsert_fn(batch, vectors)
+                state["count"] += len(batch)
+            except Exception as e:
+                state["error"] = e
+
+    def run(self, chunks):
+        """
+        Consuma un iterabile di (id, testo da embeddare, payload).
+        Ritorna il numero di frammenti indicizzati; rilancia l'errore
+        dell'upsert se uno dei lotti fallisce.
+        """
+        in_flight = queue.Queue(maxsize=self.max_in_flight)
+        state = {"count": 0, "error": None}
+        worker = threading.Thread(
+            target=self._upsert_worker,
+            args=(in_flight, state),
+            name="rag-upsert",
+            daemon=True,
+        )
+        worker.start()
+
+        try:
+            for batch in batched(chunks, self.upsert_batch_size):
+                if state["error"] is not None:
+                    break
+                vectors = self.model.encode(
+                    [text for _, text, _ in batch],
+                    batch_size=self.encode_batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+                # Backpressure: blocca se ci sono già max_in_flight lotti in coda
+                in_flight.put((batch, vectors))
+        finally:
+            in_flight.put(None)
+            worker.join()
+
+        if state["error"] is not None:
+            raise state["error"]
+        return state["count"]
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_state_bytes(metadata, n_ctx, n_vocab):
+    """
+    Byte di uno stato salvato a contesto pieno (KV cache f16, logits
+    dell'ultima posizione nello stato llama.cpp e in `scores`, token),
+    dai metadati GGUF. None se i metadati non bastano.
+    """
+    arch = metadata.get("general.architecture")
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_embd = int(metadata[f"{arch}.embedding_length"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    except (KeyError, TypeError, ValueError):
+        return None
+    kv_per_token = 2 * n_layer * n_head_kv * (n_embd // n_head) * 2  # K e V in f16
+    return n_ctx * kv_per_token + 2 * n_vocab * 4 + n_ctx * 4
+
+
+def prefix_hash(tokens):
+    """Hash stabile di una sequenza di token."""
+    return hashlib.blake2b(
+        np.asarray(tokens, dtype=np.int32).tobytes(), digest_size=16
+    ).digest()
+
+
+class PrefixStateCache:
+    """
+    Cache degli stati llama.cpp (KV cache + logits) per prefisso di token.
+
+    Implementa il protocollo di cache di `Llama.set_cache`: prima di una
+    completion llama.cpp chiede lo stato salvato per il prompt (il prefisso
+    più lungo disponibile) e lo ripristina, così valuta solo i token nuovi;
+    a fine generazione salva lo stato per prompt + risposta.
+
+    Le chiavi sono prompt + risposta di una completion: un turno nuovo
+    della stessa conversazione ne è un'estensione e riparte da lì. Sessioni
+    diverse non condividono voci (la chiave include la risposta).
+
+    Le voci sono indicizzate per (lunghezza, hash del prefisso): una
+    ricerca calcola un hash per ciascuna lunghezza memorizzata, dalla più
+    lunga, invece di confrontare token per token ogni voce.
+    Degli `scores` (logits per posizione, fino a n_batch x vocab float32,
+    centinaia di MB) si conserva solo l'ultima riga: `load_state` la
+    ripropone su tutte le righe e la generazione riparte valutando almeno
+    un token nuovo, quindi le righe precedenti non servono.
+    LRU limitata a `capacity_bytes` (stato serializzato + logits + token);
+    uno stato più grande dell'intero budget non viene memorizzato.
+    """
+
+    def __init__(self, capacity_bytes=512 * 1024**2):
+        self.capacity_bytes = capacity_bytes
+        self._states = OrderedDict()  # (lunghezza, hash) -> stato
+        self._lengths = {}  # lunghezza -> numero di voci
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _state_size(state):
+        """
+        Byte occupati da un LlamaState: stato llama.cpp serializzato più
+        `scores` (logits, fino a n_batch x vocab float32, n_ctx x vocab con
+        logits_all) e `input_ids`, che possono superare la KV cache stessa.
+        """
+        size = getattr(state, "llama_state_size", None)
+        if size is None:
+            size = len(getattr(state, "llama_state", b""))
+        for name in ("scores", "input_ids"):
+            array = getattr(state, name, None)
+            size += getattr(array, "nbytes", 0)
+        return size
+
+    @property
+    def cache_size(self):
+        return self._size
+
+    def _find(self, tokens):
+        for length in sorted(self._lengths, reverse=True):
+            if length <= len(tokens):
+                key = (length, prefix_hash(tokens[:length]))
+                if key in self._states:
+                    return key
+        return None
+
+    def __getitem__(self, tokens):
+        with self._lock:
+            key = self._find(tokens)
+            if key is None:
+                self.misses += 1
+                raise KeyError("Nessun prefisso in cache")
+            self._states.move_to_end(key)
+            self.hits += 1
+            return self._states[key]
+
+    def __contains__(self, tokens):
+        with self._lock:
+            return self._find(tokens) is not None
+
+    @staticmethod
+    def _compact(state):
+        """Riduce `scores` all'ultima riga (in place sullo stato appena salvato)."""
+        scores = getattr(state, "scores", None)
+        if scores is not None and getattr(scores, "ndim", 0) == 2 and len(scores) > 1:
+            state.scores = scores[-1:].copy()
+        return state
+
+    def __setitem__(self, tokens, state):
+        state = self._compact(state)
+        size = self._state_size(state)
+        if size > self.capacity_bytes:
+            return
+        key = (len(tokens), prefix_hash(tokens))
+        with self._lock:
+            if key in self._states:
+                self._drop(key)
+            self._states[key] = state
+            self._lengths[key[0]] = self._lengths.get(key[0], 0) + 1
+            self._size += size
+            while self._size > self.capacity_bytes:
+                self._drop(next(iter(self._states)))
+
+    def _drop(self, key):
+        state = self._states.pop(key)
+        self._size -= self._state_size(state)
+        self._lengths[key[0]] -= 1
+        if not self._lengths[key[0]]:
+            del self._lengths[key[0]]
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._lengths.clear()
+            self._size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._states),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import threading
+
+import numpy as np
+from loguru import logger
+
+WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Token lessicali: parole minuscole (identificatori come `@Transactional` -> transactional)."""
+    return WORD_RE.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    Indice invertito BM25 in-process, compatto.
+
+    Le posting list sono array NumPy contigui in formato CSR:
+    `offsets[t]:offsets[t+1]` delimita, in `post_docs` / `post_tf`, i
+    documenti che contengono il termine `t` e la relativa frequenza.
+    I documenti (id Qdrant + payload) stanno in una tabella a parte.
+
+    Gli aggiornamenti (`add` / `remove`) toccano solo la tabella documenti;
+    `commit()` ricostruisce le posting list e salva su disco.
+    """
+
+    def __init__(self, path, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._docs = {}  # id -> payload (tabella documenti, modificabile)
+        self._lock = threading.Lock()
+        self._reset_arrays()
+        self.load()
+
+    def _reset_arrays(self):
+        self.doc_ids = []
+        self.payloads = []
+        self.vocab = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.avg_len = 0.0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    # --- Aggiornamenti -------------------------------------------------
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+
+    def add(self, doc_id, payload):
+        with self._lock:
+            self._docs[str(doc_id)] = payload
+
+    def remove(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._docs.pop(str(doc_id), None)
+
+    def commit(self):
+        """Ricostruisce le posting list dalla tabella documenti e salva."""
+        with self._lock:
+            docs = list(self._docs.items())
+
+        postings = {}
+        doc_len = np.zeros(len(docs), dtype=np.float32)
+        for i, (_, payload) in enumerate(docs):
+            tokens = tokenize(self._indexed_text(payload))
+            doc_len[i] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((i, tf))
+
+        vocab = {}
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        post_docs, post_tf = [], []
+        for term_id, (token, plist) in enumerate(postings.items()):
+            vocab[token] = term_id
+            offsets[term_id + 1] = offsets[term_id] + len(plist)
+            post_docs.extend(d for d, _ in plist)
+            post_tf.extend(tf for _, tf in plist)
+
+        with self._lock:
+            # Sostituzione in blocco: le ricerche concorrenti vedono
+            # sempre un indice coerente (vecchio o nuovo)
+            self.doc_ids = [doc_id for doc_id, _ in docs]
+            self.payloads = [payload for _, payload in docs]
+            self.vocab = vocab
+            self.offsets = offsets
+            self.post_docs = np.asarray(post_docs, dtype=np.int32)
+            self.post_tf = np.asarray(post_tf, dtype=np.float32)
+            self.doc_len = doc_len
+            self._finalize()
+        self.save()
+
+    @staticmethod
+    def _indexed_text(payload):
+        return " ".join(payload.get("headings", [])) + "\n" + payload["text"]
+
+    def _finalize(self):
+        n_docs = len(self.doc_ids)
+        self.avg_len = float(self.doc_len.mean()) if n_docs else 0.0
+        df = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    # --- Persistenza ---------------------------------------------------
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            np.savez(
+                os.path.join(self.path, "postings.tmp.npz"),
+                offsets=self.offsets,
+                post_docs=self.post_docs,
+                post_tf=self.post_tf,
+                doc_len=self.doc_len,
+            )
+            with open(
+                os.path.join(self.path, "docs.tmp.json"), "w", encoding="utf-8"
+            ) as f:
+                json.dump(
+                    {
+                        "vocab": list(self.vocab),
+                        "doc_ids": self.doc_ids,
+                        "payloads": self.payloads,
+                    },
+                    f,
+                )
+            os.replace(
+                os.path.join(self.path, "postings.tmp.npz"),
+                os.path.join(self.path, "postings.npz"),
+            )
+            os.replace(
+                os.path.join(self.path, "docs.tmp.json"),
+                os.path.join(self.path, "docs.json"),
+            )
+        except Exception as e:
+            logger.error(f"RAG Lexical Index Save Error: {e}")
+
+    def load(self):
+        postings_path = os.path.join(self.path, "postings.npz")
+        docs_path = os.path.join(self.path, "docs.json")
+        if not (os.path.exists(postings_path) and os.path.exists(docs_path)):
+            return
+        try:
+            with np.load(postings_path) as data:
+                offsets = data["offsets"]
+                post_docs = data["post_docs"]
+                post_tf = data["post_tf"]
+                doc_len = data["doc_len"]
+            with open(docs_path, "r", encoding="utf-8") as f:
+                docs = json.load(f)
+        except Exception as e:
+            logger.warning(
+                f"RAG: Indice lessicale illeggibile ({e}), verrà ricostruito."
+            )
+            return
+
+        with self._lock:
+            # Come in commit: le ricerche concorrenti vedono un indice coerente
+            self.vocab = {token: i for i, token in enumerate(docs["vocab"])}
+            self.doc_ids = docs["doc_ids"]
+            self.payloads = docs["payloads"]
+            self.offsets, self.post_docs, self.post_tf = offsets, post_docs, post_tf
+            self.doc_len = doc_len
+            self._docs = dict(zip(self.doc_ids, self.payloads))
+            self._finalize()
+
+    # --- Ricerca -------------------------------------------------------
+
+    def search(self, query, top_k=10):
+        """
+        Ritorna [(id, payload, score_bm25, coverage)] ordinati per score.
+        `coverage` è la frazione di idf della query coperta dal documento
+        (1.0 = tutti i termini presenti).
+        """
+        with self._lock:
+            vocab, doc_ids, payloads = self.vocab, self.doc_ids, self.payloads
+            offsets, post_docs, post_tf = self.offsets, self.post_docs, self.post_tf
+            doc_len, idf_table, avg_len = self.doc_len, self.idf, self.avg_len
+
+        terms = [vocab.get(token) for token in dict.fromkeys(tokenize(query))]
+        if not terms or not doc_ids:
+            return []
+
+        n_docs = len(doc_ids)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        matched = np.zeros(n_docs, dtype=np.float32)
+        # Termini sconosciuti: pesano come il termine più raro possibile
+        unknown_idf = float(np.log(1.0 + (n_docs + 0.5) / 0.5))
+        total_idf = 0.0
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len / (avg_len or 1.0))
+
+        for term_id in terms:
+            if term_id is None:
+                total_idf += unknown_idf
+                continue
+            idf = idf_table[term_id]
+            total_idf += float(idf)
+            start, end = offsets[term_id], offsets[term_id + 1]
+            docs = post_docs[start:end]
+            tf = post_tf[start:end]
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm[docs])
+            matched[docs] += idf
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        if len(candidates) > top_k:
+            top = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            (
+                doc_ids[i],
+                payloads[i],
+                float(scores[i]),
+                float(matched[i] / total_idf) if total_idf else 0.0,
+            )
+            for i in candidates
+        ]
@@ -0,0 +1,186 @@
+import gc
+import time
+import threading
+from contextlib import contextmanager
+
+import psutil
+from loguru import logger
+
+
+class _Slot:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.model = None
+        self.in_use = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.lock = threading.Lock()  # Serializza il caricamento del modello
+
+
+class ModelResidency:
+    """
+    Gestore della residenza in RAM dei modelli.
+
+    Politiche (scelte da HardwareProfiler in base alla RAM):
+    - "resident": i modelli restano caricati (comportamento Godmode).
+    - "on_demand": ogni modello si carica al primo uso e viene scaricato
+      dopo `idle_seconds` di inattività, oppure subito se la RAM libera
+      scende sotto `min_free_gb` o i modelli caricati superano `max_resident`.
+
+    Un modello in uso (`with residency.use(name)`) non viene mai scaricato.
+    I loader dovrebbero usare mmap: un ricaricamento legge le pagine del
+    GGUF dal page cache invece che dal disco.
+    """
+
+    def __init__(
+        self,
+        policy="resident",
+        idle_seconds=600,
+        min_free_gb=1.0,
+        max_resident=None,
+        check_interval=None,
+    ):
+        if policy not in ("resident", "on_demand"):
+            raise ValueError(f"Politica sconosciuta: {policy}")
+        self.policy = policy
+        self.idle_seconds = idle_seconds
+        self.min_free_gb = min_free_gb
+        self.max_resident = max_resident
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+        if policy == "on_demand":
+            interval = check_interval or max(1.0, min(30.0, idle_seconds / 4))
+            self._reaper = threading.Thread(
+                target=self._reap_loop,
+                args=(interval,),
+                name="model-residency",
+                daemon=True,
+            )
+            self._reaper.start()
+
+    def register(self, name, loader):
+        """`loader()` crea e ritorna il modello (es. un'istanza Llama)."""
+        self._slots[name] = _Slot(name, loader)
+
+    def peek(self, name):
+        """Il modello se già in RAM, altrimenti None (non carica)."""
+        return self._slots[name].model
+
+    def load(self, name):
+        """Carica il modello se necessario e lo ritorna."""
+        slot = self._slots[name]
+        with slot.lock:
+            if slot.model is None:
+                self._make_room(exclude=name)
+                t0 = time.perf_counter()
+                slot.model = slot.loader()
+                slot.loads += 1
+                logger.info(
+                    f"Residency: {name} caricato in {time.perf_counter() - t0:.1f}s"
+                )
+            slot.last_used = time.monotonic()
+            return slot.model
+
+    @contextmanager
+    def use(self, name):
+        """Presta il modello per la durata del blocco (non scaricabile nel frattempo)."""
+        slot = self._slots[name]
+        with self._lock:
+            slot.in_use += 1
+        try:
+            yield self.load(name)
+        finally:
+            with self._lock:
+                slot.in_use -= 1
+                slot.last_used = time.monotonic()
+
+    def _memory_pressure(self):
+        available_gb = psutil.virtual_memory().available / (1024**3)
+        return available_gb < self.min_free_gb
+
+    def _evictable(self, exclude=None):
+        """Modelli caricati e non in uso, dal meno usato di recente."""
+        with self._lock:
+            slots = [
+                s
+                for s in self._slots.values()
+                if s.model is not None and not s.in_use and s.name != exclude
+            ]
+        return sorted(slots, key=lambda s: s.last_used)
+
+    def _resident_count(self):
+        return sum(1 for s in self._slots.values() if s.model is not None)
+
+    def _make_room(self, exclude):
+        """Prima di un caricamento: libera RAM scaricando modelli inattivi."""
+        if self.policy == "resident":
+            return
+        for slot in self._evictable(exclude):
+            over_limit = (
+                self.max_resident is not None
+                and self._resident_count() >= self.max_resident
+            )
+            if not (over_limit or self._memory_pressure()):
+                break
+            self.evict(slot.name, reason="spazio per " + exclude)
+
+    def evict(self, name, reason="richiesta"):
+        """Scarica il modello se non è in uso. Ritorna True se scaricato."""
+        slot = self._slots[name]
+        # Un modello in caricamento non si tocca (ed evita attese incrociate)
+        if not slot.lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if slot.model is None or slot.in_use:
+                    return False
+                model, slot.model = slot.model, None
+            close = getattr(model, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    pass
+            del model
+            gc.collect()
+        finally:
+            slot.lock.release()
+        logger.info(f"Residency: {name} scaricato ({reason})")
+        return True
+
+    def _reap_loop(self, interval):
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            for slot in self._evictable():
+                if now - slot.last_used >= self.idle_seconds:
+                    self.evict(slot.name, reason="inattivo")
+                elif self._memory_pressure():
+                    self.evict(slot.name, reason="RAM sotto soglia")
+                elif (
+                    self.max_resident is not None
+                    and self._resident_count() > self.max_resident
+                ):
+                    # Eccedenza rimasta da un caricamento con l'altro modello in uso
+                    self.evict(slot.name, reason="limite modelli residenti")
+
+    def stats(self):
+        return {
+            name: {
+                "loaded": s.model is not None,
+                "in_use": s.in_use,
+                "loads": s.loads,
+                "idle_s": (
+                    round(time.monotonic() - s.last_used, 1) if s.last_used else None
+                ),
+            }
+            for name, s in self._slots.items()
+        }
+
+    def close(self):
+        """Ferma il reaper e scarica tutti i modelli."""
+        self._stop.set()
+        for name in self._slots:
+            self.evict(name, reason="chiusura")
@@ -0,0 +1,237 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from loguru import logger
+
+KNOWLEDGE_HEADER = "=== KNOWLEDGE BASE ==="
+WEB_HEADER = "=== WEB RESULTS ==="
+WEB_MEMORY_HEADER = "=== WEB RESULTS (RECENTI) ==="
+
+# Scadenze per sorgente (secondi): oltre, si genera con quello che è arrivato
+RAG_DEADLINE_SECONDS = 5.0
+WEB_DEADLINE_SECONDS = 3.0
+
+
+class Source:
+    """
+    Sorgente di contesto per il prompt (RAG, web, ...).
+    `search(query) -> risultati`; `text(risultato) -> frammento` per il prompt.
+    `deadline`: secondi concessi alla sorgente (None = nessun limite).
+    `vector`: `search(query, vector)` riceve anche l'embedding della query
+    calcolato dal router (None se non disponibile).
+    """
+
+    def __init__(self, name, header, search, text=str, deadline=None, vector=False):
+        self.name = name
+        self.header = header
+        self.search = search
+        self.text = text
+        self.deadline = deadline
+        self.vector = vector
+
+
+def rag_source(rag, top_k=3, deadline=RAG_DEADLINE_SECONDS):
+    return Source(
+        "rag",
+        KNOWLEDGE_HEADER,
+        lambda query: rag.search(query, top_k=top_k),
+        text=lambda r: r["text"],
+        deadline=deadline,
+    )
+
+
+def web_source(search, deadline=WEB_DEADLINE_SECONDS):
+    return Source("web", WEB_HEADER, search, deadline=deadline)
+
+
+def web_memory_source(recall, deadline=RAG_DEADLINE_SECONDS):
+    """Risultati web dei turni precedenti, ritrovati per similarità (offline)."""
+    return Source(
+        "web_memory", WEB_MEMORY_HEADER, recall, deadline=deadline, vector=True
+    )
+
+
+def turn_sources(online):
+    """Sorgenti di un turno: la ricerca online solo se richiesta."""
+    return ("rag", "web_memory", "web") if online else ("rag", "web_memory")
+
+
+class Turn:
+    """Stato di un turno di conversazione mentre attraversa la pipeline."""
+
+    def __init__(
+        self,
+        query,
+        history=(),
+        system=None,
+        sources=("rag",),
+        model_type="auto",
+        session_id="default",
+        speculative=False,
+    ):
+        self.query = query
+        self.history = list(history)  # Turni precedenti (solo domande "nude")
+        self.system = system
+        self.sources = tuple(sources)
+        self.model_type = model_type
+        self.session_id = session_id
+        self.speculative = speculative
+
+        self.vector = None
+        self.target = None
+        self.results = {}  # sorgente -> risultati grezzi
+        self.retrieval = {}  # sorgente -> {"status": ok|late|error, "seconds"}
+        self.sections = []
+        self.messages = None
+        self.prompt_stats = {}
+        self.answer = ""
+        self.timings = {}  # fase -> secondi
+
+
+class ConversationPipeline:
+    """
+    Flusso unico di un turno: route -> retrieve -> prompt -> stream.
+
+    Usato da api.py, coddy.py e app.py, così ogni ottimizzazione vale per
+    tutti i front end. Le fasi sono pluggabili (`add_stage`), ognuna è
+    `fn(turn)` e viene cronometrata in `turn.timings`. Le sorgenti di
+    contesto (RAG, web, ...) vengono interrogate in parallelo, ognuna con
+    la sua scadenza: una sorgente lenta non blocca la generazione, il turno
+    parte con i risultati arrivati in tempo.
+
+    `embed(query)`: embedding memoizzato della query (es. RagEngine.embed):
+    il router semantico lo calcola una volta e la ricerca RAG lo riusa.
+    """
+
+    def __init__(self, engine, sources=(), embed=None, max_workers=8):
+        self.engine = engine
+        self.sources = {source.name: source for source in sources}
+        self.embed = embed
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pipeline"
+        )
+        self.stages = [
+            ("route", self._route),
+            ("retrieve", self._retrieve),
+            ("prompt", self._prompt),
+        ]
+
+    def add_source(self, source):
+        self.sources[source.name] = source
+
+    def add_stage(self, name, fn, before=None):
+        """Inserisce una fase (in coda, o prima della fase `before`)."""
+        names = [n for n, _ in self.stages]
+        index = names.index(before) if before else len(self.stages)
+        self.stages.insert(index, (name, fn))
+
+    def prepare(self, turn):
+        """Esegue tutte le fasi prima della generazione; ritorna il turno."""
+        for name, fn in self.stages:
+            t0 = time.perf_counter()
+            fn(turn)
+            turn.timings[name] = time.perf_counter() - t0
+        return turn
+
+    def _route(self, turn):
+        if turn.model_type != "auto":
+            turn.target = "coder" if turn.model_type == "coder" else "light"
+            return
+        semantic = True
+        if self.embed and self.engine.router is not None:
+            try:
+                turn.vector = self.embed(turn.query)
+            except Exception as e:
+                logger.warning(
+                    f"Pipeline: embedding per il router fallito o lento ({e!r}), "
+                    "routing a keyword"
+                )
+                semantic = False
+        # Solo la domanda: il contesto recuperato falserebbe la scelta
+        turn.target = self.engine.route_query(
+            turn.query, vector=turn.vector, semantic=semantic
+        )
+
+    @staticmethod
+    def _search(source, query, vector):
+        t0 = time.perf_counter()
+        try:
+            if source.vector:
+                results = source.search(query, vector)
+            else:
+                results = source.search(query)
+            status, results = "ok", results or []
+        except Exception as e:
+            logger.warning(f"Pipeline: sorgente {source.name} fallita ({e})")
+            status, results = "error", []
+        seconds = time.perf_counter() - t0
+        logger.debug(f"Pipeline: {source.name} in {seconds:.2f}s")
+        return status, results, round(seconds, 3)
+
+    def _retrieve(self, turn):
+        """
+        Tutte le sorgenti richieste in parallelo, ognuna entro la sua scadenza.
+        Una sorgente in ritardo viene abbandonata (il suo thread finisce per
+        conto suo, il risultato va perso): il turno prosegue senza.
+        """
+        sources = [self.sources[name] for name in turn.sources if name in self.sources]
+        t0 = time.perf_counter()
+        futures = {
+            source.name: self._pool.submit(
+                self._search, source, turn.query, turn.vector
+            )
+            for source in sources
+        }
+        for source in sources:
+            timeout = None
+            if source.deadline is not None:
+                timeout = max(0.0, t0 + source.deadline - time.perf_counter())
+            try:
+                status, results, seconds = futures[source.name].result(timeout=timeout)
+            except FutureTimeout:
+                logger.warning(
+                    f"Pipeline: {source.name} oltre la scadenza "
+                    f"({source.deadline}s), si prosegue senza"
+                )
+                status, results, seconds = "late", [], source.deadline
+            turn.retrieval[source.name] = {"status": status, "seconds": seconds}
+            turn.results[source.name] = results
+            if results:
+                turn.sections.append((source.header, [source.text(r) for r in results]))
+
+    def _prompt(self, turn):
+        turn.messages, turn.prompt_stats = self.engine.build_prompt(
+            turn.target, turn.history, turn.query, turn.sections, system=turn.system
+        )
+
+    def stream(self, turn, ticket=None):
+        """Genera la risposta in streaming (accumulata in `turn.answer`)."""
+        t0 = time.perf_counter()
+        chunks = []
+        try:
+            for chunk in self.engine.stream_chat(
+                turn.messages,
+                model_type=turn.target,
+                session_id=turn.session_id,
+                ticket=ticket,
+                speculative=turn.speculative,
+            ):
+                if not chunks:
+                    turn.timings["first_token"] = time.perf_counter() - t0
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            turn.answer = "".join(chunks)
+            turn.timings["generate"] = time.perf_counter() - t0
+            logger.debug(
+                "Pipeline: "
+                + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in turn.timings.items())
+            )
+
+    def run(self, turn):
+        """prepare + stream."""
+        self.prepare(turn)
+        yield from self.stream(turn)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -27,6 +27,10 @@ class HardwareProfiler:
 
         return physical_cores, total_ram_gb
 
+    def detect_logical_cores(self):
+        """CPU logiche (per lavoro parallelo in processi separati)."""
+        return psutil.cpu_count(logical=True) or 1
+
     def optimize_config(self):
         """
         Genera una configurazione ottimale basata sull'hardware.
@@ -42,21 +46,67 @@ class HardwareProfiler:
         # Modelli Q4 occupano ~1-2GB + contesto.
         # >16GB RAM -> 8192 (O più se supportato)
         # >32GB RAM -> 16384 (Godmode vero)
+        # Budget (MB, per modello) degli stati KV salvati per prefisso di prompt:
+        # almeno 4 stati a contesto pieno del CODER (~28 KB/token in f16)
         if ram_gb >= 30:
             n_ctx = 16384
             n_batch = 1024
+            kv_cache_mb = 2048
         elif ram_gb >= 14:
             n_ctx = 8192
             n_batch = 512
+            kv_cache_mb = 1024
         else:
             n_ctx = 2048  # Fallback per macchine "povere"
             n_batch = 256
+            kv_cache_mb = 256
+
+        # Processi per l'ingestion RAG (lettura + chunking):
+        # lavoro Python puro, scala con i core logici. Uno resta al sistema.
+        ingest_workers = max(1, min(self.detect_logical_cores() - 1, 8))
+
+        # Repliche per modello (ognuna serve una generazione alla volta):
+        # un secondo LIGHT solo con core e RAM in abbondanza
+        light_replicas = 2 if p_cores >= 8 and ram_gb >= 14 else 1
+        model_replicas = {"coder": 1, "light": light_replicas}
+
+        # Decodifica speculativa (LIGHT bozza per il CODER): disattivata di
+        # default. Con il draft il CODER tiene i logits di tutto il contesto
+        # (n_ctx x 151k vocab in float32, ~10 GB a 16k) per ogni replica,
+        # anche senza richieste speculative: si abilita a mano nel profilo
+        # (es. 4 token proposti per passo) solo con RAM in abbondanza.
+        speculative_draft_tokens = 0
+
+        # Router semantico (MiniLM del RAG) al posto del classifier a
+        # keyword: disattivato finché benchmarks/eval_router.py non lo
+        # mostra almeno altrettanto accurato con soglie calibrate.
+        semantic_router = False
+
+        # Residenza dei modelli GGUF (vedi src/model_residency.py):
+        # con RAM abbondante restano caricati entrambi (Godmode), altrimenti
+        # si caricano al primo uso e vengono scaricati se inattivi.
+        if ram_gb >= 14:
+            policy, idle_seconds, max_resident, min_free = "resident", 0, None, 1.0
+        elif ram_gb >= 8:
+            policy, idle_seconds, max_resident, min_free = "on_demand", 600, None, 1.0
+        else:
+            # Un solo modello alla volta sulle macchine più piccole
+            policy, idle_seconds, max_resident, min_free = "on_demand", 120, 1, 0.75
 
         return {
             "cpu_threads": safe_threads,
+            "ingest_workers": ingest_workers,
             "ram_gb": ram_gb,
             "n_ctx": n_ctx,
             "n_batch": n_batch,
+            "kv_cache_mb": kv_cache_mb,
+            "model_replicas": model_replicas,
+            "speculative_draft_tokens": speculative_draft_tokens,
+            "semantic_router": semantic_router,
+            "model_policy": policy,
+            "model_idle_seconds": idle_seconds,
+            "model_max_resident": max_resident,
+            "min_free_ram_gb": min_free,
             "gpu_offload": False,  # Placeholder per futuro supporto GPU
         }
 
@@ -67,7 +117,8 @@ class HardwareProfiler:
                     print(
                         f"⚡ [Profiler] Caricamento profilo esistente da {PROFILE_PATH}"
                     )
-                    return json.load(f)
+                    profile = json.load(f)
+                return self.upgrade_profile(profile)
             except Exception:
                 pass
 
@@ -79,6 +130,19 @@ class HardwareProfiler:
         )
         return config
 
+    def upgrade_profile(self, profile):
+        """
+        Completa un profilo salvato da una versione precedente
+        con le chiavi introdotte in seguito (senza toccare quelle esistenti).
+        """
+        defaults = self.optimize_config()
+        missing = {k: v for k, v in defaults.items() if k not in profile}
+        if missing:
+            profile.update(missing)
+            self.save_profile(profile)
+            print(f"⚡ [Profiler] Profilo aggiornato: {', '.join(missing)}")
+        return profile
+
     def save_profile(self, config):
         with open(PROFILE_PATH, "w") as f:
             json.dump(config, f, indent=4)
@@ -0,0 +1,204 @@
+import threading
+from collections import OrderedDict
+
+# Token di servizio ChatML per messaggio: "<|im_start|>ruolo\n" ... "<|im_end|>\n"
+MESSAGE_OVERHEAD = 5
+
+# Limite (in caratteri) di ogni turno nel riassunto dei turni più vecchi
+SUMMARY_TURN_CHARS = 160
+
+
+class TokenCounter:
+    """
+    Conta i token con il tokenizer del modello di destinazione.
+
+    I conteggi sono memoizzati per testo (LRU): la history di una sessione
+    viene ricontata a ogni turno, ma solo i messaggi nuovi passano davvero
+    dal tokenizer. `tokenize(text) -> lista di token`.
+    """
+
+    def __init__(self, tokenize, max_entries=4096):
+        self.tokenize = tokenize
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text):
+        with self._lock:
+            n = self._counts.get(text)
+            if n is not None:
+                self._counts.move_to_end(text)
+                self.hits += 1
+                return n
+        n = len(self.tokenize(text))
+        with self._lock:
+            self.misses += 1
+            self._counts[text] = n
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return n
+
+    def message(self, message):
+        return self.count(message["content"]) + MESSAGE_OVERHEAD
+
+
+def _truncate(text, tokens, limit):
+    """Taglia `text` (lungo `tokens` token) a circa `limit` token."""
+    if tokens <= limit:
+        return text
+    keep = max(0, int(len(text) * limit / tokens) - 1)
+    return text[:keep].rstrip() + " […]"
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def summarize_turns(messages):
+    """Riassunto estrattivo (senza modello) dei turni esclusi dalla finestra."""
+    lines = []
+    for message in messages:
+        text = " ".join(message["content"].split())
+        if len(text) > SUMMARY_TURN_CHARS:
+            text = text[:SUMMARY_TURN_CHARS].rstrip() + "…"
+        who = "Utente" if message["role"] == "user" else "Coddy"
+        lines.append(f"- {who}: {text}")
+    return "Riassunto della conversazione precedente:\n" + "\n".join(lines)
+
+
+class PromptBuilder:
+    """
+    Assemblaggio del prompt dentro la finestra di contesto del modello.
+
+    Il budget (`n_ctx` meno i token riservati alla risposta) si divide tra:
+    1. system prompt e domanda corrente (sempre presenti);
+    2. contesto recuperato (RAG, web), al massimo `context_share` di ciò che
+       resta: le sezioni entrano in ordine, un frammento alla volta, senza
+       duplicati. Il contesto è effimero: sta solo nel messaggio del turno
+       corrente, la history dei chiamanti conserva le domande "nude";
+    3. history, dal turno più recente all'indietro finché c'è spazio. I turni
+       più vecchi esclusi vengono riassunti in coda al system prompt
+       (con `summarize`, di default un riassunto estrattivo) se ci sta.
+    """
+
+    def __init__(
+        self,
+        counter,
+        n_ctx,
+        reserve_output=1024,
+        context_share=0.4,
+        summary_share=0.1,
+        summarize=summarize_turns,
+    ):
+        self.counter = counter
+        self.n_ctx = n_ctx
+        self.reserve_output = min(reserve_output, n_ctx // 2)
+        self.context_share = context_share
+        self.summary_share = summary_share
+        self.summarize = summarize
+
+    @property
+    def budget(self):
+        return self.n_ctx - self.reserve_output
+
+    def _context(self, sections, limit, shown=""):
+        """
+        Testo del contesto (sezioni "header" + frammenti) entro `limit` token.
+        I frammenti ripetuti (es. lo stesso chunk da RAG e web) o già presenti
+        nella conversazione (`shown`, testo normalizzato) non si rimandano.
+        """
+        lines, used, seen = [], 0, set()
+        for header, items in sections:
+            header_tokens = self.counter.count(header) + 1
+            added = False
+            for item in items:
+                key = _normalize(item)
+                if not key or key in seen or key in shown:
+                    continue
+                seen.add(key)
+                cost = self.counter.count(item) + 1
+                extra = cost if added else cost + header_tokens
+                if used + extra > limit:
+                    # Un frammento troppo lungo si tronca, se resta spazio utile
+                    room = limit - used - (0 if added else header_tokens)
+                    if room < 32:
+                        break
+                    item = _truncate(item, cost, room)
+                    extra = room + (0 if added else header_tokens)
+                if not added:
+                    lines.append(header)
+                    added = True
+                lines.append(item)
+                used += extra
+                if used >= limit:
+                    break
+        return "\n".join(lines), used
+
+    def build(self, system, history, query, sections=()):
+        """
+        Ritorna (messaggi, statistiche).
+        history: turni precedenti (user/assistant), senza system prompt.
+        sections: [(header, [frammenti])], es. ("=== KNOWLEDGE BASE ===", [...]).
+        """
+        budget = self.budget
+        system_msg = {"role": "system", "content": system}
+        used = self.counter.message(system_msg)
+
+        query_tokens = self.counter.count(query)
+        if query_tokens > budget // 2:
+            query = _truncate(query, query_tokens, budget // 2)
+            query_tokens = budget // 2
+        used += query_tokens + MESSAGE_OVERHEAD
+
+        shown = _normalize("\n".join(m["content"] for m in history)) if sections else ""
+        context, context_tokens = self._context(
+            sections, int(max(0, budget - used) * self.context_share), shown
+        )
+        used += context_tokens
+        user_content = query + "\n\n" + context if context else query
+
+        # History: dal più recente, finché c'è spazio. Se non entra tutta,
+        # una quota del budget resta al riassunto dei turni esclusi.
+        remaining = budget - used
+        costs = [self.counter.message(message) for message in history]
+        room = remaining
+        if self.summarize and sum(costs) > remaining:
+            room -= int(budget * self.summary_share)
+        index = len(history)
+        while index > 0 and costs[index - 1] <= room:
+            room -= costs[index - 1]
+            index -= 1
+        # Se si è tagliato, si riparte da un turno utente (niente risposta orfana)
+        while index < len(history) and index and history[index]["role"] != "user":
+            index += 1
+        kept = list(history[index:])
+        dropped = history[:index]
+        remaining -= sum(costs[index:])
+
+        summarized = False
+        if dropped and self.summarize:
+            summary = self.summarize(dropped)
+            cost = self.counter.count(summary) + MESSAGE_OVERHEAD
+            if cost > remaining and remaining > 32:
+                summary = _truncate(summary, cost, remaining - MESSAGE_OVERHEAD)
+                cost = remaining
+            if cost <= remaining:
+                # In coda al system prompt (un solo messaggio di sistema)
+                system_msg["content"] += "\n\n" + summary
+                remaining -= cost
+                summarized = True
+
+        messages = [system_msg, *kept]
+        messages.append({"role": "user", "content": user_content})
+
+        stats = {
+            "budget": budget,
+            "prompt_tokens": budget - remaining,
+            "context_tokens": context_tokens,
+            "history_turns": len(kept),
+            "dropped_turns": len(dropped),
+            "summarized": summarized,
+        }
+        return messages, stats
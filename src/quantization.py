@@ -0,0 +1,151 @@
+import numpy as np
+
+# Blocchi di righe per le scansioni approssimate (limita la memoria temporanea)
+SCAN_BLOCK = 4096
+# Righe usate per allenare i centroidi PQ (k-means su un campione)
+PQ_TRAIN_SAMPLE = 8192
+
+
+class ScalarQuantizer:
+    """
+    Quantizzazione scalare int8 simmetrica, una scala per dimensione.
+    4x meno memoria del float32; lo score approssimato è
+    codes @ (query * scale).
+    """
+
+    kind = "int8"
+    # Candidati da riordinare con i float: limit * rescore
+    rescore = 4
+
+    def __init__(self, scale=None):
+        self.scale = scale
+
+    def fit(self, matrix):
+        self.scale = np.maximum(np.abs(matrix).max(axis=0), 1e-6) / 127.0
+        self.scale = self.scale.astype(np.float32)
+        return self
+
+    def encode(self, matrix):
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes, query):
+        query = (query * self.scale).astype(np.float32)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK):
+            block = codes[start : start + SCAN_BLOCK]
+            out[start : start + len(block)] = block.astype(np.float32) @ query
+        return out
+
+    def state(self):
+        return {"scale": self.scale}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(scale=state["scale"])
+
+
+class ProductQuantizer:
+    """
+    Product quantization: il vettore è diviso in `subspaces` sotto-vettori,
+    ciascuno sostituito dall'indice (uint8) del centroide più vicino.
+    Con dim=384 e 48 sottospazi un vettore occupa 48 byte (32x meno).
+    Lo score approssimato usa una tabella query·centroide per sottospazio.
+    """
+
+    kind = "pq"
+    # Più approssimato dello scalare: serve una finestra di rescoring più ampia
+    rescore = 16
+
+    def __init__(self, subspaces=None, iterations=12, seed=0, centroids=None):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = centroids  # (subspaces, k, dim_sottospazio)
+
+    @staticmethod
+    def _default_subspaces(dim):
+        # Sottospazi da ~8 dimensioni, dim deve essere divisibile
+        for width in (8, 6, 4, 12, 16, 3, 2):
+            if dim % width == 0:
+                return dim // width
+        return 1
+
+    def _split(self, matrix):
+        m = self.centroids.shape[0] if self.centroids is not None else self.subspaces
+        return matrix.reshape(len(matrix), m, -1)
+
+    def fit(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if self.subspaces is None:
+            self.subspaces = self._default_subspaces(matrix.shape[1])
+        if matrix.shape[1] % self.subspaces:
+            raise ValueError(
+                f"dim {matrix.shape[1]} non divisibile in {self.subspaces} sottospazi"
+            )
+        rng = np.random.default_rng(self.seed)
+        if len(matrix) > PQ_TRAIN_SAMPLE:
+            matrix = matrix[rng.choice(len(matrix), PQ_TRAIN_SAMPLE, replace=False)]
+        k = min(256, len(matrix))
+        parts = self._split(matrix)
+        centroids = np.empty((self.subspaces, k, parts.shape[2]), dtype=np.float32)
+        for j in range(self.subspaces):
+            data = parts[:, j, :]
+            center = data[rng.choice(len(data), k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assign = self._nearest(data, center)
+                counts = np.bincount(assign, minlength=k)
+                sums = np.zeros_like(center)
+                np.add.at(sums, assign, data)
+                filled = counts > 0  # I centroidi vuoti restano dove sono
+                center[filled] = sums[filled] / counts[filled, None]
+            centroids[j] = center
+        self.centroids = centroids
+        return self
+
+    @staticmethod
+    def _nearest(data, center):
+        # ||x - c||^2 = ||c||^2 - 2 x·c (+ costante)
+        dist = (center * center).sum(axis=1) - 2.0 * data @ center.T
+        return dist.argmin(axis=1)
+
+    def encode(self, matrix):
+        parts = self._split(np.asarray(matrix, dtype=np.float32))
+        codes = np.empty((len(parts), self.centroids.shape[0]), dtype=np.uint8)
+        for j, center in enumerate(self.centroids):
+            codes[:, j] = self._nearest(parts[:, j, :], center)
+        return codes
+
+    def scores(self, codes, query):
+        # table[j, c] = query_j · centroide_c del sottospazio j
+        table = np.einsum("jkd,jd->jk", self.centroids, self._split(query[None])[0])
+        out = np.zeros(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK):
+            block = codes[start : start + SCAN_BLOCK]
+            partial = out[start : start + len(block)]
+            # Un lookup per sottospazio (più veloce del gather 2D table[rows, block])
+            for j, lookup in enumerate(table):
+                partial += lookup[block[:, j]]
+        return out
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_state(cls, state):
+        centroids = state["centroids"]
+        return cls(subspaces=centroids.shape[0], centroids=centroids)
+
+
+QUANTIZERS = {cls.kind: cls for cls in (ScalarQuantizer, ProductQuantizer)}
+
+
+def make_quantizer(kind):
+    """'int8' (scalare) o 'pq' (product quantization)."""
+    try:
+        return QUANTIZERS[kind]()
+    except KeyError:
+        raise ValueError(f"Quantizzazione sconosciuta: {kind} (int8 o pq)") from None
+
+
+def load_quantizer(kind, state):
+    return QUANTIZERS[kind].from_state(state)
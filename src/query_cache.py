@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache semantica delle query RAG.
+
+    Tiene in memoria gli embedding delle query recenti in una matrice
+    preallocata (una riga per voce) e restituisce i risultati in cache
+    se una nuova query ha similarità coseno >= `threshold` con una già vista.
+    Così "how do I use git rebase" e "how to use git rebase?" condividono
+    lo stesso risultato senza passare da Qdrant.
+
+    Eviction LRU con al massimo `max_entries` voci. Thread-safe.
+    """
+
+    def __init__(self, dim, max_entries=256, threshold=0.92):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._used = np.zeros(max_entries, dtype=bool)
+        # slot -> (top_k, risultati); l'ordine è quello LRU (ultimo = più recente)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector, top_k):
+        """Risultati per la query più simile (se sopra soglia), altrimenti None."""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._entries:
+                scores = self._vectors @ query
+                scores[~self._used] = -1.0
+                # Serve una voce calcolata con almeno `top_k` risultati
+                for slot in np.argsort(scores)[::-1]:
+                    if scores[slot] < self.threshold:
+                        break
+                    cached_k, results = self._entries[slot]
+                    if cached_k >= top_k:
+                        self._entries.move_to_end(slot)
+                        self.hits += 1
+                        return results[:top_k]
+            self.misses += 1
+            return None
+
+    def put(self, vector, top_k, results):
+        """Memorizza i risultati di una query (sostituendo la voce LRU se piena)."""
+        query = self._normalize(vector)
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                slot = int(np.argmin(self._used))
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._vectors[slot] = query
+            self._used[slot] = True
+            self._entries[slot] = (top_k, results)
+            self._entries.move_to_end(slot)
+
+    def clear(self):
+        """Svuota la cache (es. dopo una re-indicizzazione)."""
+        with self._lock:
+            self._entries.clear()
+            self._used[:] = False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class LRUCache:
+    """
+    Cache LRU in-process (L1) con dimensione massima e contatori.
+    Evita il round-trip SQLite + unpickling di diskcache sulle query calde.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,126 @@
+import numpy as np
+
+# Velocità di generazione indicative su CPU (token/s, Q4_K_M): servono solo
+# al modello di costo, il rapporto conta più dei valori assoluti
+TOKENS_PER_SECOND = {"coder": 20.0, "light": 50.0}
+
+# Query prototipo etichettate: (testo, modello, token di risposta attesi)
+PROTOTYPES = [
+    ("scrivi una funzione python che legge un file csv", "coder", 250),
+    ("correggi questo errore: TypeError NoneType is not subscriptable", "coder", 200),
+    ("fai il refactor di questa classe java", "coder", 400),
+    ("debug di uno script bash che non parte", "coder", 200),
+    ("query sql con join e group by sulle vendite", "coder", 150),
+    ("come si crea un componente react con useState", "coder", 300),
+    ("implementa una api rest con fastapi", "coder", 400),
+    ("scrivi un test unitario con pytest", "coder", 250),
+    ("perché questo codice va in segmentation fault", "coder", 250),
+    ("converti questo loop in una list comprehension", "coder", 100),
+    ("dockerfile per un'applicazione node", "coder", 200),
+    ("regex per validare un indirizzo email", "coder", 80),
+    ("rails migration to add an index to a column", "coder", 150),
+    ("fix the failing build in my javascript project", "coder", 250),
+    ("write a class that implements a binary search tree", "coder", 400),
+    ("explain this stack trace and how to fix it", "coder", 250),
+    ("ottimizza questa funzione che è troppo lenta", "coder", 300),
+    ("come configuro il file docker compose con due servizi", "coder", 250),
+    ("ciao, come stai?", "light", 30),
+    ("grazie mille!", "light", 15),
+    ("chi sei?", "light", 40),
+    ("che ore sono a tokyo?", "light", 30),
+    ("riassumi in due righe cos'è il machine learning", "light", 80),
+    ("qual è la capitale dell'australia", "light", 20),
+    ("traduci in inglese: buongiorno a tutti", "light", 20),
+    ("dammi un consiglio per studiare meglio", "light", 120),
+    ("qual è la classifica della serie a", "light", 80),
+    ("raccontami una barzelletta", "light", 60),
+    ("cosa significa la parola prefisso", "light", 60),
+    ("hello, what can you do?", "light", 60),
+    ("thanks, that was helpful", "light", 15),
+    ("what's the difference between a lake and a sea", "light", 100),
+    ("suggeriscimi un titolo per una presentazione", "light", 40),
+    ("scrivi una mail di ringraziamento al mio collega", "light", 150),
+]
+
+
+class QueryRouter:
+    """
+    Router semantico CODER / LIGHT.
+
+    Riusa l'embedder MiniLM già caricato dal RAG: la query viene confrontata
+    con query prototipo etichettate (media dei `top_k` più simili per classe).
+    Un modello di costo stima la lunghezza della risposta (media pesata delle
+    lunghezze dei prototipi vicini) e quindi il tempo in più del CODER: più
+    la risposta attesa è lunga, più il CODER deve vincere con margine.
+    """
+
+    def __init__(
+        self,
+        model,
+        prototypes=PROTOTYPES,
+        tokens_per_second=TOKENS_PER_SECOND,
+        top_k=3,
+        min_margin=0.0,
+        cost_weight=0.004,
+        temperature=0.05,
+    ):
+        self.model = model
+        self.tokens_per_second = dict(tokens_per_second)
+        self.top_k = top_k
+        self.min_margin = min_margin
+        self.cost_weight = cost_weight
+        self.temperature = temperature
+
+        texts, labels, lengths = zip(*prototypes)
+        self.labels = np.array([label == "coder" for label in labels])
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.matrix = self._normalize(
+            np.asarray(
+                model.encode(
+                    list(texts), convert_to_numpy=True, show_progress_bar=False
+                ),
+                dtype=np.float32,
+            )
+        )
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _class_score(self, sims, mask):
+        values = sims[mask]
+        k = min(self.top_k, len(values))
+        return float(np.partition(values, -k)[-k:].mean())
+
+    def explain(self, query, vector=None):
+        """Punteggi, lunghezza attesa e scelta (per debug e valutazione)."""
+        if vector is None:
+            vector = self.model.encode(query)
+        vector = self._normalize(np.asarray(vector, dtype=np.float32))
+        sims = self.matrix @ vector
+
+        coder = self._class_score(sims, self.labels)
+        light = self._class_score(sims, ~self.labels)
+
+        weights = np.exp((sims - sims.max()) / self.temperature)
+        expected_tokens = float((weights * self.lengths).sum() / weights.sum())
+        extra_seconds = expected_tokens * (
+            1 / self.tokens_per_second["coder"] - 1 / self.tokens_per_second["light"]
+        )
+        required = self.min_margin + self.cost_weight * extra_seconds
+
+        # Un blocco di codice nella query è un segnale inequivocabile
+        code_block = "```" in query
+        route = "coder" if code_block or coder - light > required else "light"
+        return {
+            "route": route,
+            "coder": coder,
+            "light": light,
+            "expected_tokens": expected_tokens,
+            "required_margin": required,
+        }
+
+    def route(self, query, vector=None):
+        """'coder' o 'light'. `vector`: embedding già calcolato (es. dal RAG)."""
+        return self.explain(query, vector)["route"]
@@ -0,0 +1,218 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from loguru import logger
+
+# Margine oltre la scadenza prima di riprendersi una replica assegnata
+# ma mai usata (il chiamante non ha avviato lo stream né rilasciato)
+LEASE_GRACE_SECONDS = 10
+
+
+class SchedulerFull(Exception):
+    """Coda piena: la richiesta va rifiutata (es. HTTP 429)."""
+
+
+class RequestExpired(Exception):
+    """La richiesta ha superato la scadenza (o è stata annullata) prima di partire."""
+
+
+class Ticket:
+    """
+    Una richiesta di generazione: attende una replica del modello,
+    la usa (`start`) e la rilascia. `future` si risolve con l'indice della replica.
+    `deadline`: scadenza dell'intera richiesta (coda + generazione), o None;
+    `queue_deadline`: scadenza della sola attesa in coda.
+    """
+
+    def __init__(self, scheduler, session, model, deadline, queue_deadline=None):
+        self.scheduler = scheduler
+        self.session = session
+        self.model = model
+        self.deadline = deadline
+        self.queue_deadline = queue_deadline
+        self.future = Future()
+        self.replica = None
+        self._cancelled = threading.Event()
+        self._started = False
+        self._released = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _limit(self):
+        """Scadenza in vigore: in coda la più vicina, in generazione solo `deadline`."""
+        if self._started or self.queue_deadline is None:
+            return self.deadline
+        if self.deadline is None:
+            return self.queue_deadline
+        return min(self.deadline, self.queue_deadline)
+
+    @property
+    def expired(self):
+        limit = self._limit()
+        return limit is not None and time.monotonic() > limit
+
+    def remaining(self):
+        limit = self._limit()
+        return None if limit is None else max(0.0, limit - time.monotonic())
+
+    def wait(self):
+        """Blocca finché la replica è assegnata (per i chiamanti sincroni)."""
+        try:
+            return self.future.result(timeout=self.remaining())
+        except FutureTimeout:
+            self.cancel()
+            raise RequestExpired(f"Scadenza superata in coda ({self.model})")
+
+    def cancel(self):
+        """Annulla la richiesta: se in coda esce, se in corso si ferma al prossimo token."""
+        self._cancelled.set()
+        self.scheduler._cancel(self)
+
+    def start(self):
+        """
+        Segna l'inizio della generazione sulla replica: da qui la replica
+        torna libera solo con `release` (mai ripresa alla scadenza, llama.cpp
+        potrebbe essere ancora nel prefill).
+        """
+        self._started = True
+
+    def release(self):
+        """Restituisce la replica (idempotente)."""
+        self.scheduler._release(self)
+
+
+class Scheduler:
+    """
+    Scheduler delle richieste davanti alle repliche dei modelli.
+
+    - Per ogni tipo di modello ci sono N repliche; ognuna serve una sola
+      generazione alla volta (le istanze Llama non sono thread-safe).
+    - Coda limitata (`max_queue` richieste in attesa in totale): oltre,
+      `submit` solleva SchedulerFull.
+    - Equità tra sessioni: ogni sessione ha la sua coda FIFO e le repliche
+      libere vengono assegnate a turno (round-robin) tra le sessioni, così
+      una sessione con molte richieste non affama le altre.
+    - Scadenze: ogni richiesta aspetta in coda al massimo `queue_seconds`.
+      Una scadenza esplicita (`submit(deadline_seconds=...)`, es. dal
+      server) copre anche la generazione: oltre, il generatore si ferma
+      (vedi `Ticket.expired`). Senza, una generazione avviata non scade.
+    """
+
+    def __init__(self, replicas, max_queue=16, queue_seconds=300):
+        self.replicas = dict(replicas)
+        self.max_queue = max_queue
+        self.queue_seconds = queue_seconds
+        self._lock = threading.Lock()
+        self._free = {model: deque(range(n)) for model, n in self.replicas.items()}
+        self._busy = {model: {} for model in self.replicas}  # replica -> ticket
+        # modello -> sessione -> coda FIFO (l'ordine delle sessioni è il turno)
+        self._queues = {model: OrderedDict() for model in self.replicas}
+        self._pending = 0
+
+    def submit(self, session, model, deadline_seconds=None):
+        """
+        Accoda una richiesta; ritorna un Ticket (già assegnato se c'è una replica libera).
+        `deadline_seconds`: scadenza dell'intera richiesta, generazione compresa.
+        """
+        if model not in self.replicas:
+            raise ValueError(f"Modello sconosciuto: {model}")
+        now = time.monotonic()
+        deadline = now + deadline_seconds if deadline_seconds else None
+        queue_deadline = now + self.queue_seconds if self.queue_seconds else None
+        ticket = Ticket(self, session, model, deadline, queue_deadline)
+        with self._lock:
+            self._reclaim_expired(model)
+            if self._pending >= self.max_queue:
+                raise SchedulerFull(
+                    f"Coda piena ({self.max_queue} richieste in attesa)"
+                )
+            self._queues[model].setdefault(session, deque()).append(ticket)
+            self._pending += 1
+            self._dispatch(model)
+        return ticket
+
+    def try_acquire(self, session, model):
+        """Una replica solo se libera subito e senza nessuno in coda, altrimenti None."""
+        with self._lock:
+            if not self._free.get(model) or self._queues[model]:
+                return None
+            ticket = Ticket(self, session, model, None)
+            ticket.replica = self._free[model].popleft()
+            self._busy[model][ticket.replica] = ticket
+            ticket.future.set_result(ticket.replica)
+            return ticket
+
+    def _dispatch(self, model):
+        """Assegna le repliche libere, una sessione per volta (round-robin)."""
+        queues = self._queues[model]
+        while self._free[model] and queues:
+            session, queue = next(iter(queues.items()))
+            ticket = queue.popleft()
+            self._pending -= 1
+            if queue:
+                queues.move_to_end(session)  # Turno alla prossima sessione
+            else:
+                del queues[session]
+            if ticket.cancelled or ticket.expired:
+                ticket.future.set_exception(
+                    RequestExpired("Annullata o scaduta in coda")
+                )
+                continue
+            ticket.replica = self._free[model].popleft()
+            self._busy[model][ticket.replica] = ticket
+            ticket.future.set_result(ticket.replica)
+
+    def _reclaim_expired(self, model):
+        """
+        Riprende le repliche assegnate a richieste scadute da tempo che non
+        hanno mai avviato la generazione. Una generazione avviata la rilascia
+        il suo `finally`, anche se oltre la scadenza.
+        """
+        now = time.monotonic()
+        for replica, ticket in list(self._busy[model].items()):
+            limit = ticket._limit()
+            if ticket._started or limit is None:
+                continue
+            if now > limit + LEASE_GRACE_SECONDS:
+                logger.warning(
+                    f"Scheduler: replica {model}#{replica} ripresa (lease scaduto)"
+                )
+                ticket._released = True
+                del self._busy[model][replica]
+                self._free[model].append(replica)
+
+    def _cancel(self, ticket):
+        with self._lock:
+            queue = self._queues[ticket.model].get(ticket.session)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._pending -= 1
+                if not queue:
+                    del self._queues[ticket.model][ticket.session]
+                ticket.future.set_exception(RequestExpired("Annullata in coda"))
+
+    def _release(self, ticket):
+        with self._lock:
+            if ticket._released or ticket.replica is None:
+                return
+            ticket._released = True
+            if self._busy[ticket.model].get(ticket.replica) is ticket:
+                del self._busy[ticket.model][ticket.replica]
+                self._free[ticket.model].append(ticket.replica)
+            self._dispatch(ticket.model)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {
+                    "replicas": n,
+                    "busy": len(self._busy[model]),
+                    "queued": sum(len(q) for q in self._queues[model].values()),
+                    "sessions_waiting": len(self._queues[model]),
+                }
+                for model, n in self.replicas.items()
+            }
@@ -0,0 +1,87 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from llama_cpp.llama_speculative import LlamaDraftModel
+except ImportError:
+    LlamaDraftModel = object
+
+
+class LightDraftModel(LlamaDraftModel):
+    """
+    Draft model per la decodifica speculativa di llama.cpp.
+
+    Il CODER (1.5B) viene creato con `draft_model=LightDraftModel(...)`:
+    a ogni passo llama.cpp chiede al draft i prossimi token, li valuta
+    tutti in un solo batch e tiene quelli che coincidono con i propri.
+    Il LIGHT (0.5B, stesso tokenizer Qwen2.5) propone i token in greedy.
+
+    Il modello LIGHT non è fisso: viene prestato per la durata di una
+    generazione con `drafting(llm)` (lo gestisce lo scheduler del motore).
+    Senza un LIGHT collegato il draft non propone nulla e il CODER decodifica
+    normalmente, un token alla volta.
+    """
+
+    def __init__(self, num_pred_tokens=4):
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = None
+        self._lock = threading.Lock()
+        self._last = None  # (lunghezza contesto, token proposti)
+        self.proposed = 0
+        self.accepted = 0
+
+    @contextmanager
+    def drafting(self, llm):
+        """Collega il modello LIGHT per la durata del blocco."""
+        with self._lock:
+            self.llm, self._last = llm, None
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.llm, self._last = None, None
+
+    def _count_accepted(self, input_ids):
+        # I token accettati sono il prefisso comune tra l'ultima proposta
+        # e ciò che il CODER ha effettivamente aggiunto al contesto
+        if self._last is None:
+            return
+        start, draft = self._last
+        added = input_ids[start : start + len(draft)]
+        mismatch = np.nonzero(added != draft[: len(added)])[0]
+        self.accepted += int(mismatch[0]) if len(mismatch) else len(added)
+
+    def __call__(self, input_ids, /, **kwargs):
+        llm = self.llm
+        if llm is None:
+            return np.array([], dtype=np.intc)
+        self._count_accepted(input_ids)
+        # Il contesto del LIGHT potrebbe non bastare: niente bozza
+        if len(input_ids) + self.num_pred_tokens >= llm.n_ctx():
+            self._last = None
+            return np.array([], dtype=np.intc)
+
+        draft = []
+        eos = llm.token_eos()
+        # generate() riusa la KV cache del LIGHT per il prefisso comune,
+        # quindi a ogni passo valuta solo i token nuovi del CODER
+        for token in llm.generate(input_ids.tolist(), top_k=1, temp=0.0, reset=True):
+            if token == eos:
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+
+        draft = np.array(draft, dtype=np.intc)
+        self._last = (len(input_ids), draft)
+        self.proposed += len(draft)
+        return draft
+
+    def stats(self):
+        return {
+            "proposed": self.proposed,
+            "accepted": self.accepted,
+            "acceptance": self.accepted / self.proposed if self.proposed else 0.0,
+        }
@@ -0,0 +1,508 @@
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from src.embedding_file import MappedCollection, write_collection
+from src.quantization import load_quantizer, make_quantizer
+
+# Risultato di ricerca comune a tutti i backend
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+QUANTIZATION_KINDS = (None, "int8", "pq")
+
+
+class VectorStore:
+    """
+    Interfaccia dei backend vettoriali usati da RagEngine.
+    Tutti i vettori sono confrontati con similarità coseno.
+    """
+
+    def ensure_collection(self, name, dim, quantization=None):
+        """
+        Crea la collezione se manca. Ritorna True se è stata creata.
+        `quantization`: None, "int8" (scalare) o "pq" (product quantization).
+        """
+        raise NotImplementedError
+
+    def count(self, name):
+        raise NotImplementedError
+
+    def upsert(self, name, ids, vectors, payloads):
+        raise NotImplementedError
+
+    def delete(self, name, ids):
+        raise NotImplementedError
+
+    def query(self, name, vector, limit):
+        """Ritorna una lista di Hit ordinata per score decrescente."""
+        raise NotImplementedError
+
+    def query_batch(self, name, vectors, limit):
+        return [self.query(name, vector, limit) for vector in vectors]
+
+    def scroll(self, name):
+        """Itera su (id, payload) di tutti i punti della collezione."""
+        raise NotImplementedError
+
+    def flush(self, name):
+        """Rende persistenti le scritture pendenti (se il backend le bufferizza)."""
+
+    def reload(self, name):
+        """Rilegge la collezione da disco se un altro processo l'ha modificata."""
+
+    def close(self):
+        pass
+
+
+class QdrantStore(VectorStore):
+    """Backend Qdrant locale (QdrantClient(path=...), storage SQLite)."""
+
+    def __init__(self, path):
+        from qdrant_client import QdrantClient
+        from qdrant_client.http import models
+
+        self.models = models
+        self.client = QdrantClient(path=path)
+
+    def _quantization_config(self, quantization):
+        models = self.models
+        if quantization == "int8":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            )
+        if quantization == "pq":
+            return models.ProductQuantization(
+                product=models.ProductQuantizationConfig(
+                    compression=models.CompressionRatio.X16, always_ram=True
+                )
+            )
+        return None
+
+    def ensure_collection(self, name, dim, quantization=None):
+        # Nota: in modalità locale (path=...) Qdrant fa sempre ricerca esatta e
+        # ignora la quantizzazione (anche update_collection non ha effetto): la
+        # configurazione conta solo quando la collezione è servita da un server.
+        collections = self.client.get_collections()
+        if any(c.name == name for c in collections.collections):
+            self._update_quantization(name, quantization)
+            return False
+        self.client.create_collection(
+            collection_name=name,
+            vectors_config=self.models.VectorParams(
+                size=dim, distance=self.models.Distance.COSINE
+            ),
+            quantization_config=self._quantization_config(quantization),
+        )
+        return True
+
+    def _update_quantization(self, name, quantization):
+        """Applica la quantizzazione richiesta a una collezione già esistente."""
+        config = self._quantization_config(quantization)
+        current = self.client.get_collection(name).config.quantization_config
+        if config == current:
+            return
+        if not self.client.update_collection(
+            collection_name=name,
+            quantization_config=config or self.models.Disabled.DISABLED,
+        ):
+            logger.info(
+                f"Qdrant locale: quantizzazione '{quantization}' ignorata per "
+                f"{name} (ricerca esatta)"
+            )
+
+    def count(self, name):
+        return self.client.count(name).count
+
+    def upsert(self, name, ids, vectors, payloads):
+        self.client.upsert(
+            collection_name=name,
+            points=[
+                self.models.PointStruct(
+                    id=doc_id, vector=vector.tolist(), payload=payload
+                )
+                for doc_id, vector, payload in zip(ids, vectors, payloads)
+            ],
+        )
+
+    def delete(self, name, ids):
+        self.client.delete(
+            collection_name=name,
+            points_selector=self.models.PointIdsList(points=list(ids)),
+        )
+
+    def query(self, name, vector, limit):
+        points = self.client.query_points(
+            collection_name=name, query=vector.tolist(), limit=limit
+        ).points
+        return [Hit(str(p.id), p.score, p.payload) for p in points]
+
+    def query_batch(self, name, vectors, limit):
+        responses = self.client.query_batch_points(
+            collection_name=name,
+            requests=[
+                self.models.QueryRequest(
+                    query=vector.tolist(), limit=limit, with_payload=True
+                )
+                for vector in vectors
+            ],
+        )
+        return [
+            [Hit(str(p.id), p.score, p.payload) for p in response.points]
+            for response in responses
+        ]
+
+    def scroll(self, name):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=name,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            for point in points:
+                yield str(point.id), point.payload
+            if offset is None:
+                return
+
+    def close(self):
+        self.client.close()
+
+
+class _NumpyCollection:
+    """
+    Matrice di vettori normalizzati + tabella payload di una collezione.
+
+    Appena aperta da disco la collezione è solo una vista su un
+    MappedCollection (nessuna copia); la prima scrittura la materializza
+    in memoria (copy-on-write) fino al prossimo flush.
+
+    Con `quantization` i codici quantizzati (codes.npy, in mmap) servono
+    per la scansione completa; i vettori float vengono letti solo per
+    riordinare i migliori candidati.
+    """
+
+    def __init__(self, dim, dtype, mapped=None, quantization=None):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self.quantizer = None
+        self.codes = None
+        self.mapped = mapped
+        if mapped is not None:
+            self.size = mapped.count
+            self.matrix = mapped.matrix
+            self.ids = self.payloads = self.rows = None
+        else:
+            self.size = 0
+            self.matrix = np.zeros((0, dim), dtype=self.dtype)
+            self.ids = []
+            self.rows = {}  # id -> riga
+            self.payloads = []
+        self.dirty = False
+
+    @classmethod
+    def open(cls, directory):
+        mapped = MappedCollection(directory)
+        collection = cls(mapped.dim, mapped.dtype, mapped=mapped)
+        quantizer_path = os.path.join(directory, "quantizer.npz")
+        codes_path = os.path.join(directory, "codes.npy")
+        if os.path.exists(quantizer_path):
+            with np.load(quantizer_path) as state:
+                collection.quantization = str(state["kind"])
+                if os.path.exists(codes_path):
+                    quantizer = load_quantizer(collection.quantization, state)
+                    codes = np.load(codes_path, mmap_mode="r")
+                    # Codici di un flush interrotto: scansione esatta
+                    if len(codes) == mapped.count:
+                        collection.quantizer, collection.codes = quantizer, codes
+        return collection
+
+    def __len__(self):
+        return self.size
+
+    def doc_id(self, row):
+        return self.mapped.doc_id(row) if self.mapped else self.ids[row]
+
+    def payload(self, row):
+        return self.mapped.payload(row) if self.mapped else self.payloads[row]
+
+    def records(self):
+        return [(self.doc_id(i), self.payload(i)) for i in range(self.size)]
+
+    def _materialize(self):
+        """Copy-on-write: porta in memoria la collezione mappata prima di scriverci."""
+        if self.mapped is None:
+            return
+        records = self.records()
+        self.ids = [doc_id for doc_id, _ in records]
+        self.payloads = [payload for _, payload in records]
+        self.rows = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.matrix = np.array(self.mapped.matrix)
+        self.mapped = None
+        # Codici non più allineati: scansione esatta fino al prossimo flush
+        self.quantizer = self.codes = None
+
+    def _reserve(self, extra):
+        """Garantisce spazio per `extra` righe (crescita geometrica)."""
+        needed = self.size + extra
+        if needed > self.matrix.shape[0]:
+            capacity = max(needed, 2 * self.matrix.shape[0], 64)
+            matrix = np.zeros((capacity, self.dim), dtype=self.dtype)
+            matrix[: self.size] = self.matrix[: self.size]
+            self.matrix = matrix
+
+    def upsert(self, ids, vectors, payloads):
+        self._materialize()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        self._reserve(len(ids))
+        for doc_id, vector, payload in zip(ids, vectors, payloads):
+            row = self.rows.get(doc_id)
+            if row is None:
+                row = self.size
+                self.rows[doc_id] = row
+                self.ids.append(doc_id)
+                self.payloads.append(payload)
+                self.size += 1
+            else:
+                self.payloads[row] = payload
+            self.matrix[row] = vector
+        self.dirty = True
+
+    def delete(self, ids):
+        """Swap-remove: l'ultima riga prende il posto di quella cancellata."""
+        self._materialize()
+        for doc_id in ids:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                moved = self.ids[last]
+                self.ids[row] = moved
+                self.payloads[row] = self.payloads[last]
+                self.matrix[row] = self.matrix[last]
+                self.rows[moved] = row
+            self.ids.pop()
+            self.payloads.pop()
+            self.size -= 1
+        self.dirty = True
+
+    def scores(self, query, rows=None, block=2048):
+        """Similarità coseno con tutte le righe (o solo `rows`), a blocchi se non float32."""
+        matrix = self.matrix[: self.size] if rows is None else self.matrix[rows]
+        if self.dtype == np.float32:
+            return matrix @ query
+        out = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), block):
+            out[start : start + block] = (
+                matrix[start : start + block].astype(np.float32) @ query
+            )
+        return out
+
+    def top(self, query, limit):
+        """Ritorna (righe, score) dei `limit` migliori, in ordine decrescente."""
+        if self.codes is not None and self.size > limit * self.quantizer.rescore:
+            # Scansione sui codici quantizzati, poi rescoring esatto dei candidati
+            approx = self.quantizer.scores(self.codes, query)
+            rows = np.sort(_top_k(approx, limit * self.quantizer.rescore))
+            exact = self.scores(query, rows=rows)
+            best = _top_k(exact, limit)
+            return rows[best], exact[best]
+        scores = self.scores(query)
+        best = _top_k(scores, limit)
+        return best, scores[best]
+
+
+def _top_k(scores, k):
+    """Indici dei k score più alti, ordinati (argpartition + sort dei soli k)."""
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class NumpyStore(VectorStore):
+    """
+    Backend brute-force in NumPy, pensato per knowledge base piccole.
+
+    Ogni collezione è una matrice (float32 o float16) di vettori già
+    normalizzati: la ricerca è un prodotto matrice-vettore + argpartition.
+    Su disco: `embeddings.bin` (formato binario versionato, aperto in mmap
+    e letto tramite viste NumPy) e `payloads.bin` (blob indicizzato per
+    offset), vedi src/embedding_file.py; con la quantizzazione anche
+    `codes.npy` + `quantizer.npz` (src/quantization.py). Più processi che aprono lo stesso
+    store condividono le pagine del page cache.
+    Le scritture restano in memoria fino a `flush()`, che riscrive i file
+    e torna alla vista mappata. Thread-safe (un lock per store).
+    """
+
+    def __init__(self, path, dtype="float32"):
+        if np.dtype(dtype) not in (np.float32, np.float16):
+            raise ValueError(f"dtype non supportato: {dtype} (float32 o float16)")
+        self.path = path
+        self.dtype = dtype
+        self._collections = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self, name):
+        with self._lock:
+            return self._load_locked(name)
+
+    def _load_locked(self, name):
+        if name in self._collections:
+            return self._collections[name]
+        if not os.path.exists(os.path.join(self._dir(name), "embeddings.bin")):
+            return None
+        try:
+            collection = _NumpyCollection.open(self._dir(name))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                f"RAG: Vector store '{name}' illeggibile ({e}), verrà ricreato."
+            )
+            return None
+        self._collections[name] = collection
+        return collection
+
+    def _get(self, name):
+        collection = self._load(name)
+        if collection is None:
+            raise KeyError(f"Collezione '{name}' inesistente")
+        return collection
+
+    def ensure_collection(self, name, dim, quantization=None):
+        if quantization not in QUANTIZATION_KINDS:
+            raise ValueError(f"Quantizzazione sconosciuta: {quantization}")
+        with self._lock:
+            collection = self._load_locked(name)
+            if collection is not None:
+                if collection.quantization != quantization:
+                    # Configurazione cambiata: i codici vengono ricalcolati
+                    logger.info(
+                        f"RAG: Quantizzazione '{name}': "
+                        f"{collection.quantization} -> {quantization}"
+                    )
+                    collection._materialize()
+                    collection.quantization = quantization
+                    collection.dirty = True
+                    self._flush_locked(name)
+                return False
+            self._collections[name] = _NumpyCollection(
+                dim, self.dtype, quantization=quantization
+            )
+            self._collections[name].dirty = True
+            self._flush_locked(name)
+            return True
+
+    def count(self, name):
+        return len(self._get(name))
+
+    def upsert(self, name, ids, vectors, payloads):
+        with self._lock:
+            self._get(name).upsert(list(ids), vectors, list(payloads))
+
+    def delete(self, name, ids):
+        with self._lock:
+            self._get(name).delete(ids)
+
+    def query(self, name, vector, limit):
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            collection = self._get(name)
+            if not len(collection):
+                return []
+            rows, scores = collection.top(query, limit)
+            # Solo i payload dei top-k vengono decodificati
+            return [
+                Hit(collection.doc_id(i), float(score), collection.payload(i))
+                for i, score in zip(rows, scores)
+            ]
+
+    def scroll(self, name):
+        with self._lock:
+            points = self._get(name).records()
+        yield from points
+
+    def flush(self, name):
+        with self._lock:
+            self._flush_locked(name)
+
+    def reload(self, name):
+        """
+        Scarta la vista mappata: il prossimo accesso riapre i file scritti
+        da un altro processo. Le scritture non ancora salvate restano.
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None and not collection.dirty:
+                del self._collections[name]
+
+    def _flush_locked(self, name):
+        collection = self._collections.get(name)
+        if collection is None or not collection.dirty:
+            return
+        try:
+            n = len(collection)
+            write_collection(
+                self._dir(name),
+                collection.ids,
+                collection.matrix[:n],
+                collection.payloads,
+            )
+            self._write_codes(name, collection.quantization, collection.matrix[:n])
+            # Di nuovo una vista mappata: la copia privata viene rilasciata
+            self._collections[name] = _NumpyCollection.open(self._dir(name))
+        except Exception as e:
+            logger.error(f"RAG Vector Store Flush Error: {e}")
+
+    def _write_codes(self, name, quantization, matrix):
+        """Allena il quantizzatore sulla collezione e salva i codici (o li rimuove)."""
+        codes_path = os.path.join(self._dir(name), "codes.npy")
+        quantizer_path = os.path.join(self._dir(name), "quantizer.npz")
+        if quantization is None or not len(matrix):
+            if quantization is None:
+                for path in (codes_path, quantizer_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                # Collezione vuota: resta solo il tipo di quantizzazione
+                np.savez(quantizer_path, kind=quantization)
+                if os.path.exists(codes_path):
+                    os.remove(codes_path)
+            return
+        matrix = np.asarray(matrix, dtype=np.float32)
+        quantizer = make_quantizer(quantization).fit(matrix)
+        codes_tmp = os.path.join(self._dir(name), "codes.tmp.npy")
+        quantizer_tmp = os.path.join(self._dir(name), "quantizer.tmp.npz")
+        np.save(codes_tmp, quantizer.encode(matrix))
+        np.savez(quantizer_tmp, kind=quantization, **quantizer.state())
+        os.replace(codes_tmp, codes_path)
+        os.replace(quantizer_tmp, quantizer_path)
+
+    def close(self):
+        with self._lock:
+            for name in list(self._collections):
+                self._flush_locked(name)
+            self._collections.clear()
+
+
+def open_store(backend, path, dtype="float32"):
+    """Factory dei backend: 'qdrant' (default) o 'numpy'."""
+    if backend == "qdrant":
+        return QdrantStore(path)
+    if backend == "numpy":
+        return NumpyStore(path, dtype=dtype)
+    raise ValueError(f"Backend vettoriale sconosciuto: {backend}")
@@ -0,0 +1,237 @@
+import re
+import time
+import uuid
+import threading
+import unicodedata
+
+import diskcache as dc
+from loguru import logger
+
+# Collezione (nello stesso vector store del RAG) dei risultati web recenti
+WEB_COLLECTION = "web_results"
+# Similarità minima per riproporre un risultato web già visto
+WEB_MIN_SCORE = 0.5
+
+
+def normalize_query(query):
+    """Chiave di cache: minuscolo, senza punteggiatura (salvo + e #) né spazi doppi."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = re.sub(r"[^\w+#]+", " ", query)
+    return " ".join(query.split())
+
+
+def format_result(result):
+    return f"[Fonte Web: {result['title']}]({result['href']})\n{result['body']}"
+
+
+class SearchProvider:
+    """
+    Interfaccia di un motore di ricerca web.
+    `search(query, max_results) -> [{"title", "href", "body"}]`.
+    """
+
+    name = "provider"
+
+    def search(self, query, max_results):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DuckDuckGoProvider(SearchProvider):
+    """
+    DuckDuckGo (ddgs) con una sessione HTTP per thread, riusata tra le
+    ricerche (niente handshake TLS a ogni domanda). DDGS non è thread-safe:
+    con un client per thread le ricerche concorrenti (es. più utenti del
+    server) non si aspettano a vicenda. Il client si ricrea dopo un errore.
+    """
+
+    name = "duckduckgo"
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from ddgs import DDGS
+
+            client = self._local.client = DDGS(timeout=self.timeout)
+        return client
+
+    def search(self, query, max_results):
+        client = self._client()
+        try:
+            return list(client.text(query, max_results=max_results))
+        except Exception:
+            self._local.client = None
+            raise
+
+    def close(self):
+        self._local = threading.local()
+
+
+class WebSearch:
+    """
+    Ricerca web con cache su disco e memoria semantica a breve termine.
+
+    - Cache diskcache con chiave = query normalizzata (+ max_results) e TTL:
+      domande ripetute o scritte diversamente ("Git rebase?" / "git rebase")
+      non tornano in rete. Anche una ricerca abbandonata dalla pipeline per
+      scadenza, quando finisce, scalda la cache per il turno dopo.
+    - Con `attach(rag)` e `ingest=True` i risultati vengono embeddati in una
+      collezione separata del vector store del RAG (`WEB_COLLECTION`), con
+      scadenza `memory_ttl`: i turni successivi li ritrovano per similarità
+      (`recall`) anche senza ricerca online.
+    - `recall` usa il vettore della query calcolato dalla pipeline; se
+      manca passa da `embed` (di default `rag.embed`). I risultati da
+      memorizzare passano da `encode` (di default l'embedder del RAG).
+      Nel server entrambi vanno all'embedder micro-batch di AsyncRagEngine.
+    """
+
+    def __init__(
+        self,
+        provider,
+        cache_dir="web_cache",
+        ttl=24 * 3600,
+        max_results=3,
+        ingest=False,
+        memory_ttl=3600,
+    ):
+        self.provider = provider
+        self.cache = dc.Cache(cache_dir)
+        self.ttl = ttl
+        self.max_results = max_results
+        self.ingest = ingest
+        self.memory_ttl = memory_ttl
+        self.rag = None
+        self.embed = None
+        self.encode = None
+        self._last_purge = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, rag, embed=None, encode=None):
+        """
+        Collega il RAG (embedder + vector store) per la memoria dei risultati.
+        `embed(query) -> vettore`: embedding delle query di `recall` (default `rag.embed`).
+        `encode(testi) -> vettori`: embedding dei risultati da memorizzare.
+        """
+        if not (rag and rag.store and rag.model):
+            return False
+        rag.store.ensure_collection(WEB_COLLECTION, rag.embedding_size)
+        self.embed = embed or rag.embed
+        self.encode = encode or (
+            lambda texts: rag.model.encode(
+                texts, convert_to_numpy=True, show_progress_bar=False
+            )
+        )
+        self.rag = rag
+        self._purge()
+        return True
+
+    def _key(self, query):
+        return f"{self.provider.name}:{self.max_results}:{normalize_query(query)}"
+
+    def search(self, query):
+        """Risultati grezzi [{"title", "href", "body"}] (dalla cache se possibile)."""
+        key = self._key(query)
+        results = self.cache.get(key)
+        if results is not None:
+            self.hits += 1
+            return results
+        self.misses += 1
+        try:
+            results = self.provider.search(query, self.max_results)
+        except Exception as e:
+            logger.warning(f"Web search ({self.provider.name}) fallita: {e}")
+            return []
+        self.cache.set(key, results, expire=self.ttl)
+        if self.ingest and self.rag and results:
+            try:
+                self._remember(query, results)
+            except Exception as e:
+                logger.warning(f"Web search: memorizzazione fallita ({e})")
+        return results
+
+    def search_text(self, query):
+        """Risultati formattati come frammenti del prompt."""
+        return [format_result(r) for r in self.search(query)]
+
+    def _remember(self, query, results):
+        texts = [format_result(r) for r in results]
+        vectors = self.encode(texts)
+        expires_at = time.time() + self.memory_ttl
+        ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, r["href"])) for r in results]
+        payloads = [
+            {
+                "text": text,
+                "source": r["href"],
+                "query": normalize_query(query),
+                "expires_at": expires_at,
+            }
+            for text, r in zip(texts, results)
+        ]
+        self.rag.store.upsert(WEB_COLLECTION, ids, vectors, payloads)
+        if time.time() - self._last_purge > self.memory_ttl / 4:
+            self._purge()
+
+    def recall(self, query, vector=None, limit=3):
+        """Risultati web recenti (non scaduti) simili alla query."""
+        if not self.rag:
+            return []
+        if vector is None:
+            vector = self.embed(query)
+        now = time.time()
+        return [
+            hit.payload
+            for hit in self.rag.store.query(WEB_COLLECTION, vector, limit)
+            if hit.score >= WEB_MIN_SCORE and hit.payload["expires_at"] > now
+        ]
+
+    def recall_text(self, query, vector=None, limit=3):
+        return [payload["text"] for payload in self.recall(query, vector, limit)]
+
+    def _purge(self):
+        """Elimina dalla collezione i risultati scaduti."""
+        now = self._last_purge = time.time()
+        expired = [
+            doc_id
+            for doc_id, payload in self.rag.store.scroll(WEB_COLLECTION)
+            if payload.get("expires_at", 0) <= now
+        ]
+        if expired:
+            self.rag.store.delete(WEB_COLLECTION, expired)
+            logger.info(f"Web search: {len(expired)} risultati scaduti rimossi")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self.provider.close()
+        self.cache.close()
+
+
+# Ricerca web di processo, condivisa da coddy.py, app.py e api.py
+_web = None
+_web_lock = threading.Lock()
+
+
+def get_web_search():
+    """
+    WebSearch di processo (creata al primo uso): DuckDuckGo con sessione
+    HTTP riusata, cache su disco per query normalizzata e memoria dei
+    risultati nel vector store.
+    """
+    global _web
+    with _web_lock:
+        if _web is None:
+            _web = WebSearch(DuckDuckGoProvider(timeout=5), ingest=True)
+        return _web
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I moduli si importano dalla root del progetto (come in benchmarks/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.lexical_index import LexicalIndex
+from src.vector_store import NumpyStore
+
+
+def unit(i, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_numpy_store_reload_sees_other_process(tmp_path):
+    writer, reader = NumpyStore(str(tmp_path)), NumpyStore(str(tmp_path))
+    writer.ensure_collection("kb", 8)
+    writer.upsert("kb", ["a"], [unit(0)], [{"text": "vecchio"}])
+    writer.flush("kb")
+    assert reader.query("kb", unit(1), 1)[0].payload["text"] == "vecchio"
+
+    writer.upsert("kb", ["b"], [unit(1)], [{"text": "nuovo"}])
+    writer.flush("kb")
+    # Vista mappata ancora quella di prima finché non si ricarica
+    assert reader.query("kb", unit(1), 1)[0].payload["text"] == "vecchio"
+    reader.reload("kb")
+    assert reader.query("kb", unit(1), 1)[0].payload["text"] == "nuovo"
+
+
+def test_numpy_store_reload_keeps_unsaved_writes(tmp_path):
+    store = NumpyStore(str(tmp_path))
+    store.ensure_collection("kb", 8)
+    store.upsert("kb", ["a"], [unit(0)], [{"text": "in memoria"}])
+    store.reload("kb")
+    assert store.count("kb") == 1
+
+
+def test_lexical_load_sees_other_process(tmp_path):
+    writer = LexicalIndex(str(tmp_path))
+    writer.add("a", {"text": "git rebase interattivo"})
+    writer.commit()
+    reader = LexicalIndex(str(tmp_path))
+
+    writer.add("b", {"text": "docker compose volumi"})
+    writer.commit()
+    assert reader.search("docker") == []
+    reader.load()
+    assert reader.search("docker")[0][0] == "b"
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.kv_cache import PrefixStateCache, estimate_state_bytes
+from src.profiler import HardwareProfiler
+
+VOCAB = 151936  # Qwen2.5
+# Metadati GGUF di Qwen2.5-Coder-1.5B (i valori sono stringhe in llama-cpp-python)
+CODER = {
+    "general.architecture": "qwen2",
+    "qwen2.block_count": "28",
+    "qwen2.embedding_length": "1536",
+    "qwen2.attention.head_count": "12",
+    "qwen2.attention.head_count_kv": "2",
+}
+KV_PER_TOKEN = 28672  # 2 x 28 layer x 2 head KV x 128 dim x 2 byte
+
+
+def llama_state(tokens, n_ctx, n_batch):
+    """Come Llama.save_state: `scores` è n_batch x vocab float32 (~155 MB a 256)."""
+    return SimpleNamespace(
+        scores=np.zeros((n_batch, VOCAB), dtype=np.float32),
+        input_ids=np.zeros(n_ctx, dtype=np.intc),
+        n_tokens=len(tokens),
+        llama_state=b"",
+        llama_state_size=len(tokens) * KV_PER_TOKEN + VOCAB * 4,
+    )
+
+
+def low_tier():
+    profiler = HardwareProfiler.__new__(HardwareProfiler)
+    profiler.detect_hardware = lambda: (4, 8.0)
+    profiler.detect_logical_cores = lambda: 4
+    return profiler.optimize_config()
+
+
+def test_hit_with_realistic_state_sizes():
+    config = low_tier()
+    cache = PrefixStateCache(config["kv_cache_mb"] * 1024**2)
+    n_ctx, n_batch = config["n_ctx"], config["n_batch"]
+
+    first = list(range(1500))
+    cache[first] = llama_state(first, n_ctx, n_batch)
+    other = list(range(10_000, 11_200))
+    cache[other] = llama_state(other, n_ctx, n_batch)
+
+    # Turno successivo della prima conversazione: riparte dal suo stato
+    state = cache[first + [42, 43]]
+    assert state.n_tokens == len(first)
+    assert state.scores.shape == (1, VOCAB)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= cache.capacity_bytes
+
+
+def test_budgets_hold_several_full_context_states():
+    config = low_tier()
+    full = estimate_state_bytes(CODER, config["n_ctx"], VOCAB)
+    assert config["kv_cache_mb"] * 1024**2 >= 4 * full
+
+
+def test_estimate_state_bytes():
+    assert estimate_state_bytes(CODER, 1, VOCAB) == KV_PER_TOKEN + 2 * VOCAB * 4 + 4
+    assert estimate_state_bytes({}, 2048, VOCAB) is None
+
+
+def test_state_larger_than_budget_not_stored():
+    cache = PrefixStateCache(1024**2)
+    cache[[1, 2, 3]] = llama_state([1, 2, 3] * 100, 2048, 256)
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,138 @@
+import time
+import threading
+
+import pytest
+
+from src.pipeline import (
+    KNOWLEDGE_HEADER,
+    WEB_HEADER,
+    ConversationPipeline,
+    Source,
+    Turn,
+    web_source,
+)
+
+
+class StubEngine:
+    """Solo quanto serve alle fasi route/prompt: il prompt elenca le sezioni."""
+
+    router = None
+
+    def route_query(self, query, vector=None, semantic=True):
+        return "light"
+
+    def build_prompt(self, model_type, history, query, sections=(), system=None):
+        lines = [query]
+        for header, items in sections:
+            lines += [header, *items]
+        return [{"role": "user", "content": "\n".join(lines)}], {}
+
+
+def rag(query):
+    return [f"frammento per {query}"]
+
+
+def hung(release):
+    def search(query):
+        release.wait(5)
+        return [f"web in ritardo per {query}"]
+
+    return search
+
+
+def failing(query):
+    raise ConnectionError("provider offline")
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def make_pipeline(*sources):
+    return ConversationPipeline(StubEngine(), sources=sources)
+
+
+def test_hung_source_dropped_at_deadline(release):
+    pipeline = make_pipeline(
+        Source("rag", KNOWLEDGE_HEADER, rag),
+        web_source(hung(release), deadline=0.2),
+    )
+    t0 = time.perf_counter()
+    turn = pipeline.prepare(Turn("git rebase", sources=("rag", "web")))
+    elapsed = time.perf_counter() - t0
+
+    assert elapsed < 1.0
+    assert turn.retrieval["web"]["status"] == "late"
+    assert turn.results["web"] == []
+    assert turn.retrieval["rag"]["status"] == "ok"
+    pipeline.close()
+
+
+def test_failing_source_skipped():
+    pipeline = make_pipeline(
+        Source("rag", KNOWLEDGE_HEADER, rag), web_source(failing, deadline=1.0)
+    )
+    turn = pipeline.prepare(Turn("git rebase", sources=("rag", "web")))
+
+    assert turn.retrieval["web"]["status"] == "error"
+    assert [header for header, _ in turn.sections] == [KNOWLEDGE_HEADER]
+    pipeline.close()
+
+
+def test_partial_results_still_build_prompt(release):
+    pipeline = make_pipeline(
+        Source("rag", KNOWLEDGE_HEADER, rag),
+        web_source(hung(release), deadline=0.1),
+    )
+    turn = pipeline.prepare(Turn("git rebase", sources=("rag", "web")))
+
+    prompt = turn.messages[-1]["content"]
+    assert "frammento per git rebase" in prompt
+    assert WEB_HEADER not in prompt
+    pipeline.close()
+
+
+def test_late_results_do_not_leak_into_next_turn(release):
+    calls = []
+
+    def slow_then_fast(query):
+        calls.append(query)
+        if len(calls) == 1:
+            release.wait(5)
+        return [f"web per {query}"]
+
+    pipeline = make_pipeline(web_source(slow_then_fast, deadline=0.1))
+    first = pipeline.prepare(Turn("prima", sources=("web",)))
+    release.set()  # La ricerca abbandonata finisce ora, in background
+    second = pipeline.prepare(Turn("seconda", sources=("web",)))
+    time.sleep(0.05)
+
+    assert first.retrieval["web"]["status"] == "late"
+    assert first.results["web"] == [] and first.sections == []
+    assert second.results["web"] == ["web per seconda"]
+    assert "prima" not in second.messages[-1]["content"]
+    pipeline.close()
+
+
+def test_slow_route_embedding_falls_back_to_keywords():
+    class RoutedEngine(StubEngine):
+        router = object()
+
+        def route_query(self, query, vector=None, semantic=True):
+            return "coder" if semantic else "light"
+
+    def slow_embed(query):
+        raise TimeoutError("embedding oltre il limite")
+
+    pipeline = ConversationPipeline(
+        RoutedEngine(), sources=[Source("rag", KNOWLEDGE_HEADER, rag)], embed=slow_embed
+    )
+    turn = pipeline.prepare(Turn("scrivi una funzione"))
+
+    assert turn.vector is None
+    assert turn.target == "light"
+    assert turn.results["rag"]
+    pipeline.close()
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from src.scheduler import RequestExpired, Scheduler
+
+
+def test_default_deadline_covers_only_the_queue():
+    scheduler = Scheduler({"light": 1}, queue_seconds=0.05)
+    ticket = scheduler.submit("a", "light")
+    ticket.wait()
+    ticket.start()
+    time.sleep(0.1)
+
+    assert not ticket.expired  # Generazione lunga: non viene troncata
+    ticket.release()
+
+
+def test_queue_wait_expires():
+    scheduler = Scheduler({"light": 1}, queue_seconds=0.05)
+    running = scheduler.submit("a", "light")
+    running.wait()
+    running.start()
+
+    waiting = scheduler.submit("b", "light")
+    with pytest.raises(RequestExpired):
+        waiting.wait()
+    running.release()
+
+
+def test_explicit_deadline_covers_generation():
+    scheduler = Scheduler({"light": 1})
+    ticket = scheduler.submit("a", "light", deadline_seconds=0.05)
+    ticket.wait()
+    ticket.start()
+    time.sleep(0.1)
+
+    assert ticket.expired
+    ticket.release()
+
+
+def test_started_lease_is_never_reclaimed(monkeypatch):
+    monkeypatch.setattr("src.scheduler.LEASE_GRACE_SECONDS", 0)
+    scheduler = Scheduler({"light": 1}, queue_seconds=0.05)
+    running = scheduler.submit("a", "light", deadline_seconds=0.05)
+    running.wait()
+    running.start()
+    time.sleep(0.1)
+
+    other = scheduler.submit("b", "light")
+    assert not other.future.done()
+    running.release()
+    assert other.wait() == 0
+    other.release()
@@ -0,0 +1,252 @@
+import sys
+import time
+import types
+import threading
+
+import numpy as np
+import pytest
+
+from src.vector_store import NumpyStore
+from src.web_search import (
+    WEB_COLLECTION,
+    DuckDuckGoProvider,
+    SearchProvider,
+    WebSearch,
+    normalize_query,
+)
+
+TERMS = ("git", "rebase", "python", "list", "docker")
+
+
+class FakeSearchProvider(SearchProvider):
+    """
+    Provider locale: risultati deterministici (o presi da `corpus`:
+    query normalizzata -> risultati), latenza simulata, chiamate contate.
+    """
+
+    name = "fake"
+
+    def __init__(self, corpus=None, latency=0.0, fail=False):
+        self.corpus = corpus or {}
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    def search(self, query, max_results):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("provider finto offline")
+        key = normalize_query(query)
+        if key in self.corpus:
+            return self.corpus[key][:max_results]
+        slug = key.replace(" ", "-")
+        return [
+            {
+                "title": f"Risultato {i + 1}: {query}",
+                "href": f"https://example.invalid/{slug}/{i + 1}",
+                "body": f"Pagina di esempio numero {i + 1} su {query}.",
+            }
+            for i in range(max_results)
+        ]
+
+
+class BagOfWords:
+    """Embedder finto: conteggio di pochi termini, normalizzato."""
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.array(
+            [[t.lower().count(term) + 0.01 for term in TERMS] for t in texts],
+            dtype=np.float32,
+        )
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+
+class StubRag:
+    """Quanto WebSearch usa del RagEngine: embedder + vector store."""
+
+    embedding_size = len(TERMS)
+
+    def __init__(self, path):
+        self.model = BagOfWords()
+        self.store = NumpyStore(path)
+        self.embeds = 0
+
+    def embed(self, query):
+        self.embeds += 1
+        return self.model.encode(query)
+
+
+@pytest.fixture
+def provider():
+    return FakeSearchProvider()
+
+
+@pytest.fixture
+def web(tmp_path, provider):
+    web = WebSearch(provider, cache_dir=str(tmp_path / "cache"), ingest=True)
+    yield web
+    web.close()
+
+
+@pytest.fixture
+def rag(tmp_path):
+    return StubRag(str(tmp_path / "store"))
+
+
+def test_normalize_query():
+    assert normalize_query("  Git   REBASE?! ") == "git rebase"
+    assert normalize_query("C++ vs C#") == "c++ vs c#"
+    assert normalize_query("ｇｉｔ") == "git"
+
+
+def test_cache_hit_for_normalized_variants(web, provider):
+    first = web.search("Git rebase?")
+    second = web.search("  git   REBASE ")
+
+    assert second == first
+    assert provider.calls == 1
+    assert web.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_cache_entry_expires_after_ttl(tmp_path, provider):
+    web = WebSearch(provider, cache_dir=str(tmp_path / "cache"), ttl=0.2)
+    web.search("git rebase")
+    web.search("git rebase")
+    assert provider.calls == 1
+
+    time.sleep(0.3)
+    web.search("git rebase")
+    assert provider.calls == 2
+    web.close()
+
+
+def test_provider_failure_returns_nothing_and_is_not_cached(web, provider):
+    provider.fail = True
+    assert web.search("git rebase") == []
+
+    provider.fail = False
+    assert len(web.search("git rebase")) == 3
+    assert provider.calls == 2
+
+
+def test_recall_finds_ingested_results(web, rag):
+    assert web.attach(rag)
+    web.search("git rebase")
+    web.search("python list")
+
+    recalled = web.recall("come si fa un git rebase")
+    assert recalled
+    assert all(payload["query"] == "git rebase" for payload in recalled)
+    assert web.recall_text("come si fa un git rebase")[0].startswith("[Fonte Web:")
+
+
+def test_recall_uses_the_pipeline_vector(web, rag):
+    web.attach(rag)
+    web.search("git rebase")
+    embeds = rag.embeds
+
+    vector = rag.model.encode("git rebase")
+    assert web.recall("git rebase", vector=vector)
+    assert rag.embeds == embeds
+
+
+def test_recall_skips_expired_rows_and_purge_removes_them(tmp_path, provider, rag):
+    web = WebSearch(
+        provider, cache_dir=str(tmp_path / "cache"), ingest=True, memory_ttl=0.2
+    )
+    web.attach(rag)
+    web.search("git rebase")
+    assert len(list(rag.store.scroll(WEB_COLLECTION))) == 3
+
+    time.sleep(0.3)
+    assert web.recall("git rebase") == []
+
+    web._purge()
+    assert list(rag.store.scroll(WEB_COLLECTION)) == []
+    web.close()
+
+
+def test_attach_without_embedder_disables_memory(web, provider):
+    class NoModel:
+        model = None
+        store = None
+
+    assert not web.attach(NoModel())
+    web.search("git rebase")
+    assert web.recall("git rebase") == []
+
+
+def test_web_memory_source_gets_the_route_vector(web, rag):
+    from src.pipeline import ConversationPipeline, Turn, web_memory_source
+
+    class Engine:
+        router = object()  # Router attivo: la pipeline calcola il vettore
+
+        def route_query(self, query, vector=None, semantic=True):
+            return "light"
+
+        def build_prompt(self, model_type, history, query, sections=(), system=None):
+            return [], {}
+
+    web.attach(rag)
+    web.search("git rebase")
+    pipeline = ConversationPipeline(
+        Engine(), sources=[web_memory_source(web.recall_text)], embed=rag.embed
+    )
+    embeds = rag.embeds
+    turn = pipeline.prepare(Turn("git rebase", sources=("web_memory",)))
+    pipeline.close()
+
+    assert turn.results["web_memory"]
+    assert rag.embeds == embeds + 1  # Solo quello del router, riusato dal recall
+
+
+def test_results_are_remembered_through_the_given_encoder(web, rag):
+    batches = []
+
+    def encode(texts):
+        batches.append(len(texts))
+        return rag.model.encode(texts)
+
+    web.attach(rag, encode=encode)
+    web.search("git rebase")
+
+    assert batches == [3]  # Un solo batch per i risultati di una ricerca
+    assert web.recall("git rebase")
+
+
+def test_duckduckgo_searches_run_concurrently(monkeypatch):
+    clients = []
+
+    class DDGS:
+        def __init__(self, timeout):
+            clients.append(self)
+
+        def text(self, query, max_results):
+            time.sleep(0.2)
+            return [{"title": query, "href": "https://example.invalid", "body": ""}]
+
+    monkeypatch.setitem(sys.modules, "ddgs", types.SimpleNamespace(DDGS=DDGS))
+    provider = DuckDuckGoProvider()
+
+    threads = [
+        threading.Thread(target=provider.search, args=(f"domanda {i}", 3))
+        for i in range(3)
+    ]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.perf_counter() - t0 < 0.5  # In parallelo, non 3 x 0.2 s
+    assert len(clients) == 3  # Un client per thread
+    provider.search("di nuovo", 3)
+    assert len(clients) == 4  # Thread principale: client nuovo, poi riusato
+    provider.search("ancora", 3)
+    assert len(clients) == 4